@@ -33,7 +33,7 @@ def read(filename):
 #folder = os.path.join(folder, 'sindri')
 #paths = os.listdir(folder)
 
-requirements = []
+requirements = ['numpy']
 
 # distutils needed this cruft:
 #subpackages = [path for path in paths
@@ -6,6 +6,7 @@
 
     :dependencies:
         - ``Lantz`` `link <http://lantz.glugcen.dc.uba.ar/>`_
+        - ``NumPy`` `link <http://www.numpy.org/>`_
     :copyright: 2013 by Sindri Authors, see AUTHORS for more details.
     :license: LGPL, see LICENSE for more details.
 """ 
@@ -23,6 +23,7 @@
 
 from lantz import Feat, DictFeat, Q_, Action
 from sindri.mixins import IORateLimiterMixin, ErrorQueueInstrument
+from sindri.recorders import RingBuffer, PeriodicRecorder, RecorderHostMixin
 from lantz.network import TCPDriver
 from lantz.serial import SerialDriver
 from lantz.visa import SerialVisaDriver
@@ -43,6 +44,71 @@ def scrub_string_for_display(value):
     return _sanitized
 
 
+class MeasurementLogger(PeriodicRecorder):
+    """Background voltage/current logger for the E3631A output channels.
+    
+    Samples the selected outputs at a target rate, on its own thread, into a
+    fixed-size ``RingBuffer``. The buffer has one column per output and 
+    quantity, named ``<output>_<quantity>`` (e.g., ``P6V_voltage``), holding 
+    plain floats in Volts and Amps (NO ``Q_`` object is built per sample).
+    
+    Each sample holds the driver lock for the duration of the sample, so the 
+    instrument may be used concurrently from other threads.
+    
+    .. seealso: E3631A.start_measurement_logger
+    """
+    __QUERIES = {'voltage': 'MEAS:VOLT?', 'current': 'MEAS:CURR?'}
+    
+    __driver = None
+    __outputs = None
+    __message = None
+    
+    def __init__(self, driver, outputs, quantities=('voltage', 'current'), 
+                 rate=1.0, capacity=3600):
+        """Initialize the logger (it must then be started with ``start``).
+        
+        :param: driver
+        :type E3631A:
+        
+        :param: outputs
+        :type list:
+        :description: The output channels to sample, see ``E3631A.outputs``.
+        
+        :param: quantities
+        :type list:
+        :description: Any of ``voltage`` and ``current``.
+        
+        :param: rate
+        :type float:
+        :description: The target sampling rate (Hz), for ALL outputs.
+        
+        :param: capacity
+        :type int:
+        :description: The number of samples held in the ring buffer.
+        """
+        for quantity in quantities:
+            if quantity not in self.__QUERIES:
+                raise ValueError("'{0}' is not a measurable quantity.".format(quantity))
+        columns = ['{0}_{1}'.format(output, quantity) 
+                   for output in outputs for quantity in quantities]
+        super().__init__(RingBuffer(capacity, columns), rate, 
+                         name='{0}.measurement_logger'.format(driver.name))
+        self.__driver = driver
+        self.__outputs = tuple(outputs)
+        # all quantities for an output are measured with ONE compound query:
+        self.__message = ';:'.join(self.__QUERIES[q] for q in quantities)
+    
+    def _sample(self):
+        values = []
+        with self.__driver._lock:
+            for output in self.__outputs:
+                if output:
+                    self.__driver.selected_instrument = output
+                response = self.__driver.query(self.__message)
+                values.extend(float(v) for v in response.split(';'))
+        return values
+
+
 class IEEE4882SubsetMixin(object):
     """IEEE 488.2 Command subset
     """
@@ -204,7 +270,7 @@ class IEEE4882SubsetMixin(object):
         self.send("*SAV {}".format(location))
 
 
-class E3631A(object):
+class E3631A(RecorderHostMixin):
     """HP/Agilent E3631A Triple Output DC Power Supply
     
     Example Usage:
@@ -282,6 +348,17 @@ class E3631A(object):
         
     
     
+    Background Measurement Logging
+    ==============================
+    ::
+        ...
+        >>>logger = inst.start_measurement_logger(['P6V', 'P25V'], rate=2.0)
+        >>>logger.snapshot()  # never waits on the instrument
+        {'timestamp': array([...]), 'P6V_voltage': array([...]), ...}
+        >>>logger.snapshot(count=600, decimation=10)  # 1 of 10, last 600
+        >>>inst.measure_voltage('N25V')  # still usable, shares the link
+        >>>inst.stop_measurement_logger()
+    
     **NOTE**: In the above examples, if an error occurred and is dequeued, it will
     be raised as an ``InstrumentError``.
     
@@ -294,6 +371,7 @@ class E3631A(object):
     __TRIGGER_SOURCES = {'immediate': 'IMM', 'bus': 'BUS'}
     # in the following list, the zeroeth element MUST be the ``default`` key!
     __SOURCES = {'': None, 'P6V': 'P6V', 'P25V': 'P25V', 'N25V': 'N25V'}  # default, +6V, +25V, -25V
+
         
     def initialize(self, *args, init_input_mode='remote', **kwargs):  
         try:        
@@ -677,6 +755,42 @@ class E3631A(object):
         """
         self.send('DISP:WIND:TEXT:CLE')
 
+    @property
+    def measurement_logger(self):
+        """The running background measurement logger (or ``None``).
+        
+        .. seealso: start_measurement_logger
+        """
+        return self._recorder('measurement_logger')
+    
+    def start_measurement_logger(self, outputs=('P6V', 'P25V', 'N25V'), 
+                                 quantities=('voltage', 'current'),
+                                 rate=1.0, capacity=3600):
+        """Start sampling output measurements in the background.
+        
+        Any running logger is stopped first. The samples are read from the
+        logger's ring buffer with ``snapshot``, which does not block on the 
+        instrument.
+        
+        :returns: The started logger.
+        :type MeasurementLogger:
+        
+        .. seealso: MeasurementLogger, RecorderHostMixin
+        """
+        for output in outputs:
+            if output not in self.__SOURCES:
+                raise ValueError("'{0}' is not a valid output.".format(output))
+        logger = MeasurementLogger(self, outputs, quantities=quantities, 
+                                   rate=rate, capacity=capacity)
+        return self._start_recorder('measurement_logger', logger)
+    
+    def stop_measurement_logger(self, timeout=None):
+        """Stop the background measurement logger, if running.
+        
+        The stopped logger (and its samples) is returned, or ``None``.
+        """
+        return self._stop_recorder('measurement_logger', timeout)
+
     def finalize(self, *args, **kwargs):
         try:
             # return the front panel to user control
@@ -20,14 +20,24 @@
     
 """
 
+import csv
+import os
 import struct
-from copy import deepcopy
+import threading
+from collections import namedtuple, OrderedDict
+from time import time
+
+import numpy as np
 from lantz import Feat, DictFeat, Q_, Action
 from sindri.mixins import IORateLimiterMixin, ErrorQueueInstrument
+from sindri.recorders import (RingBuffer, PeriodicRecorder, RunningStatistics,
+                              RecorderHostMixin)
 from lantz.network import TCPDriver
 from lantz.errors import InstrumentError
 from sindri.errors import UnexpectedResponseFormatError
-from sindri.ieee4882.arbitrary_block import read_definite_length_block
+from sindri.ieee4882.arbitrary_block import (read_definite_length_block,
+    read_definite_length_block_into, driver_message_reader,
+    split_response_units, DefiniteLengthBlock)
 from ..common import ErrorQueueImplementation
 from ...mixins import Verifiable
 
@@ -189,11 +199,13 @@ class IEEE4882SubsetMixin(object):
 
 class ValidityState(object):
     """An Infiniium 90000 Series oscilloscope measurement validity state.
+
+    There are only 47 validity states, so instances are interned: a
+    ``ValidityState(code)`` is looked up, not built, and states may be
+    compared by identity. Instances are immutable.
     """
-    __code = None
-    __valid = False
-    __description = None
-    
+    __slots__ = ('__code', '__valid', '__description')
+
     validity_code_descriptions = (
         {0: 'Result correct. No problem found.',
          1: 'Result questionable but could be measured.',
@@ -201,147 +213,812 @@ class ValidityState(object):
          3: 'Result greater than or equal to value returned.',
          4: 'Result returned is invalid.',
          17: 'Result invalid. Completion criteria not reached.'} )
-    
-    def __init__(self, code):
-        """Initialize the result validity state instance.
-        
+
+    __instances = {}  # code -> ValidityState
+
+    def __new__(cls, code):
+        """Get the result validity state instance of a code.
+
         The code given should be the integer code returned as the validity
         state of a given measurement from the instrument.
-        
+
         :param: code
         :type int:
         """
+        try:
+            return cls.__instances[code]
+        except KeyError:
+            pass
         if not (0 <= code <= 46):
             raise ValueError('Validity state code must be in [0, 46].')
-            
+        code = int(code)
+        self = super().__new__(cls)
         self.__code = code
-        if self.__code < 4:
-            self.__valid = True
-        
-        desc_index = code if code in self.validity_code_descriptions else 4    
-        self.__description = self.validity_code_descriptions[desc_index]
-        
+        self.__valid = code < 4
+        desc_index = code if code in cls.validity_code_descriptions else 4
+        self.__description = cls.validity_code_descriptions[desc_index]
+        return cls.__instances.setdefault(code, self)
+
+    def __reduce__(self):
+        return (ValidityState, (self.__code,))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return 'ValidityState({0})'.format(self.__code)
+
     @property
     def code(self):
-        return deepcopy(self.__code)
-        
+        return self.__code
+
     @property
     def is_valid(self):
-        return deepcopy(self.__valid)
-        
+        return self.__valid
+
     @property
     def description(self):
-        return deepcopy(self.__description)
+        return self.__description
 
 
 class MeasurementResult(Verifiable):
     """An Infiniium 90000 Series oscilloscope measurement result.
+
+    Instances are immutable; the checksum is computed when first asked for.
+
+    .. seealso: MeasurementResultBatch, for many results.
     """
-    __label = None
-    __current = None
-    __max = None
-    __min = None
-    __mean = None
-    __stddev = None
-    __meas_count = None
-    __range = None
-    
-    __validity_state = None
-    __valid = None  # tri-state validity, because it is possible to not know.
-    
+    __slots__ = ('__label', '__current', '__max', '__min', '__mean',
+                 '__stddev', '__meas_count', '__range', '__validity_state',
+                 '__utc_stamp', '__checksum')
+
     def __init__(self, label, results):
         """Initialize the measurement result instance.
 
         The label should probably be a string, but can be any type which
         supports encoding to bytes.
-        
+
         The result should be the measurement statistics, validity state, etc.
 
         :param: label
         :type str:
-        
+
         :param: results
         :type dict:
         """
-        super().__init__()
-        chksum_data = b'#'  # sort of a ``salt``
+        get = results.get
         self.__utc_stamp = self.generate_timestamp()
-        
         self.__label = label
-        chksum_data += label.encode()
-        
-        if 'current' in results:
-            self.__current = float(results['current'])
-            chksum_data += struct.pack('!f', self.__current)
-        if 'maximum' in results:
-            self.__max = float(results['maximum'])
-            chksum_data += struct.pack('!f', self.__max)
-        if 'minimum' in results:
-            self.__min = float(results['minimum'])
-            chksum_data += struct.pack('!f', self.__min)
-        if 'mean' in results:
-            self.__mean = float(results['mean'])
-            chksum_data += struct.pack('!f', self.__mean)
-        if 'standard deviation' in results:
-            self.__stddev = float(results['standard deviation'])
-            chksum_data += struct.pack('!f', self.__stddev)
-        if 'measurement count' in results:
-            self.__meas_count = float(results['measurement count'])
-            chksum_data += struct.pack('!f', self.__meas_count)
-        if 'validity state' in results:
-            self.__validity_state = ValidityState(int(results['validity state']))
-            self.__valid = self.__validity_state.is_valid
-            chksum_data += struct.pack('!?', self.__valid)
+        self.__current = float(get('current')) if 'current' in results else None
+        self.__max = float(get('maximum')) if 'maximum' in results else None
+        self.__min = float(get('minimum')) if 'minimum' in results else None
+        self.__mean = float(get('mean')) if 'mean' in results else None
+        self.__stddev = (float(get('standard deviation'))
+                         if 'standard deviation' in results else None)
+        self.__meas_count = (float(get('measurement count'))
+                             if 'measurement count' in results else None)
+        self.__validity_state = (ValidityState(int(get('validity state')))
+                                 if 'validity state' in results else None)
         # range is computed value:
         if (self.__max is not None) and (self.__min is not None):
             self.__range = (self.__max - self.__min)
-            chksum_data += struct.pack('!f', self.__range)
-                        
-        self.__checksum = self.compute_checksum(chksum_data)
-        
+        else:
+            self.__range = None
+        self.__checksum = None
+
+    @property
+    def utc_stamp(self):
+        return self.__utc_stamp
+
+    @property
+    def checksum(self):
+        if self.__checksum is None:
+            chksum_data = b'#'  # sort of a ``salt``
+            chksum_data += self.__label.encode()
+            for value in (self.__current, self.__max, self.__min, self.__mean,
+                          self.__stddev, self.__meas_count):
+                if value is not None:
+                    chksum_data += struct.pack('!f', value)
+            if self.__validity_state is not None:
+                chksum_data += struct.pack('!?', self.__validity_state.is_valid)
+            if self.__range is not None:
+                chksum_data += struct.pack('!f', self.__range)
+            self.__checksum = self.compute_checksum(chksum_data)
+        return self.__checksum
+
     @property
     def label(self):
-        return deepcopy(self.__label)
-    
+        return self.__label
+
     @property
     def current(self):
-        return deepcopy(self.__current)
-        
+        return self.__current
+
     @property
     def max(self):
-        return deepcopy(self.__max)
-        
+        return self.__max
+
     @property
     def min(self):
-        return deepcopy(self.__min)
-        
+        return self.__min
+
     @property
     def mean(self):
-        return deepcopy(self.__mean)
-        
+        return self.__mean
+
     @property
     def standard_deviation(self):
-        return deepcopy(self.__stddev)
-        
+        return self.__stddev
+
     @property
     def measurement_count(self):
-        return deepcopy(self.__meas_count)
-        
+        return self.__meas_count
+
     @property
     def range(self):
-        return deepcopy(self.__range)
-        
+        return self.__range
+
+    @property
+    def validity_state(self):
+        return self.__validity_state
+
     @property
     def is_valid(self):
-        return deepcopy(self.__valid)
+        """Tri-state validity: ``None`` if the validity state is not known.
+        """
+        if self.__validity_state is None:
+            return None
+        return self.__validity_state.is_valid
+
+
+class MeasurementRow(namedtuple('MeasurementRow', ('timestamp', 'label',
+        'current', 'minimum', 'maximum', 'mean', 'standard_deviation',
+        'measurement_count', 'validity_code'))):
+    """One row of a ``MeasurementResultBatch`` (statistics which were not
+    returned are NaN).
+    """
+    __slots__ = ()
+
+    @property
+    def validity_state(self):
+        return ValidityState(self.validity_code)
+
+    @property
+    def is_valid(self):
+        return self.validity_code < 4
+
+
+class MeasurementResultBatch(object):
+    """Infiniium 90000 Series measurement results (``:MEAS:RES?``), as NumPy
+    columns.
+
+    Results are appended, poll after poll, into preallocated columns (which
+    double in size when full), so logging many statistics allocates no
+    objects per result. Rows are built only on demand.
+
+    Example:
+        >>> batch = MeasurementResultBatch()
+        >>> inst.displayed_results_batch(batch)  # appends one poll
+        >>> batch.mean[batch.label == 'V p-p(1)']
+        >>> batch[-1].is_valid
+    """
+    #: The numeric columns (``:MEAS:RES?`` statistic names, in row order).
+    STATISTICS = ('current', 'minimum', 'maximum', 'mean',
+                  'standard_deviation', 'measurement_count')
+    # position of each field in a ``:MEAS:RES?`` result, for ``all``:
+    # <label>, <current>, <state>, <min>, <max>, <mean>, <stddev>, <#ofmeas>
+    __ALL_FIELDS = (1, 3, 4, 5, 6, 7)
+    __STATISTIC_COLUMNS = {'current': 0, 'minimum': 1, 'maximum': 2,
+                           'mean': 3, 'standard deviation': 4}
+
+    __length = 0
+    __timestamps = None
+    __label_codes = None
+    __statistics = None  # 2D: row, statistic
+    __validity = None
+    __labels = None  # label code -> label
+    __label_index = None  # label -> label code
+
+    def __init__(self, capacity=256):
+        """Initialize an (empty) batch.
+
+        :param: capacity
+        :type int:
+        :description: The number of rows to allocate up front.
+        """
+        capacity = max(int(capacity), 1)
+        self.__timestamps = np.empty(capacity, dtype='f8')
+        self.__label_codes = np.empty(capacity, dtype='i4')
+        self.__statistics = np.empty((capacity, len(self.STATISTICS)), dtype='f8')
+        self.__validity = np.empty(capacity, dtype='i1')
+        self.__labels = []
+        self.__label_index = {}
+
+    def __len__(self):
+        return self.__length
+
+    @property
+    def capacity(self):
+        return len(self.__timestamps)
+
+    def __reserve(self, count):
+        needed = self.__length + count
+        capacity = self.capacity
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        length = self.__length
+
+        def grow(old):
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:length] = old[:length]
+            return new
+
+        self.__timestamps = grow(self.__timestamps)
+        self.__label_codes = grow(self.__label_codes)
+        self.__statistics = grow(self.__statistics)
+        self.__validity = grow(self.__validity)
+
+    def __label_code(self, label):
+        code = self.__label_index.get(label)
+        if code is None:
+            code = self.__label_index[label] = len(self.__labels)
+            self.__labels.append(label)
+        return code
+
+    def append_response(self, response, statistic='all', timestamp=None):
+        """Parse a ``:MEAS:RES?`` response (with result codes), and append
+        its results.
+
+        :param: statistic
+        :type str:
+        :description: The selected measurement statistic when the response
+        was given (see ``Infiniium90000.selected_measurement_statistic``).
+        Only ``all`` gives labels; otherwise the label is the statistic name.
+
+        :param: timestamp
+        :type float:
+        :description: POSIX time (seconds) of the poll; default: now.
+
+        :returns: The number of results appended.
+        """
+        if timestamp is None:
+            timestamp = time()
+        fields = response.strip().split(',') if response.strip() else []
+        width = 8 if statistic == 'all' else 2
+        if len(fields) % width:
+            raise UnexpectedResponseFormatError(
+                'Expected {0} fields per measurement result, got {1} '
+                'fields.'.format(width, len(fields)))
+        count = len(fields) // width
+        if not count:
+            return 0
+        table = np.array(fields).reshape(count, width)
+        self.__reserve(count)
+        rows = slice(self.__length, self.__length + count)
+        self.__timestamps[rows] = timestamp
+        if statistic == 'all':
+            self.__label_codes[rows] = [self.__label_code(label)
+                                        for label in table[:, 0].tolist()]
+            self.__statistics[rows] = table[:, self.__ALL_FIELDS].astype('f8')
+            self.__validity[rows] = table[:, 2].astype('i1')
+        else:
+            self.__label_codes[rows] = self.__label_code(statistic)
+            self.__statistics[rows] = np.nan
+            self.__statistics[rows, self.__STATISTIC_COLUMNS[statistic]] = \
+                table[:, 0].astype('f8')
+            self.__validity[rows] = table[:, 1].astype('i1')
+        self.__length += count
+        return count
+
+    def clear(self):
+        """Forget the results (the memory is kept, for reuse).
+        """
+        self.__length = 0
+
+    @property
+    def labels(self):
+        """The distinct labels, indexed by ``label_code``.
+        """
+        return tuple(self.__labels)
+
+    @property
+    def timestamp(self):
+        return self.__timestamps[:self.__length]
+
+    @property
+    def label_code(self):
+        return self.__label_codes[:self.__length]
+
+    @property
+    def label(self):
+        """The label of each result (built on demand; prefer ``label_code``
+        for filtering many rows).
+        """
+        return np.array(self.__labels, dtype=object)[self.label_code]
+
+    @property
+    def validity_code(self):
+        return self.__validity[:self.__length]
+
+    @property
+    def is_valid(self):
+        return self.validity_code < 4
+
+    def column(self, name):
+        """A column, by name (a view; valid until the next append).
+        """
+        if name in self.STATISTICS:
+            return self.__statistics[:self.__length, self.STATISTICS.index(name)]
+        if name in ('timestamp', 'label_code', 'label', 'validity_code'):
+            return getattr(self, name)
+        raise KeyError(name)
+
+    current = property(lambda self: self.column('current'))
+    minimum = property(lambda self: self.column('minimum'))
+    maximum = property(lambda self: self.column('maximum'))
+    mean = property(lambda self: self.column('mean'))
+    standard_deviation = property(lambda self: self.column('standard_deviation'))
+    measurement_count = property(lambda self: self.column('measurement_count'))
+
+    def __getitem__(self, index):
+        """One row, as a ``MeasurementRow``.
+        """
+        if not -self.__length <= index < self.__length:
+            raise IndexError('Measurement result index out of range.')
+        index %= self.__length
+        return MeasurementRow(float(self.__timestamps[index]),
+                              self.__labels[self.__label_codes[index]],
+                              *(self.__statistics[index].tolist() +
+                                [int(self.__validity[index])]))
+
+    def __iter__(self):
+        for index in range(self.__length):
+            yield self[index]
+
+
+class WaveformPreamble(namedtuple('WaveformPreamble', ('format', 'type',
+        'points', 'count', 'x_increment', 'x_origin', 'x_reference',
+        'y_increment', 'y_origin', 'y_reference', 'coupling',
+        'x_display_range', 'x_display_origin', 'y_display_range',
+        'y_display_origin', 'date', 'time', 'frame_model', 'acquisition_mode',
+        'completion', 'x_units', 'y_units', 'max_bandwidth_limit',
+        'min_bandwidth_limit'))):
+    """An Infiniium 90000 Series waveform preamble (``:WAV:PRE?``).
+
+    The scaling is (vectorized):
+        - voltage = data value * y_increment + y_origin
+        - time = (data point number - x_reference) * x_increment + x_origin
+    """
+    __slots__ = ()
+
+    # field index -> type, for the numeric fields:
+    __TYPES = dict([(0, int), (1, int), (2, int), (3, int), (10, int),
+                    (19, int)] + [(i, float) for i in (4, 5, 6, 7, 8, 9, 11,
+                                                       12, 13, 14, 22, 23)])
+
+    @classmethod
+    def parse(cls, response):
+        """Parse a ``:WAV:PRE?`` response (missing trailing fields are None).
+        """
+        fields = next(csv.reader([response.strip()]))
+        if len(fields) < 10:
+            raise UnexpectedResponseFormatError(
+                'Expected a waveform preamble, got {0!r}.'.format(response))
+        fields = fields[:len(cls._fields)]
+        fields += [None] * (len(cls._fields) - len(fields))
+        values = []
+        try:
+            for index, field in enumerate(fields):
+                convert = cls.__TYPES.get(index)
+                if (convert is None) or (field is None):
+                    values.append(field)
+                elif not field.strip():
+                    values.append(None)
+                else:
+                    values.append(convert(float(field)))
+            return cls._make(values)
+        except ValueError:
+            raise UnexpectedResponseFormatError(
+                'Invalid waveform preamble {0!r}.'.format(response))
+
+    def volts(self, data, out=None):
+        """Scale raw data values to volts (or the ``y_units``).
+
+        :param: out
+        :type ndarray:
+        :description: Where to put the result (float), to avoid allocating.
+        """
+        out = np.multiply(data, self.y_increment, out=out,
+                          dtype=None if out is not None else 'f8')
+        out += self.y_origin
+        return out
+
+    def times(self, points=None, out=None):
+        """The sample times, in seconds (or the ``x_units``).
+        """
+        points = self.points if points is None else points
+        out = np.subtract(np.arange(points, dtype='f8'), self.x_reference, out=out)
+        out *= self.x_increment
+        out += self.x_origin
+        return out
+
+
+class Waveform(object):
+    """A waveform as transferred (raw data values) with its preamble.
+
+    ``raw`` is a view of the received message (no copy is made).
+    """
+    __slots__ = ('__source', '__preamble', '__raw')
+
+    def __init__(self, source, preamble, raw):
+        self.__source = source
+        self.__preamble = preamble
+        self.__raw = raw
+
+    def __len__(self):
+        return len(self.__raw)
+
+    @property
+    def source(self):
+        return self.__source
+
+    @property
+    def preamble(self):
+        return self.__preamble
+
+    @property
+    def raw(self):
+        return self.__raw
+
+    def volts(self, out=None):
+        return self.__preamble.volts(self.__raw, out=out)
+
+    def times(self, out=None):
+        return self.__preamble.times(len(self.__raw), out=out)
+
+
+class MeasurementStatisticsAccumulator(PeriodicRecorder):
+    """Background accumulator of Infiniium measurement statistics.
+
+    Polls the displayed measurement results (one round trip per poll, see
+    ``Infiniium90000.displayed_results_batch``) at a target rate, and keeps
+    ``RunningStatistics`` of the ``current`` value of each measurement, by
+    label, on the host: so the statistics of a long soak test need no
+    statistics reset on the scope, and memory does not grow.
+
+    A value is only accumulated when the scope has made a new measurement
+    (its measurement count changed) and, by default, when it is valid. The
+    measurement count is only given with the ``all`` measurement statistic,
+    which ``Infiniium90000.start_statistics_accumulator`` selects; results
+    without a count (the statistic was changed afterwards) are skipped.
+
+    The ring buffer records, per poll, the number of results and the number
+    of values accumulated.
+
+    .. seealso: Infiniium90000.start_statistics_accumulator
+    """
+    __driver = None
+    __window = None
+    __bins = None
+    __ranges = None
+    __only_valid = True
+    __batch = None
+    __statistics = None  # key -> RunningStatistics
+    __last_counts = None  # key -> measurement count of the last value
+    __lock = None
+
+    def __init__(self, driver, rate=1.0, window=1000, bins=64,
+                 histogram_ranges=None, only_valid=True, capacity=3600):
+        """Initialize the accumulator (it must then be started with ``start``).
+
+        :param: window
+        :type int:
+        :description: The number of latest values per measurement, for the
+        windowed statistics (None: no window).
+
+        :param: bins
+        :type int:
+        :description: The number of histogram bins.
+
+        :param: histogram_ranges
+        :type dict:
+        :description: ``(low, high)`` per measurement label; measurements
+        without a range get no histogram.
+
+        :param: capacity
+        :type int:
+        :description: The number of polls held in the ring buffer.
+        """
+        super().__init__(RingBuffer(capacity, ['results', 'accumulated']), rate,
+                         name='{0}.statistics_accumulator'.format(driver.name))
+        self.__driver = driver
+        self.__window = window
+        self.__bins = bins
+        self.__ranges = dict(histogram_ranges or {})
+        self.__only_valid = only_valid
+        self.__batch = MeasurementResultBatch(capacity=16)
+        self.__statistics = OrderedDict()
+        self.__last_counts = {}
+        self.__lock = threading.Lock()
+
+    def _sample(self):
+        batch = self.__batch
+        batch.clear()  # (the memory is reused, poll after poll)
+        self.__driver.displayed_results_batch(batch)
+        return batch
+
+    def _record(self, timestamp, batch):
+        labels = [batch.labels[code] for code in batch.label_code.tolist()]
+        accumulated = 0
+        with self.__lock:
+            for index, (label, current, count, valid) in enumerate(zip(
+                    labels, batch.current.tolist(),
+                    batch.measurement_count.tolist(), batch.is_valid.tolist())):
+                if count != count:
+                    continue  # (NaN) not ``all`` statistics: new or not?
+                # duplicate labels (e.g. the same measurement on 2 sources):
+                key = label if labels.count(label) == 1 else '{0}[{1}]'.format(
+                    label, labels[:index].count(label))
+                if self.__last_counts.get(key) == count:
+                    continue  # no new measurement
+                self.__last_counts[key] = count
+                if (self.__only_valid and not valid) or (current != current):
+                    continue
+                statistics = self.__statistics.get(key)
+                if statistics is None:
+                    statistics = self.__new_statistics(label)
+                    self.__statistics[key] = statistics
+                statistics.add(current)
+                accumulated += 1
+        super()._record(timestamp, (len(batch), accumulated))
+
+    def __new_statistics(self, label):
+        value_range = self.__ranges.get(label)
+        return RunningStatistics(window=self.__window,
+                                 bins=self.__bins if value_range else None,
+                                 range=value_range)
+
+    @property
+    def labels(self):
+        """The measurements (keys) with accumulated statistics.
+        """
+        with self.__lock:
+            return list(self.__statistics.keys())
+
+    def statistics(self, label=None):
+        """The statistics of one measurement (or of all, keyed by label).
+
+        Each is a dict: ``count``, ``mean``, ``standard_deviation``, ``min``
+        and ``max`` since the last reset, plus ``window`` (the same, over
+        the latest values) and ``histogram`` (see ``RunningStatistics``).
+        """
+        with self.__lock:
+            if label is not None:
+                return self.__summary(self.__statistics[label])
+            return OrderedDict((key, self.__summary(statistics))
+                               for (key, statistics) in self.__statistics.items())
+
+    @staticmethod
+    def __summary(statistics):
+        summary = statistics.summary()
+        summary['window'] = statistics.window_summary()
+        summary['histogram'] = statistics.histogram
+        return summary
+
+    def reset(self, label=None):
+        """Restart the statistics of one measurement (or of all).
+        """
+        with self.__lock:
+            for key, statistics in self.__statistics.items():
+                if (label is None) or (key == label):
+                    statistics.reset()
+
+
+#: The waveforms of a segmented acquisition: ``data`` holds one row per
+#: segment (raw data values), and ``timestamps`` the time tag (seconds) of
+#: each segment, relative to the first.
+Segments = namedtuple('Segments', ('source', 'preamble', 'data', 'timestamps'))
+
+
+class SetupLibrary(object):
+    """A library of named instrument setups (``:SYST:SET?`` blocks).
+
+    The setups are stored by checksum (a setup saved under many names is kept
+    once), so that the setup of an instrument can be compared without
+    comparing the blocks.
+
+    A library may be saved to, and loaded from, a directory of ``<name>.set``
+    files (the raw blocks).
+
+    .. seealso: Infiniium90000.restore_setup
+    """
+    #: The file name extension of saved setups.
+    EXTENSION = '.set'
+
+    __setups = None  # checksum -> DefiniteLengthBlock
+    __names = None  # name -> checksum
+
+    def __init__(self):
+        self.__setups = {}
+        self.__names = OrderedDict()
+
+    def __len__(self):
+        return len(self.__names)
+
+    def __contains__(self, name):
+        return name in self.__names
+
+    def __getitem__(self, name):
+        return self.__setups[self.__names[name]]
+
+    @property
+    def names(self):
+        return list(self.__names.keys())
+
+    def checksum(self, name):
+        """The checksum of a setup, by name.
+        """
+        return self.__names[name]
 
+    def name_of(self, checksum):
+        """The names under which a setup (checksum) is saved.
+        """
+        return [name for (name, value) in self.__names.items() if value == checksum]
+
+    def add(self, name, setup):
+        """Save a setup (replacing any setup of the same name).
+
+        :param: setup
+        :type DefiniteLengthBlock or bytes:
+        :description: A setup, as returned by ``get_system_setup_binary``, or
+        a raw block.
+
+        :returns: The checksum of the setup.
+        :type bytes:
+        """
+        if not isinstance(setup, DefiniteLengthBlock):
+            setup = DefiniteLengthBlock(block=bytes(setup), block_id={'name': name})
+        checksum = setup.checksum
+        self.__setups.setdefault(checksum, setup)
+        self.remove(name)
+        self.__names[name] = checksum
+        return checksum
+
+    def remove(self, name):
+        checksum = self.__names.pop(name, None)
+        if (checksum is not None) and (checksum not in self.__names.values()):
+            del self.__setups[checksum]
+
+    def save(self, directory):
+        """Write each setup to ``<directory>/<name>.set``.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in self.__names:
+            with open(os.path.join(directory, name + self.EXTENSION), 'wb') as f:
+                f.write(self[name].raw)
+
+    @classmethod
+    def load(cls, directory):
+        """A library of the ``<name>.set`` files of a directory.
+        """
+        library = cls()
+        for filename in sorted(os.listdir(directory)):
+            name, extension = os.path.splitext(filename)
+            if extension == cls.EXTENSION:
+                with open(os.path.join(directory, filename), 'rb') as f:
+                    library.add(name, f.read())
+        return library
 
-class Infiniium90000(object):
+
+class Infiniium90000(RecorderHostMixin):
     """Agilent Infiniium 90000 Series Universal Features
+
+    Measurement polling
+    ===================
+    The result-code mode (``:MEAS:SEND``) and the statistic selection
+    (``:MEAS:STAT``) are tracked on the host, so ``displayed_results`` is ONE
+    round trip: ``:MEAS:RES?`` alone when both are known, and otherwise a
+    single message which also fetches whatever is unknown:
+    ::
+        ...
+        >>>inst.displayed_results  # sends ``:MEAS:SEND?;:MEAS:STAT?;...``
+        >>>inst.displayed_results  # sends ``:MEAS:RES?``
+        >>>inst.invalidate_measurement_state()  # after a front panel change, etc.
+
+    Waveforms
+    =========
+    Waveforms are transferred as 16 bit words (``:WAV:FORM WORD``,
+    ``:WAV:BYT LSBF``), into NumPy views of the received message. The
+    preamble of each source is read once, and cached:
+    ::
+        ...
+        >>>ch1, ch2 = inst.fetch_waveforms([1, 2])  # ONE message, ONE response
+        >>>ch1.volts(), ch1.times()
+        >>>inst.invalidate_waveform_cache()  # after a scale/timebase change
+
+    Segmented memory
+    ================
+    A burst of triggers is captured into segments, then streamed straight
+    into ONE preallocated array (or memory-mapped file), with no Python
+    object per segment:
+    ::
+        ...
+        >>>inst.acquire_segments(10000, timeout=60)  # blocks; no polling
+        >>>segments = inst.fetch_segments(1, filename='burst.i2')
+        >>>segments.data.shape, segments.timestamps[-1]
+        ((10000, 1024), 0.0123)
+
+    Setups
+    ======
+    The checksum of the instrument setup is tracked on the host (it is known
+    after a setup is read or restored, and forgotten on any command which
+    may change it), so a setup is only uploaded when it differs:
+    ::
+        ...
+        >>>library = SetupLibrary.load('recipes')
+        >>>inst.restore_setup(library['eye_25G'])  # uploads: True
+        >>>inst.restore_setup(library['eye_25G'])  # already active: False
+        >>>inst.invalidate_setup_cache()  # after a front panel change, etc.
+
+    The comparison assumes that the instrument returns the same setup block
+    for the same state.
     """
     __MEAS_STATS = {'all': 'ON', 'current': 'CURR', 'maximum': 'MAX',
                     'minimum': 'MIN', 'mean': 'MEAN',
                     'standard deviation': 'STDD'}
+    __MEAS_STAT_NAMES = dict(zip(__MEAS_STATS.values(), __MEAS_STATS.keys()))
+
+    # host-side measurement state, None := unknown:
+    __result_codes_enabled = None  # :MEAS:SEND
+    __statistic = None  # :MEAS:STAT, as the instrument code (e.g. ``CURR``)
+
+    #: The dtype of the waveform data values (``:WAV:FORM WORD;BYT LSBF``).
+    WAVEFORM_DTYPE = np.dtype('<i2')
+    # host-side waveform state:
+    __waveform_format_set = False
+    __waveform_source = None  # None := unknown
+    __preambles = None  # source -> WaveformPreamble
+
+    __setup_checksum = None  # of the active setup; None := unknown
+
+    @Action()
+    def reset(self):
+        """Set the instrument functions to the factory default power up state.
+        """
+        self.invalidate_measurement_state()
+        self.invalidate_waveform_cache()
+        self.invalidate_setup_cache()
+        super().reset()
+
+    @Action()
+    def recall_state(self, location):
+        """Recalls (*RCL) instrument state in specified non-volatile location.
+
+        :param location: non-volatile storage location.
+        """
+        self.invalidate_measurement_state()
+        self.invalidate_waveform_cache()
+        self.invalidate_setup_cache()
+        super().recall_state(location)
+
+    def invalidate_measurement_state(self):
+        """Forget the host-side result-code mode and statistic selection.
+
+        The next ``displayed_results`` will query them (in the same message).
+        Use this if they may have been changed behind the driver's back
+        (front panel, another controller, etc.).
+        """
+        self.__result_codes_enabled = None
+        self.__statistic = None
+
+    def __cache_statistic(self, code):
+        code = code.strip().upper()
+        self.__statistic = code if code in self.__MEAS_STAT_NAMES else None
 
     @property
     def measurement_statistics(self):
@@ -370,11 +1047,14 @@ class Infiniium90000(object):
             - ``mean`` := ONLY the mean value
             - ``standard deviation`` := ONLY the standard deviation
         """
-        return self.query(":MEAS:STAT?")
-        
+        value = self.query(":MEAS:STAT?")
+        self.__cache_statistic(value)
+        return value
+
     @selected_measurement_statistic.setter
     def selected_measurement_statistic(self, value):
         self.send(":MEAS:STAT {0}".format(value))
+        self.__cache_statistic(value)
     
     @Feat(values={True: 1, False: 0})
     def _include_measurement_result_code(self):
@@ -383,23 +1063,69 @@ class Infiniium90000(object):
         **NOTE:**
         This should really only be used by developers and hackers.
         """
-        return int(self.query(":MEAS:SEND?"))
-        
+        value = int(self.query(":MEAS:SEND?"))
+        self.__result_codes_enabled = bool(value)
+        return value
+
     @_include_measurement_result_code.setter
     def _include_measurement_result_code(self, value):
         self.send(":MEAS:SEND {0}".format(value))
-    
+        self.__result_codes_enabled = bool(value)
+
+    def _query_displayed_results(self):
+        """Query ``:MEAS:RES?`` (with result codes), in ONE round trip.
+
+        Unknown host-side state is queried in the same message; the
+        result-code mode is turned on for the query, and restored after it.
+
+        :returns: ``(statistic, results)``, the selected statistic (e.g.
+        ``all``) and the raw ``:MEAS:RES?`` response.
+        """
+        with self._lock:
+            enabled, statistic = self.__result_codes_enabled, self.__statistic
+            commands = []
+            if enabled is None:
+                commands.append(":MEAS:SEND?")
+            if statistic is None:
+                commands.append(":MEAS:STAT?")
+            if not enabled:
+                commands.append(":MEAS:SEND 1")  # we NEED the state code.
+            commands.append(":MEAS:RES?")
+            if enabled is False:
+                commands.append(":MEAS:SEND 0")
+            responses = self.query(';'.join(commands)).split(';')
+            if len(responses) != 1 + (enabled is None) + (statistic is None):
+                self.invalidate_measurement_state()
+                raise UnexpectedResponseFormatError(
+                    'Unexpected response to {0!r}.'.format(';'.join(commands)))
+            if enabled is None:
+                enabled = bool(int(responses.pop(0)))
+                self.__result_codes_enabled = enabled
+                type(self)._include_measurement_result_code.set_cache(self, enabled)
+                if not enabled:
+                    self.send(":MEAS:SEND 0")
+            if statistic is None:
+                self.__cache_statistic(responses.pop(0))
+                statistic = self.__statistic
+                if statistic is None:
+                    raise UnexpectedResponseFormatError(
+                        'Unknown measurement statistic.')
+                type(self).selected_measurement_statistic.set_cache(
+                    self, self.__MEAS_STAT_NAMES[statistic])
+            return self.__MEAS_STAT_NAMES[statistic], responses[0]
+
     @Feat()
     def displayed_results(self):
+        """The results of the displayed measurements, with their validity states.
+
+        A list of dicts (one per measurement) when a single statistic is
+        selected, or a dict of dicts keyed by measurement label for ``all``.
+
+        .. seealso: selected_measurement_statistic
         """
-        """
-        orig_include_rescode = self._include_measurement_result_code
-        self._include_measurement_result_code = True  # we NEED the state code.
-        
-        results = self.query(":MEAS:RES?")
+        meas_stat, results = self._query_displayed_results()
         results_list = results.split(',')
         # interpret the results based on the selected stats:
-        meas_stat = self.selected_measurement_statistic
         retval = None  # this will be filled in by decision block...
         if meas_stat != 'all':
             # all of the even elements are the stats,
@@ -426,19 +1152,392 @@ class Infiniium90000(object):
                     {k:v for (k,v) in zip(results_labels, results_list[i+1:i+8])} )
             retval = dict_of_dicts
         # end if
-        self._include_measurement_result_code = orig_include_rescode
-        
+
         # We have a nice class for the measurement results, let's use it:
         #MeasurementResult(label=)
         return retval
     
+    @Action()
+    def displayed_results_batch(self, batch=None):
+        """Poll the displayed measurement results into a columnar batch.
+
+        :param: batch
+        :type MeasurementResultBatch:
+        :description: The batch to append to (default: a new one).
+
+        :returns: The batch.
+        :type MeasurementResultBatch:
+        """
+        if batch is None:
+            batch = MeasurementResultBatch()
+        timestamp = time()
+        meas_stat, results = self._query_displayed_results()
+        batch.append_response(results, meas_stat, timestamp)
+        return batch
+
+    def invalidate_waveform_cache(self):
+        """Forget the waveform preambles, and the host-side transfer state.
+
+        Use this after anything which changes the preambles (vertical scale,
+        timebase, acquisition settings, etc.), or if the transfer settings
+        may have been changed behind the driver's back.
+        """
+        self.__waveform_format_set = False
+        self.__waveform_source = None
+        self.__preambles = {}
+
+    @staticmethod
+    def waveform_source(source):
+        """The ``:WAV:SOUR`` name of a source: a channel number, or a name
+        (e.g. ``FUNC1``, ``WMEM2``).
+        """
+        if isinstance(source, int):
+            return 'CHAN{0:d}'.format(source)
+        return str(source).strip().upper()
+
+    def waveform_preamble(self, source, refresh=False):
+        """The (cached) preamble of a waveform source.
+
+        :type WaveformPreamble:
+        """
+        return self.__fetch([self.waveform_source(source)], refresh=refresh,
+                            data=False)[0].preamble
+
+    @Action()
+    def fetch_waveform(self, source):
+        """Transfer the waveform of one source.
+
+        :type Waveform:
+        """
+        return self.fetch_waveforms([source])[0]
+
+    @Action()
+    def fetch_waveforms(self, sources):
+        """Transfer the waveforms of many sources, in ONE pipelined message
+        (which also fetches the preambles not yet cached).
+
+        :param: sources
+        :type list:
+        :description: Channel numbers, or source names (``FUNC1``, etc.).
+
+        :returns: One ``Waveform`` per source.
+        :type list:
+        """
+        sources = [self.waveform_source(source) for source in sources]
+        waveforms = self.__fetch(sources)
+        stale = [w.source for w in waveforms if len(w) != w.preamble.points]
+        if stale:
+            # the cached preambles were out of date (e.g. the record length
+            # changed); fetch them again, with the data, for those sources:
+            refetched = dict((w.source, w)
+                             for w in self.__fetch(stale, refresh=True))
+            waveforms = [refetched.get(w.source, w) for w in waveforms]
+        return waveforms
+
+    def __fetch(self, sources, refresh=False, data=True):
+        """Query the (uncached) preambles and the data of waveform sources,
+        in one message.
+        """
+        with self._lock:
+            if self.__preambles is None:
+                self.__preambles = {}
+            preambles = self.__preambles
+            commands = []
+            if data and not self.__waveform_format_set:
+                commands.append(':WAV:FORM WORD;:WAV:BYT LSBF')
+            queried = []  # (source, preamble?, data?) in response order
+            for source in OrderedDict.fromkeys(sources):
+                want_preamble = refresh or (source not in preambles)
+                if not (want_preamble or data):
+                    continue
+                if source != self.__waveform_source:
+                    commands.append(':WAV:SOUR {0}'.format(source))
+                    self.__waveform_source = source
+                if want_preamble:
+                    commands.append(':WAV:PRE?')
+                if data:
+                    commands.append(':WAV:DATA?')
+                queried.append((source, want_preamble, data))
+            if not queried:
+                return [Waveform(source, preambles[source], None)
+                        for source in sources]
+            try:
+                self.send(';'.join(commands))
+                message, _ = driver_message_reader(self).read()
+            except:
+                self.__waveform_source = None
+                raise
+            self.__waveform_format_set = self.__waveform_format_set or data
+            if message is None:
+                raise UnexpectedResponseFormatError('Connection closed.')
+            units = iter(split_response_units(message))
+            raws = {}
+            try:
+                for source, want_preamble, want_data in queried:
+                    if want_preamble:
+                        is_block, text = next(units)
+                        preambles[source] = WaveformPreamble.parse(
+                            str(text, self.ENCODING))
+                    if want_data:
+                        is_block, block = next(units)
+                        if not is_block:
+                            raise UnexpectedResponseFormatError(
+                                'Expected waveform data (a block) for '
+                                '{0}.'.format(source))
+                        try:
+                            raws[source] = np.frombuffer(block,
+                                                         self.WAVEFORM_DTYPE)
+                        except ValueError:
+                            raise UnexpectedResponseFormatError(
+                                'Waveform data for {0} is not a whole number '
+                                'of {1} samples ({2} bytes).'.format(
+                                    source, self.WAVEFORM_DTYPE, len(block)))
+            except StopIteration:
+                raise UnexpectedResponseFormatError(
+                    'Too few responses to {0!r}.'.format(';'.join(commands)))
+            return [Waveform(source, preambles[source], raws.get(source))
+                    for source in sources]
+
+    @Action()
+    def acquire_segments(self, count, timeout=None):
+        """Acquire a burst of segments (segmented memory), and wait for it.
+
+        The wait is a single ``*OPC?`` which the instrument answers once the
+        acquisition is complete (no polling).
+
+        :param: count
+        :type int:
+        :description: The number of segments (triggers) to acquire.
+
+        :param: timeout
+        :type float:
+        :description: How long to wait (seconds); None waits indefinitely.
+        The driver's ``TIMEOUT`` is set to this for the wait only.
+        """
+        with self._lock:
+            self.invalidate_waveform_cache()  # the record changes
+            previous_timeout = self.TIMEOUT
+            self.TIMEOUT = timeout
+            try:
+                self.query(':ACQ:MODE SEGM;:ACQ:SEGM:COUN {0:d};:DIG;*OPC?'.format(
+                    int(count)))
+            finally:
+                self.TIMEOUT = previous_timeout
+
+    @Action()
+    def fetch_segments(self, source, out=None, timestamps=None, filename=None,
+                       download_all=True):
+        """Stream the waveforms of the acquired segments of a source.
+
+        The data is received, block by block, straight into its final place.
+
+        :param: out
+        :type ndarray:
+        :description: Where to put the data: C-contiguous, ``WAVEFORM_DTYPE``,
+        of shape (segments, points per segment). Default: a new array, or a
+        ``numpy.memmap`` of ``filename``.
+
+        :param: timestamps
+        :type ndarray:
+        :description: Where to put the segment time tags (float, one per
+        segment). Default: a new array.
+
+        :param: download_all
+        :type bool:
+        :description: Download all of the segments with ONE ``:WAV:DATA?``
+        (``:WAV:SEGM:ALL ON``); otherwise, one segment at a time.
+
+        :returns: The segments (``out`` and ``timestamps``, filled).
+        :type Segments:
+        """
+        source = self.waveform_source(source)
+        with self._lock:
+            preamble = self.waveform_preamble(source, refresh=True)
+            count = int(float(self.query(':WAV:SEGM:COUN?')))
+            shape = (count, preamble.points)
+            if out is None:
+                if filename is not None:
+                    out = np.memmap(filename, dtype=self.WAVEFORM_DTYPE,
+                                    mode='w+', shape=shape)
+                else:
+                    out = np.empty(shape, dtype=self.WAVEFORM_DTYPE)
+            if (out.shape != shape) or (out.dtype != self.WAVEFORM_DTYPE):
+                raise ValueError('Segments need an array of {0} {1}, not {2} '
+                                 '{3}.'.format(shape, self.WAVEFORM_DTYPE,
+                                               out.shape, out.dtype))
+            if timestamps is None:
+                timestamps = np.empty(count, dtype='f8')
+            sock = getattr(self, 'socket', None)
+            recv_into = getattr(sock, 'recv_into', None)
+            formatting = ('' if self.__waveform_format_set
+                          else ':WAV:FORM WORD;:WAV:BYT LSBF;')
+            if download_all:
+                tags = np.fromstring(self.query(':WAV:SEGM:XLIS? TTAG'),
+                                     dtype='f8', sep=',')
+                if len(tags) != count:
+                    raise UnexpectedResponseFormatError(
+                        'Expected {0} segment time tags, got {1}.'.format(
+                            count, len(tags)))
+                timestamps[:] = tags
+                self.send(formatting + ':WAV:SEGM:ALL ON;:WAV:DATA?')
+                self.__waveform_format_set = True
+                try:
+                    try:
+                        length = read_definite_length_block_into(
+                            self.raw_recv, out, recv_into, self.RECV_CHUNK)
+                    finally:
+                        self.recv()  # (the termination, even after a bad block)
+                finally:
+                    self.send(':WAV:SEGM:ALL OFF')
+                self.__check_segment_length(length, out)
+            else:
+                for index in range(count):
+                    self.send('{0}:ACQ:SEGM:INDEX {1:d};:WAV:DATA?;'
+                              ':WAV:SEGM:TTAG?'.format(formatting, index + 1))
+                    self.__waveform_format_set = True
+                    formatting = ''
+                    try:
+                        length = read_definite_length_block_into(
+                            self.raw_recv, out[index], recv_into,
+                            self.RECV_CHUNK)
+                    finally:
+                        # the time tag and termination (even after a bad block):
+                        response = self.recv()
+                    self.__check_segment_length(length, out[index])
+                    timestamps[index] = float(response.lstrip(';'))
+            if isinstance(out, np.memmap):
+                out.flush()
+            return Segments(source, preamble, out, timestamps)
+
+    @staticmethod
+    def __check_segment_length(length, out):
+        """A short block would leave (uninitialized) data in ``out``.
+        """
+        if length != out.nbytes:
+            raise UnexpectedResponseFormatError(
+                'Expected {0} bytes of segment data, got {1}.'.format(
+                    out.nbytes, length))
+
+    @property
+    def statistics_accumulator(self):
+        """The running background statistics accumulator (or ``None``).
+
+        .. seealso: start_statistics_accumulator
+        """
+        return self._recorder('statistics_accumulator')
+
+    def start_statistics_accumulator(self, rate=1.0, window=1000, bins=64,
+                                     histogram_ranges=None, only_valid=True):
+        """Start accumulating measurement statistics in the background.
+
+        Any running accumulator is stopped first. The ``all`` measurement
+        statistic is selected, as the accumulator needs the measurement
+        counts it gives (to tell new measurements from repeated ones).
+
+        :returns: The started accumulator.
+        :type MeasurementStatisticsAccumulator:
+
+        .. seealso: MeasurementStatisticsAccumulator, RecorderHostMixin
+        """
+        self.selected_measurement_statistic = 'all'
+        accumulator = MeasurementStatisticsAccumulator(
+            self, rate=rate, window=window, bins=bins,
+            histogram_ranges=histogram_ranges, only_valid=only_valid)
+        return self._start_recorder('statistics_accumulator', accumulator)
+
+    def stop_statistics_accumulator(self, timeout=None):
+        """Stop the background statistics accumulator, if running.
+
+        The stopped accumulator (and its statistics) is returned, or ``None``.
+        """
+        return self._stop_recorder('statistics_accumulator', timeout)
+
+    def send(self, command, *args, **kwargs):
+        # any command (i.e. not a query) may change the setup:
+        if (self.__setup_checksum is not None) and not all(
+                unit.strip().endswith('?') for unit in command.split(';')):
+            self.__setup_checksum = None
+        return super().send(command, *args, **kwargs)
+
+    def invalidate_setup_cache(self):
+        """Forget the checksum of the active setup.
+
+        The next ``restore_setup`` will read the setup to compare it (unless
+        it uploads anyway). Use this if the setup may have been changed behind
+        the driver's back (front panel, another controller, etc.).
+        """
+        self.__setup_checksum = None
+
     @Action()
     def get_system_setup_binary(self):        
         self.send(":SYST:SET?")
-        return read_definite_length_block(self.raw_recv, block_id={
+        setup = read_definite_length_block(self.raw_recv, block_id={
                     'name': 'setup', 'model': 'Infiniium 90000 Series'},
                     recv_termination=self.RECV_TERMINATION, 
                     recv_chunk=self.RECV_CHUNK)
+        self.__setup_checksum = setup.checksum
+        return setup
+
+    @Action()
+    def set_system_setup_binary(self, setup):
+        """Upload a setup (as returned by ``get_system_setup_binary``).
+
+        As with ``reset`` and ``recall_state``, the host-side measurement and
+        waveform state is invalidated (the setup replaces it).
+
+        :param: setup
+        :type DefiniteLengthBlock or bytes:
+        :description: The setup, or a raw block.
+        """
+        if not isinstance(setup, DefiniteLengthBlock):
+            setup = DefiniteLengthBlock(block=bytes(setup))
+        message = b':SYST:SET ' + setup.raw + self.SEND_TERMINATION.encode('ascii')
+        self.invalidate_measurement_state()
+        self.invalidate_waveform_cache()
+        self.invalidate_setup_cache()
+        # (raw, the block is binary; a socket ``send`` may send only a part):
+        sendall = getattr(getattr(self, 'socket', None), 'sendall', None)
+        (sendall or self.raw_send)(message)
+        self.__setup_checksum = setup.checksum
+
+    def setup_checksum(self, refresh=False):
+        """The checksum of the active setup.
+
+        The setup is only read if its checksum is unknown (or ``refresh``).
+        """
+        if refresh or (self.__setup_checksum is None):
+            return self.get_system_setup_binary().checksum
+        return self.__setup_checksum
+
+    def has_setup(self, setup, refresh=False):
+        """Whether a setup is the active one (by checksum).
+
+        :type setup: DefiniteLengthBlock (e.g. from a ``SetupLibrary``).
+        """
+        return self.setup_checksum(refresh) == setup.checksum
+
+    @Action()
+    def restore_setup(self, setup, refresh=False):
+        """Upload a setup, unless it is already the active one.
+
+        The host-side state is only invalidated when the setup is uploaded.
+
+        :param: refresh
+        :type bool:
+        :description: Read the active setup to compare, even if its checksum
+        is known on the host.
+
+        :returns: Whether the setup was uploaded.
+        :type bool:
+
+        .. seealso: SetupLibrary
+        """
+        if not isinstance(setup, DefiniteLengthBlock):
+            setup = DefiniteLengthBlock(block=bytes(setup))
+        if self.has_setup(setup, refresh):
+            return False
+        self.set_system_setup_binary(setup)
+        return True
 
 
 class DSOX92504A_TCP(Infiniium90000, ErrorQueueImplementation, 
@@ -16,8 +16,306 @@
 
 __version__ = '0.1.0'
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import re
+from time import monotonic, sleep
+import numpy as np
 from lantz import Feat, DictFeat, Q_, Action
+from lantz.feat import MISSING
 from lantz.errors import InstrumentError
+from sindri.errors import (MeasurementTimeoutError,
+                           UnexpectedResponseFormatError)
+
+
+def parse_numeric_list(response):
+    """Parse a comma separated response into a NumPy array of floats.
+
+    Fields which are not numbers (e.g., ``---`` for an unmeasured value) are
+    given as ``nan``.
+    """
+    values = []
+    for field in response.split(','):
+        try:
+            values.append(float(field))
+        except ValueError:
+            values.append(float('nan'))
+    return np.array(values, dtype='f8')
+
+
+def is_query(command):
+    """Whether a (single) program message unit is a query.
+    """
+    return command.split(None, 1)[0].endswith('?')
+
+
+def _is_global_command(command):
+    """Whether a command applies regardless of the unit:module:port selection.
+    """
+    return command.startswith(('*', ':SYST', 'SYST'))
+
+
+def _rooted(command):
+    """The command with its header rooted (``:SENS...``), for coalescing.
+
+    In a ``;`` separated message, a header without a leading ``:`` is taken
+    relative to the previous one; common (``*...``) commands are left as is.
+    """
+    command = command.lstrip()
+    if command.startswith((':', '*')):
+        return command
+    return ':' + command
+
+
+def plan_sequence(operations, start=(None, None, None)):
+    """Order addressed operations to need the fewest selector changes.
+
+    Each operation is a ``(unit, module, port, command)`` tuple. The plan
+    keeps the following orderings, and is otherwise free to reorder:
+
+        - Operations on the same unit:module:port keep their relative order.
+        - ``Global`` operations are barriers; no operation is moved across
+          one. An operation is global when its address is entirely ``None``,
+          or when its command is common (``*...``) or system-level
+          (``:SYST...``).
+        - Operations on a partial address (some, but not all, levels
+          ``None``) are barriers too, as they act on whatever selection is
+          current at that point.
+
+    Between barriers, the operations are grouped by address, and the groups
+    are visited so that each address is selected at most once, with unit,
+    then module, changes minimized (the ``start`` address is visited first).
+
+    :param: operations
+    :type list:
+
+    :param: start
+    :type tuple:
+    :description: The currently selected unit:module:port (``None`` := unknown).
+
+    :returns: The planned order, as indices into ``operations``.
+    :type list:
+    """
+    order = []
+    groups = {}  # address -> [operation indices], for the current segment
+    current = tuple(start)
+
+    def flush():
+        # visit the current unit (then module, then port) first, then ascend:
+        def sort_key(address):
+            key = []
+            for level, value in enumerate(address):
+                key.append(address[:level+1] != current[:level+1])
+                key.append(-1 if value is None else int(value))
+            return tuple(key)
+        addresses = sorted(groups, key=sort_key)
+        for address in addresses:
+            order.extend(groups[address])
+        groups.clear()
+        return addresses[-1] if addresses else current
+
+    for index, (unit, module, port, command) in enumerate(operations):
+        address = (unit, module, port)
+        if None in address or _is_global_command(command):
+            current = flush()
+            order.append(index)
+        else:
+            groups.setdefault(address, []).append(index)
+    flush()
+    return order
+
+
+class ModuleStatus(object):
+    """The status of one installed module, as parsed from ``:SYST:COND?``.
+    """
+    __unit = None
+    __slot = None
+    __model = None
+    __ports = None
+    __options = None
+
+    def __init__(self, unit, slot, model, ports, options):
+        self.__unit = unit
+        self.__slot = slot
+        self.__model = model
+        self.__ports = tuple(range(1, ports + 1))
+        self.__options = frozenset(options)
+
+    def __repr__(self):
+        return "<ModuleStatus {0}:{1} {2}>".format(self.__unit, self.__slot,
+                                                   self.__model)
+
+    @property
+    def unit(self):
+        return self.__unit
+
+    @property
+    def slot(self):
+        return self.__slot
+
+    @property
+    def model(self):
+        return self.__model
+
+    @property
+    def ports(self):
+        """The port numbers of the module.
+        """
+        return self.__ports
+
+    @property
+    def options(self):
+        """The installed options of the module.
+
+        :type: frozenset
+        """
+        return self.__options
+
+
+class SoftwareStatus(object):
+    """A parsed, indexed model of the MX180000A software status (``:SYST:COND?``).
+
+    Each installed module is ASSUMED to be reported as a record of five comma
+    separated fields: ``<unit>,<slot>,<model>,<port count>,<options>``, where
+    the options field is ``/`` separated (and may be empty).
+
+    **NOTE:**
+    This layout has NOT been checked against the MX180000A remote control
+    manual, nor against an instrument; if the response differs, adjust
+    ``FIELDS_PER_RECORD`` and the record parsing in ``__init__``. So that a
+    different layout can never be misread (a shifted field taken for a
+    model, etc.), EVERY record is validated: unit and slot are positive
+    integers, the model is an Anritsu model number (``MODEL_PATTERN``), the
+    port count is a non-negative integer, each option matches
+    ``OPTION_PATTERN``, and no unit:slot is reported twice. Anything else
+    raises ``UnexpectedResponseFormatError``; no partial status is kept.
+
+    All lookups are dictionary lookups; nothing here talks to the instrument.
+
+    Options are reported per module, and therefore apply to every port of
+    the module.
+    """
+    FIELDS_PER_RECORD = 5
+    #: An Anritsu model number, e.g. ``MU181020A``, ``MP1800A``.
+    MODEL_PATTERN = re.compile(r'^[A-Z]{2}\d{4,6}[A-Z]$')
+    #: An option number, e.g. ``001``, ``x01``.
+    OPTION_PATTERN = re.compile(r'^[A-Za-z]?\d{2,3}$')
+
+    __raw = None
+    __modules = None  # (unit, slot) -> ModuleStatus
+    __units = None  # unit -> {slot: ModuleStatus}
+    __by_option = None  # option -> frozenset of (unit, slot)
+    __by_model = None  # model -> tuple of ModuleStatus
+    __unit_options = None  # {(option, unit)}
+
+    def __init__(self, raw):
+        """Parse the raw ``:SYST:COND?`` response.
+
+        :raises: UnexpectedResponseFormatError
+        """
+        self.__raw = raw
+        fields = [f.strip().strip('"') for f in raw.split(',')] if raw.strip() else []
+        if len(fields) % self.FIELDS_PER_RECORD:
+            raise UnexpectedResponseFormatError(
+                "Software status has {0} fields, expected a multiple of {1}: "
+                "``{2}``".format(len(fields), self.FIELDS_PER_RECORD, raw))
+        modules = OrderedDict()
+        by_option = {}
+        by_model = {}
+        for i in range(0, len(fields), self.FIELDS_PER_RECORD):
+            record = fields[i:i+self.FIELDS_PER_RECORD]
+            unit, slot, model, ports, options = record
+            options = [o.strip() for o in options.split('/') if o.strip()]
+            try:
+                unit, slot, ports = int(unit), int(slot), int(ports)
+            except ValueError:
+                unit = None
+            if ((unit is None) or (unit < 1) or (slot < 1) or (ports < 0)
+                    or not self.MODEL_PATTERN.match(model)
+                    or not all(self.OPTION_PATTERN.match(o) for o in options)
+                    or ((unit, slot) in modules)):
+                raise UnexpectedResponseFormatError(
+                    "Bad software status record: ``{0}``".format(
+                        ','.join(record)))
+            module = ModuleStatus(unit, slot, model, ports, options)
+            modules[(unit, slot)] = module
+            by_model.setdefault(model, []).append(module)
+            for option in module.options:
+                by_option.setdefault(option, set()).add((unit, slot))
+        self.__modules = modules
+        self.__units = OrderedDict()
+        for (unit, slot), module in modules.items():
+            self.__units.setdefault(unit, OrderedDict())[slot] = module
+        self.__by_option = {o: frozenset(a) for (o, a) in by_option.items()}
+        self.__unit_options = frozenset((o, u) for (o, a) in by_option.items()
+                                        for (u, s) in a)
+        self.__by_model = {m: tuple(ms) for (m, ms) in by_model.items()}
+
+    @property
+    def raw(self):
+        """The raw ``:SYST:COND?`` response.
+        """
+        return self.__raw
+
+    @property
+    def units(self):
+        """The unit numbers which have modules installed.
+        """
+        return list(self.__units.keys())
+
+    def modules(self, unit=None):
+        """The installed modules, of one unit or of all units.
+
+        :type: list of ModuleStatus
+        """
+        if unit is None:
+            return list(self.__modules.values())
+        return list(self.__units.get(unit, {}).values())
+
+    def module(self, unit, slot):
+        """The module installed at unit:slot.
+
+        :raises: KeyError
+        """
+        return self.__modules[(unit, slot)]
+
+    def has_module(self, unit, slot, port=None):
+        """Whether a module (and, optionally, port) exists at unit:slot:port.
+        """
+        module = self.__modules.get((unit, slot))
+        if module is None:
+            return False
+        return (port is None) or (1 <= port <= len(module.ports))
+
+    def options(self, unit, slot, port=None):
+        """The options installed for unit:slot (and port).
+
+        :type: frozenset
+        :raises: KeyError
+        """
+        if (port is not None) and not self.has_module(unit, slot, port):
+            raise KeyError((unit, slot, port))
+        return self.__modules[(unit, slot)].options
+
+    def has_option(self, option, unit=None, slot=None, port=None):
+        """Whether an option is installed (anywhere, or at unit:slot:port).
+        """
+        locations = self.__by_option.get(option, frozenset())
+        if unit is None:
+            return bool(locations)
+        if slot is None:
+            return (option, unit) in self.__unit_options
+        if (port is not None) and not self.has_module(unit, slot, port):
+            return False
+        return (unit, slot) in locations
+
+    def find_modules(self, model):
+        """The installed modules of a given model (e.g., ``MU181020A``).
+
+        :type: tuple of ModuleStatus
+        """
+        return self.__by_model.get(model, ())
 
 
 class IEEE4882SubsetMixin(object):
@@ -168,6 +466,21 @@ class IEEE4882SubsetMixin(object):
 
 class MX180000A(object):
     """Anritsu MX180000A SQA Controller Driver Kernel
+
+    Addressing
+    ==========
+    Per-port commands apply to the currently selected unit:module:port. The
+    driver tracks the selection on the host, so that only the selectors which
+    actually changed are sent, in ONE message:
+    ::
+        ...
+        >>>with inst.addressed(1, 2, 1):  # sends ``:UENT:ID 1;:MOD:ID 2;...``
+        ...    inst.send(':OUTP:DATA:AMPL DATA,0.5')
+        >>>with inst.addressed(1, 2, 2):  # sends ``:PORT:ID 2`` only
+        ...    inst.send(':OUTP:DATA:AMPL DATA,0.5')
+        >>>inst.selected_address
+        (1, 2, 2)
+        >>>inst.invalidate_address_cache()  # after a front panel change, etc.
     """
     __COMMON_FUNCTIONS = {'auto search': 'ASE', 
                           'isi': 'ISI',
@@ -177,13 +490,35 @@ class MX180000A(object):
                           'bathtub': 'BTUB',
                           'auto adjust': 'AADJ',
                           'off': 'OFF'}
+    # (feature, command header) for each level of the unit:module:port address:
+    __ADDRESS_SELECTORS = (('selected_unit', ':UENT:ID'),
+                           ('selected_module', ':MOD:ID'),
+                           ('selected_port', ':PORT:ID'))
+
+    __address = (None, None, None)  # host-side unit:module:port, None := unknown
+    __software_status = None  # parsed ``:SYST:COND?``, None := not queried
+    __event_status = 0  # ``*ESR?`` bits read by the driver, not yet taken
+
+    #: The longest message ``run_sequence`` will coalesce commands into.
+    MAX_MESSAGE_LENGTH = 1024
+
     #==========================================================================
     # System level commands
     #==========================================================================
+    @Action()
+    def reset(self):
+        """Set the instrument functions to the factory default power up state.
+        """
+        self.invalidate_address_cache()
+        self.invalidate_software_status()
+        super().reset()
+
     @Action()
     def factory_reset(self):
         """Initializes the internal setting data to the initial settings at factory shipment.
         """
+        self.invalidate_address_cache()
+        self.invalidate_software_status()
         self.send(":SYST:MEM:INIT")
         
     @Action()
@@ -199,6 +534,8 @@ class MX180000A(object):
         The settings will not be read from the saved file if the file name is 
         changed.
         """
+        self.invalidate_address_cache()
+        self.invalidate_software_status()
         self.send(":SYST:MMEM:QREC \"{0}\"".format(filename))
     
     @Action()
@@ -218,43 +555,266 @@ class MX180000A(object):
         comment = "sindri.anritsu.mx180000a, {0}".format(__version__)
         self.send(":SYST:MMEM:QST \"{0}\", \"{1}\"".format(filename, comment))
         
+    #==========================================================================
+    # Standard Event Status (read-and-clear) bookkeeping
+    #==========================================================================
+    #: Standard Event Status Register bits which flag an error.
+    EVENT_STATUS_ERRORS = 0x3C  # CME | EXE | DDE | QYE
+
+    @Action()
+    def read_event_status(self):
+        """Read the Standard Event Status Register (``*ESR?``).
+
+        The instrument clears the register when it is read, so every bit
+        read here (except ``Operation Complete``, bit 0) is also kept on the
+        host, until taken with ``take_event_status``.
+
+        :returns: The register, as read.
+        :type int:
+        """
+        value = int(self.query('*ESR?'))
+        self.__event_status |= value & ~0x01
+        return value
+
+    def take_event_status(self):
+        """The event status bits kept by ``read_event_status``, clearing them.
+
+        :type int:
+        """
+        value, self.__event_status = self.__event_status, 0
+        return value
+
+    @property
+    def pending_event_status(self):
+        """The event status bits kept by ``read_event_status`` (not cleared).
+
+        :type int:
+        """
+        return self.__event_status
+
+    @Action()
+    def clear_status(self):
+        """Clears the event registers in all register groups.
+         Also clears the error queue (and the host-side event status).
+        """
+        self.__event_status = 0
+        super().clear_status()
+
+    #==========================================================================
+    # unit:module:port addressing
+    #==========================================================================
+    def __cache_address(self, level, value):
+        """Record the selector value for one level of the address (host-side).
+
+        The instrument may keep a separate module/port selection per unit
+        (and port per module), so a change at one level makes the levels
+        beneath it unknown (on the host, and in the lantz feature cache).
+        """
+        address = list(self.__address)
+        if value is not None:
+            value = int(value)
+        if address[level] != value:
+            address[level+1:] = [None] * (len(address) - level - 1)
+            for feat_name, _ in self.__ADDRESS_SELECTORS[level+1:]:
+                getattr(type(self), feat_name).set_cache(self, MISSING)
+        address[level] = value
+        self.__address = tuple(address)
+
+    @property
+    def selected_address(self):
+        """The unit:module:port selection, as tracked by the host.
+
+        Levels which are not known to the host are ``None``.
+
+        :type: tuple
+        """
+        return self.__address
+
+    def invalidate_address_cache(self):
+        """Forget the host-side unit:module:port selection.
+
+        The next ``select_address`` will send every selector. Use this if the
+        selection may have been changed behind the driver's back (front panel,
+        another controller, etc.).
+        """
+        self.__address = (None, None, None)
+        # ... and the lantz feature cache, or an equal set would be skipped:
+        for feat_name, _ in self.__ADDRESS_SELECTORS:
+            getattr(type(self), feat_name).set_cache(self, MISSING)
+
+    @Action()
+    def select_address(self, unit=None, module=None, port=None):
+        """Select a unit:module:port, sending only the selectors that changed.
+
+        The changed selectors are sent as a single message. A level given as
+        ``None`` is left as is.
+
+        :returns: The number of selectors sent.
+        :type int:
+        """
+        commands = self.__address_selectors(unit, module, port)
+        if commands:
+            try:
+                self.send(';'.join(commands))
+            except:
+                self.invalidate_address_cache()
+                raise
+        return len(commands)
+
+    def __address_selectors(self, unit, module, port):
+        """The selector commands needed to reach unit:module:port.
+
+        The host-side address (and lantz feature cache) is updated as though
+        the commands have been sent; the caller MUST send them, or invalidate
+        the address cache.
+        """
+        commands = []
+        for level, value in enumerate((unit, module, port)):
+            if value is None:
+                continue
+            if self.__address[level] == int(value):
+                continue
+            feat_name, header = self.__ADDRESS_SELECTORS[level]
+            commands.append("{0} {1}".format(header, int(value)))
+            self.__cache_address(level, value)
+            # keep the lantz feature cache coherent with what is sent:
+            getattr(type(self), feat_name).set_cache(self, int(value))
+        return commands
+
+    @Action()
+    def run_sequence(self, operations, reorder=True):
+        """Run a sequence of addressed commands with the fewest selector changes.
+
+        Each operation is a ``(unit, module, port, command)`` tuple. Commands
+        are reordered with ``plan_sequence`` (unless ``reorder`` is False), and
+        the commands, together with any selectors needed to reach their
+        address, are coalesced into as few messages as possible. A message
+        is ended by a query (which is answered), or by reaching
+        ``MAX_MESSAGE_LENGTH``. Headers are rooted (``:...``) before
+        coalescing, so each is independent of the command before it.
+
+        :returns: One response per operation, in the ORIGINAL operation order
+                  (``None`` for operations which are not queries).
+        :type list:
+
+        .. seealso: plan_sequence
+        """
+        operations = list(operations)
+        order = (plan_sequence(operations, start=self.__address) if reorder
+                 else range(len(operations)))
+        responses = [None] * len(operations)
+        pending = []  # (commands of) the message being coalesced
+        pending_length = 0
+        try:
+            for index in order:
+                unit, module, port, command = operations[index]
+                commands = self.__address_selectors(unit, module, port)
+                commands.append(_rooted(command))
+                length = sum(len(c) + 1 for c in commands)
+                if pending and (pending_length + length > self.MAX_MESSAGE_LENGTH):
+                    self.send(';'.join(pending))
+                    pending, pending_length = [], 0
+                pending.extend(commands)
+                pending_length += length
+                if is_query(command):
+                    responses[index] = self.query(';'.join(pending))
+                    pending, pending_length = [], 0
+            if pending:
+                self.send(';'.join(pending))
+        except:
+            self.invalidate_address_cache()
+            raise
+        return responses
+
+    @contextmanager
+    def addressed(self, unit=None, module=None, port=None):
+        """Context in which the given unit:module:port is selected.
+
+        The driver lock is held for the whole context, so commands sent from
+        other threads can neither interleave with, nor change, the selection.
+
+        .. seealso: select_address
+        """
+        with self._lock:
+            self.select_address(unit, module, port)
+            yield self
+
     @Feat()
     def selected_unit(self):
         """The index of the unit being operated.
         """
-        return self.query(":UENT:ID?")
-        
+        value = int(self.query(":UENT:ID?"))
+        self.__cache_address(0, value)
+        return value
+
     @selected_unit.setter
     def selected_unit(self, value):
-        self.send(":UENT:ID {0}".format(value))
-        
+        self.send(":UENT:ID {0:d}".format(int(value)))
+        self.__cache_address(0, value)
+
     @Feat()
     def selected_module(self):
         """The index of the module (slot position) being operated.
         """
-        return self.query(":MOD:ID?")
-        
+        value = int(self.query(":MOD:ID?"))
+        self.__cache_address(1, value)
+        return value
+
     @selected_module.setter
     def selected_module(self, value):
-        self.send(":MOD:ID {0}".format(value))
-        
+        self.send(":MOD:ID {0:d}".format(int(value)))
+        self.__cache_address(1, value)
+
     @Feat()
     def selected_port(self):
         """The index of the port (physical position # on module) being operated.
         """
-        return self.query(":PORT:ID?")
-        
+        value = int(self.query(":PORT:ID?"))
+        self.__cache_address(2, value)
+        return value
+
     @selected_port.setter
     def selected_port(self, value):
-        self.send(":PORT:ID {0}".format(value))
+        self.send(":PORT:ID {0:d}".format(int(value)))
+        self.__cache_address(2, value)
         
     @Action()
     def get_software_status(self):
         """Query the software status of the MP1800A/MT1810A.
         
         Returns A LOT of useful information about the installed modules/options.
+
+        .. seealso: software_status, for the parsed (and cached) status.
         """
         return self.query(":SYST:COND?")
+
+    @property
+    def software_status(self):
+        """The parsed software status, queried once and then cached.
+
+        Capability checks against the cached status cost no I/O:
+        ::
+            ...
+            >>>inst.software_status.has_option('x01', 1, 2)
+            True
+            >>>inst.software_status.module(1, 2).model
+            'MU181020A'
+
+        The cache is dropped by ``reset``, ``factory_reset`` and
+        ``recall_state``, or explicitly with ``invalidate_software_status``.
+
+        :type: SoftwareStatus
+        """
+        status = self.__software_status
+        if status is None:
+            status = SoftwareStatus(self.get_software_status())
+            self.__software_status = status
+        return status
+
+    def invalidate_software_status(self):
+        """Drop the cached software status (it is re-queried when next used).
+        """
+        self.__software_status = None
         
     @Feat(values=__COMMON_FUNCTIONS)
     def selected_function(self):
@@ -270,6 +830,209 @@ class MX180000A(object):
     @selected_function.setter
     def selected_function(self, value):
         self.send(":SYST:CFUN {0}".format(value))
-    
-    
 
+    @property
+    def common_functions(self):
+        """The available common/automatic measurement functions.
+
+        .. seealso: selected_function
+        """
+        return list(self.__COMMON_FUNCTIONS.keys())
+
+    def start_common_measurement(self, function, runner, timeout=None):
+        """Start a common measurement function, without waiting for it.
+
+        :param: runner
+        :type CommonMeasurementRunner:
+        :description: A runner which knows the commands of the function.
+
+        :returns: A future, resolving to the results as a NumPy array.
+        :type concurrent.futures.Future:
+
+        .. seealso: CommonMeasurementRunner
+        """
+        return runner.submit(self, function, timeout=timeout)
+
+
+class CommonMeasurementRunner(object):
+    """Runs MX180000A common measurement functions in the background.
+
+    A measurement is started, and the runner then waits for the instrument's
+    ``Operation Complete`` event (``*OPC`` / ``*ESR?``), polling with an
+    adaptive (exponential) backoff instead of a fixed sleep. ``*ESR?`` clears
+    the register when read, so it is read through
+    ``MX180000A.read_event_status``, which keeps the other event bits for
+    the driver's user (``take_event_status``). An error bit (command,
+    execution, device or query error) raised during the measurement fails
+    it with an ``InstrumentError``. The driver lock
+    is only held while talking to the instrument, NOT while waiting, so the
+    driver stays usable during a long measurement.
+
+    Measurements on different instruments (chassis) run in parallel, one
+    worker thread per running measurement:
+    ::
+        ...
+        >>>runner = CommonMeasurementRunner(commands)
+        >>>futures = [runner.submit(inst, 'eye margin') for inst in chassis]
+        >>>results = [f.result() for f in futures]  # NumPy arrays
+        >>>inst.start_common_measurement('bathtub', runner).result(timeout=600)
+
+    **NOTE:**
+    The runner has NO built-in start commands or result queries: they are
+    given, per function, as ``commands``, taken from the MX180000A remote
+    control manual for the installed firmware. (Only the function
+    selection, ``:SYST:CFUN``, is known to the driver.)
+    """
+    __commands = None  # function -> (start command, result query)
+    __executor = None
+    __initial_interval = None
+    __max_interval = None
+    __backoff = None
+
+    def __init__(self, commands, max_workers=8, initial_interval=0.05,
+                 max_interval=2.0, backoff=1.5):
+        """Initialize the runner.
+
+        :param: commands
+        :type dict:
+        :description: ``(start command, result query)`` per common function
+        (see ``MX180000A.common_functions``). The start command must be an
+        overlapped command (``*OPC`` is appended to it), and the result
+        query must return comma separated numbers.
+
+        :param: max_workers
+        :type int:
+        :description: The most measurements which may run at the same time.
+
+        :param: initial_interval
+        :type float:
+        :description: The first completion polling interval (seconds).
+
+        :param: max_interval
+        :type float:
+        :description: The longest completion polling interval (seconds).
+
+        :param: backoff
+        :type float:
+        :description: The factor by which the polling interval grows.
+        """
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.__initial_interval = float(initial_interval)
+        self.__max_interval = float(max_interval)
+        self.__backoff = float(backoff)
+        self.__commands = dict(commands)
+
+    @property
+    def commands(self):
+        """The ``(start command, result query)`` of each known function.
+        """
+        return dict(self.__commands)
+
+    def submit(self, driver, function, timeout=None):
+        """Start a measurement function on a driver, in the background.
+
+        :param: driver
+        :type MX180000A:
+
+        :param: function
+        :type str:
+        :description: A common function, see ``MX180000A.common_functions``.
+
+        :param: timeout
+        :type float:
+        :description: Give up waiting after this long (seconds).
+
+        :returns: A future, resolving to the results as a NumPy array.
+        :type concurrent.futures.Future:
+
+        :raises: MeasurementTimeoutError (from the future)
+        """
+        if function not in self.__commands:
+            raise ValueError("No commands are known for the '{0}' common "
+                             "measurement function.".format(function))
+        return self.__executor.submit(self.run, driver, function, timeout)
+
+    def run(self, driver, function, timeout=None):
+        """Run a measurement function on a driver, and wait for the results.
+
+        .. seealso: submit
+        """
+        start_command, result_query = self.__commands[function]
+        with driver._lock:
+            driver.selected_function = function
+            # clear any stale ``Operation Complete`` (other bits are kept):
+            driver.read_event_status()
+            driver.send("{0};*OPC".format(start_command))
+        started = monotonic()
+        interval = self.__initial_interval
+        while True:
+            with driver._lock:
+                event_status = driver.read_event_status()
+            if event_status & driver.EVENT_STATUS_ERRORS:
+                raise InstrumentError(
+                    "'{0}' failed, event status {1:#04x}.".format(function,
+                                                                 event_status))
+            if event_status & 0x01:  # bit 0: Operation Complete
+                break
+            waited = monotonic() - started
+            if (timeout is not None) and (waited >= timeout):
+                raise MeasurementTimeoutError(
+                    "'{0}' did not complete within {1} s.".format(function,
+                                                                 timeout))
+            if timeout is not None:
+                interval = min(interval, timeout - waited)
+            sleep(interval)
+            interval = min(interval * self.__backoff, self.__max_interval)
+        with driver._lock:
+            return parse_numeric_list(driver.query(result_query))
+
+    @property
+    def executor(self):
+        """The executor which runs the measurements.
+        """
+        return self.__executor
+
+    def shutdown(self, wait=True):
+        """Release the worker threads (after running measurements complete).
+        """
+        self.__executor.shutdown(wait=wait)
+
+
+def run_common_measurements(jobs, commands, timeout=None):
+    """Run common measurements on several instruments in parallel.
+
+    Measurements on DIFFERENT instruments run at the same time; measurements
+    on the same instrument run one after another, in ``jobs`` order.
+
+    :param: jobs
+    :type list:
+    :description: ``(driver, function)`` pairs.
+
+    :param: commands
+    :type dict:
+    :description: See ``CommonMeasurementRunner``.
+
+    :returns: The results (NumPy arrays), in ``jobs`` order.
+    :type list:
+    """
+    jobs = list(jobs)
+    per_driver = OrderedDict()  # id(driver) -> (driver, [job indices])
+    for index, (driver, function) in enumerate(jobs):
+        per_driver.setdefault(id(driver), (driver, []))[1].append(index)
+
+    runner = CommonMeasurementRunner(commands,
+                                     max_workers=max(1, len(per_driver)))
+    results = [None] * len(jobs)
+
+    def run_all(driver, indices):
+        for index in indices:
+            results[index] = runner.run(driver, jobs[index][1], timeout)
+
+    try:
+        futures = [runner.executor.submit(run_all, driver, indices)
+                   for (driver, indices) in per_driver.values()]
+        for future in futures:
+            future.result()  # re-raises the first failure
+    finally:
+        runner.shutdown()
+    return results
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""sindri.bridges
+
+    A set of servers which allow bridging between interfaces (socket, serial, etc...)
+
+    Typically, a bridge will be used to serve a local device to the world as
+    a TCP socket connection. On a remote machine, a TCP version of an
+    instrument driver can then be used to connect to the server and, voila,
+    a bridge has been established.
+
+    Two kinds of bridge are provided:
+        - message level (``scpi``): program messages from the clients are
+          passed, as is, to the local device.
+        - Feat level (``rpc``): the clients get and set the Feats (and call
+          the Actions) of the local driver, many at a time; ``proxy_class``
+          mirrors a driver class as a remote driver over it.
+
+    A ``Gateway`` serves many local devices (at the message level) behind
+    one port, routing each message by device name.
+
+    :copyright: 2013 by Sindri Authors, see AUTHORS for more details.
+    :license: LGPL, see LICENSE for more details.
+"""
+
+from .common import (BridgeError, BridgeClosedError, BridgeOverloadError,
+                     DeadlineExceededError, FairQueue, BridgeRequest,
+                     DeviceWorker)
+from .scpi import (TCPHandler, BridgeServer, BridgeBase, Bridge, AsyncBridge,
+                   BridgeFactory)
+from .rpc import RemoteError, RPCBridge, RPCClient
+from .proxy import RemoteDriver, proxy_class
+from .gateway import UnknownDeviceError, GatewayHandler, Gateway
+from .metrics import LatencyHistogram, BridgeMetrics, MetricsServer
+
+__all__ = ['BridgeError', 'BridgeClosedError', 'BridgeOverloadError',
+           'DeadlineExceededError', 'FairQueue', 'BridgeRequest',
+           'DeviceWorker', 'TCPHandler', 'BridgeServer', 'BridgeBase',
+           'Bridge', 'AsyncBridge', 'BridgeFactory', 'RemoteError',
+           'RPCBridge', 'RPCClient', 'RemoteDriver', 'proxy_class',
+           'UnknownDeviceError', 'GatewayHandler',
+           'Gateway', 'LatencyHistogram', 'BridgeMetrics', 'MetricsServer']
@@ -0,0 +1,701 @@
+# -*- coding: utf-8 -*-
+"""sindri.bridges.common
+
+    Implements the machinery which is common to all bridges: the device
+    worker, which is the single owner of a local driver, and the fair queue
+    of client requests which feeds it.
+
+    :copyright: 2013 by Sindri Authors, see AUTHORS for more details.
+    :license: LGPL, see LICENSE for more details.
+"""
+
+import logging
+import threading
+from collections import deque, OrderedDict
+from time import monotonic
+
+from sindri.errors import SindriError
+from sindri.ieee4882.arbitrary_block import (driver_message_reader,
+                                             find_definite_length_block)
+
+
+class BridgeError(SindriError):
+    pass
+
+
+class BridgeClosedError(BridgeError):
+    pass
+
+
+class BridgeOverloadError(BridgeError):
+    pass
+
+
+class DeadlineExceededError(BridgeError):
+    pass
+
+
+def text_of(message):
+    """The text of a raw message, with the payload of any binary blocks removed.
+
+    :type str:
+    """
+    parts = []
+    start = 0
+    header = find_definite_length_block(message)
+    while (header is not None) and (header + 1 < len(message)):
+        digits_end = header + 2 + (message[header+1] - 48)
+        try:
+            payload_end = digits_end + int(message[header+2:digits_end])
+        except ValueError:
+            header = find_definite_length_block(message, header + 1)
+            continue
+        parts.append(message[start:header+1])  # keep the '#'
+        start = payload_end
+        header = find_definite_length_block(message, payload_end)
+    parts.append(message[start:])
+    return str(b''.join(parts), 'latin1')
+
+
+def is_query(message):
+    """Whether a program message (possibly compound, ``;`` joined) is a query.
+
+    The message may be raw bytes, carrying binary blocks.
+    """
+    if isinstance(message, (bytes, bytearray)):
+        message = text_of(message)
+    return any(unit.split(None, 1)[0].endswith('?')
+               for unit in message.split(';') if unit.strip())
+
+
+class BlockResponse(object):
+    """A response which carries binary blocks, kept as the raw bytes.
+
+    It is relayed to the bridge clients as is, never decoded nor encoded.
+    """
+    __raw = None
+
+    def __init__(self, raw):
+        self.__raw = raw
+
+    def __len__(self):
+        return len(self.__raw)
+
+    def __str__(self):
+        return '<{0} byte binary response>'.format(len(self.__raw))
+
+    @property
+    def raw(self):
+        """The response (without termination), e.g. ``#41234<payload>``.
+
+        :type memoryview:
+        """
+        return memoryview(self.__raw)
+
+
+def send_raw_message(driver, message):
+    """Send a raw (bytes) program message to a local driver, terminated.
+    """
+    termination = getattr(driver, 'SEND_TERMINATION', '') or ''
+    data = bytes(message) + bytes(termination, 'ascii')
+    # a socket driver's ``raw_send`` may send only part of a large message:
+    sendall = getattr(getattr(driver, 'socket', None), 'sendall', None)
+    (sendall or driver.raw_send)(data)
+
+
+def recv_response(driver):
+    """Receive a response from a local driver, relaying any binary blocks.
+
+    The response is read at the raw level, so that a binary block payload is
+    received as is (straight into the response buffer, for a socket driver).
+    This bypasses the driver's own ``recv`` (and so any receive mixins), so
+    it is only used for responses which may carry blocks.
+
+    :returns: The text response, or the raw response if it carries blocks.
+    :type str or BlockResponse:
+    """
+    response, has_blocks = driver_message_reader(driver).read()
+    if response is None:
+        raise BridgeError('The device closed the connection.')
+    if has_blocks:
+        return BlockResponse(response)
+    return str(response, getattr(driver, 'ENCODING', 'ascii'))
+
+
+class FairQueue(object):
+    """A bounded queue which is fair between producers (clients).
+
+    Items are queued per client, and ``get`` serves the clients round-robin,
+    so a client which sends a flood of messages cannot starve the others.
+    Items of any one client are served in the order they were put.
+
+    The queue is bounded, so memory does not grow when clients produce
+    faster than the device consumes:
+        - per client, by watermarks: once a client has ``high_watermark``
+          items queued, its ``put`` blocks until it is down to
+          ``low_watermark`` items (the hysteresis avoids waking the producer
+          for every item served).
+        - in total, by ``max_length``: ``put`` blocks while the queue is full.
+    A blocked producer stops reading from its client, so the backpressure
+    reaches the client itself (through the TCP flow control).
+    """
+    __lock = None
+    __not_empty = None
+    __not_full = None
+    __queues = None  # client -> deque of items
+    __turns = None  # deque of clients with queued items, in serving order
+    __paused = None  # clients over their high watermark
+    __length = 0
+    __closed = False
+    __high_watermark = None
+    __low_watermark = None
+    __max_length = None
+
+    def __init__(self, high_watermark=None, low_watermark=None, max_length=None):
+        """Initialize the queue (``None`` means unbounded).
+
+        :param: high_watermark
+        :type int:
+        :description: The number of items a client may have queued.
+
+        :param: low_watermark
+        :type int:
+        :description: The number of items a paused client is let down to
+        (default: half of ``high_watermark``).
+
+        :param: max_length
+        :type int:
+        :description: The number of items which may be queued, in total.
+        """
+        if (high_watermark is not None) and (low_watermark is None):
+            low_watermark = high_watermark // 2
+        if (high_watermark is not None) and not (0 <= low_watermark < high_watermark):
+            raise ValueError('The low watermark must be below the high watermark.')
+        self.__lock = threading.Lock()
+        self.__not_empty = threading.Condition(self.__lock)
+        self.__not_full = threading.Condition(self.__lock)
+        self.__queues = OrderedDict()
+        self.__turns = deque()
+        self.__paused = set()
+        self.__high_watermark = high_watermark
+        self.__low_watermark = low_watermark
+        self.__max_length = max_length
+
+    def __len__(self):
+        return self.__length
+
+    @property
+    def high_watermark(self):
+        return self.__high_watermark
+
+    @property
+    def low_watermark(self):
+        return self.__low_watermark
+
+    @property
+    def max_length(self):
+        return self.__max_length
+
+    def depth(self, client):
+        """The number of items queued for a client.
+        """
+        queue = self.__queues.get(client)
+        return len(queue) if queue else 0
+
+    def __must_wait(self, client):
+        return ((client in self.__paused) or
+                ((self.__max_length is not None) and
+                 (self.__length >= self.__max_length)))
+
+    def put(self, client, item, timeout=None):
+        """Queue an item on behalf of a client, waiting for room if need be.
+
+        :param: timeout
+        :type float:
+        :description: How long to wait for room (``None``: for ever).
+
+        :raises: BridgeClosedError, BridgeOverloadError (no room in time)
+        """
+        with self.__not_full:
+            deadline = None if timeout is None else monotonic() + timeout
+            while self.__must_wait(client) and not self.__closed:
+                remaining = None if deadline is None else deadline - monotonic()
+                if (remaining is not None) and (remaining <= 0):
+                    raise BridgeOverloadError(
+                        'No room for the request of {0} ({1} queued).'.format(
+                            client, self.__length))
+                self.__not_full.wait(remaining)
+            if self.__closed:
+                raise BridgeClosedError('Queue is closed.')
+            queue = self.__queues.setdefault(client, deque())
+            if not queue:
+                self.__turns.append(client)
+            queue.append(item)
+            self.__length += 1
+            if (self.__high_watermark is not None) and \
+                    (len(queue) >= self.__high_watermark):
+                self.__paused.add(client)
+            self.__not_empty.notify()
+
+    def get(self, timeout=None):
+        """Take the next item, waiting for one if need be.
+
+        :returns: ``(client, item)``, or ``None`` on timeout.
+        :raises: BridgeClosedError (once closed AND empty)
+        """
+        with self.__not_empty:
+            while not self.__length:
+                if self.__closed:
+                    raise BridgeClosedError('Queue is closed.')
+                if not self.__not_empty.wait(timeout):
+                    return None
+            client = self.__turns.popleft()
+            queue = self.__queues[client]
+            item = queue.popleft()
+            if queue:
+                self.__turns.append(client)  # back of the line
+            else:
+                del self.__queues[client]
+            self.__length -= 1
+            if (client in self.__paused) and (len(queue) <= self.__low_watermark):
+                self.__paused.discard(client)
+                self.__not_full.notify_all()
+            elif (self.__max_length is not None) and \
+                    (self.__length == self.__max_length - 1):
+                self.__not_full.notify_all()
+            return client, item
+
+    def close(self):
+        """Refuse any more items; ``get`` still drains the queued items.
+        """
+        with self.__lock:
+            self.__closed = True
+            self.__not_empty.notify_all()
+            self.__not_full.notify_all()
+
+
+class BridgeRequest(object):
+    """A message from a bridge client to the local device.
+
+    For a query, the response (or the error) is available once the request
+    is complete, see ``wait``.
+
+    Instead of a message, a request may carry a ``function``, which is called
+    with the local driver (by the device worker) as ``function(driver)``; its
+    return value is the response.
+    """
+    __client = None
+    __message = None
+    __function = None
+    __is_query = None
+    __done = None
+    __callbacks = None
+
+    response = None
+    error = None
+    deadline = None  # (monotonic) time after which it is not to be served
+    # (monotonic) times the request was submitted, started and finished:
+    submitted = None
+    started = None
+    finished = None
+
+    def __init__(self, client, message, function=None):
+        self.submitted = monotonic()
+        self.__client = client
+        self.__message = message
+        self.__function = function
+        self.__is_query = (function is not None) or is_query(message)
+        self.__done = threading.Event()
+        self.__callbacks = []
+
+    def __repr__(self):
+        return "<BridgeRequest {0!r} from {1}>".format(self.__message,
+                                                       self.__client)
+
+    @property
+    def client(self):
+        return self.__client
+
+    @property
+    def message(self):
+        return self.__message
+
+    @property
+    def function(self):
+        return self.__function
+
+    @property
+    def is_query(self):
+        return self.__is_query
+
+    @property
+    def done(self):
+        return self.__done.is_set()
+
+    def complete(self, response=None, error=None):
+        """Record the outcome of the request, and wake any waiters.
+        """
+        self.response = response
+        self.error = error
+        self.__done.set()
+        for callback in self.__callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logging.error('%r: done callback failed: %s', self, e)
+
+    def add_done_callback(self, callback):
+        """Call ``callback(request)`` once the request is complete.
+
+        The callback is called from the thread which completes the request
+        (immediately, if the request is already complete).
+        """
+        if self.__done.is_set():
+            callback(self)
+        else:
+            self.__callbacks.append(callback)
+
+    def wait(self, timeout=None):
+        """Wait for the request to complete.
+
+        :returns: The response (``None`` for a non-query).
+        :raises: The error raised while serving the request.
+        """
+        if not self.__done.wait(timeout):
+            raise BridgeError('Timed out waiting for {0!r}.'.format(self))
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+#: Queries whose response never changes (for a given device), so they are
+#: answered from a cache once the device has answered them once.
+IMMUTABLE_QUERIES = frozenset(['*IDN?', '*OPT?', 'SYST:VERS?', 'SYSTEM:VERSION?'])
+
+#: Query headers (upper case endings) which change the device state, e.g. by
+#: clearing an event register or popping the error queue. Each of these
+#: queries must reach the device, so they are never shared. (``:EVENt`` is
+#: implied in ``STAT:QUES?`` and ``STAT:OPER?``, in short or long form.)
+DESTRUCTIVE_QUERY_HEADERS = ('*ESR?', 'ERR?', 'ERROR?', 'ERR:NEXT?',
+                             'ERROR:NEXT?', 'EVEN?', 'EVENT?',
+                             ':QUES?', ':QUESTIONABLE?', ':OPER?',
+                             ':OPERATION?')
+
+
+def query_key(message):
+    """The normalized form of a query, under which identical queries match.
+    """
+    return ' '.join(message.split()).lstrip(':')
+
+
+#: Query headers (upper case endings) whose responses may carry binary
+#: blocks (waveforms, setups, screen images, etc.); these responses are read
+#: at the raw level. Other queries go through the driver's own ``query``.
+BLOCK_QUERY_HEADERS = (':DATA?', ':DATA:ALL?', 'CURV?', 'CURVE?', ':SET?',
+                       ':SETUP?', ':IMAG?', ':IMAGE?')
+
+
+def expects_block(message):
+    """Whether any query of a (text) program message may return a block.
+    """
+    for unit in message.split(';'):
+        header = unit.split(None, 1)[0].upper() if unit.strip() else ''
+        if header.endswith(BLOCK_QUERY_HEADERS):
+            return True
+    return False
+
+
+def is_shareable(key):
+    """Whether every query in a (normalized) message may be shared.
+    """
+    for unit in key.split(';'):
+        header = unit.split(None, 1)[0].upper() if unit.strip() else ''
+        if header.endswith(DESTRUCTIVE_QUERY_HEADERS):
+            return False
+    return True
+
+
+class DeviceWorker(threading.Thread):
+    """The single owner of a local device driver within a bridge.
+
+    Requests from all clients are queued (see ``FairQueue``) and served one
+    at a time; the worker is the only thread which talks to the device.
+
+    A message may be raw bytes, carrying IEEE 488.2 definite length blocks;
+    it is sent as is. The responses to such messages, and to the queries of
+    ``BLOCK_QUERY_HEADERS``, are read at the raw level, and a response which
+    carries blocks is relayed as is (see ``BlockResponse``). Any other query
+    goes through the driver's ``query`` (and so its receive mixins: rate
+    limiting, error queue, etc.).
+
+    So that the device load grows with the number of distinct questions,
+    rather than with the number of clients:
+        - the responses to ``IMMUTABLE_QUERIES`` are cached (permanently).
+        - a query which is identical to one already queued (or being served)
+          for another client is NOT queued; it shares the response of the
+          other (``single flight``). A client only shares a query if none of
+          its own commands is outstanding, so it never sees a response which
+          predates its own commands. A client never shares its own queries
+          (each of its repeated queries is a new reading), and destructive
+          queries are never shared.
+
+    So that memory and latency stay predictable under overload, the queue is
+    bounded (see ``FairQueue``): ``submit`` blocks a client which is too far
+    ahead of the device. A request which has waited in the queue beyond its
+    deadline is rejected (``DeadlineExceededError``) without reaching the
+    device.
+    """
+    __driver = None
+    __queue = None
+    __raw_responses = False
+    __lock = None
+    __response_cache = None  # query key -> response
+    __in_flight = None  # query key -> the queued (or served) request
+    __outstanding = None  # client -> number of commands not yet served
+    __cache_hits = 0
+    __shared = 0
+
+    __deadline = None
+    __metrics = None
+    __device = None
+
+    #: The defaults for the queue bounds.
+    HIGH_WATERMARK = 64
+    LOW_WATERMARK = 16
+    MAX_QUEUE_LENGTH = 1024
+
+    def __init__(self, driver, name=None, cache_responses=True,
+                 single_flight=True, high_watermark=HIGH_WATERMARK,
+                 low_watermark=LOW_WATERMARK, max_queue_length=MAX_QUEUE_LENGTH,
+                 deadline=None, metrics=None, device=None):
+        """Initialize the worker (it must then be started with ``start``).
+
+        :param: cache_responses
+        :type bool:
+        :description: Cache the responses to ``IMMUTABLE_QUERIES``.
+
+        :param: single_flight
+        :type bool:
+        :description: Share identical in-flight queries between clients.
+
+        :param: high_watermark, low_watermark
+        :type int:
+        :description: The per client queue bounds, see ``FairQueue``.
+
+        :param: max_queue_length
+        :type int:
+        :description: The bound on the requests queued, in total.
+
+        :param: deadline
+        :type float:
+        :description: How long (seconds) a request may wait in the queue
+        before it is rejected (``None``: for ever).
+
+        :param: metrics
+        :type BridgeMetrics:
+        :description: Where to record the device metrics (optional).
+
+        :param: device
+        :type str:
+        :description: The device name, in the metrics (default: the name of
+        the driver).
+        """
+        super().__init__(name=name or 'bridge-worker', daemon=True)
+        self.__driver = driver
+        self.__queue = FairQueue(high_watermark=high_watermark,
+                                 low_watermark=low_watermark,
+                                 max_length=max_queue_length)
+        self.__deadline = deadline
+        self.__device = device or getattr(driver, 'name', None) or self.name
+        self.__metrics = metrics
+        if metrics is not None:
+            metrics.register_device(self.__device, self)
+        # responses which may carry blocks are read raw, when possible:
+        self.__raw_responses = (hasattr(driver, 'raw_recv') and
+                                bool(getattr(driver, 'RECV_TERMINATION', '')))
+        self.__lock = threading.Lock()
+        self.__response_cache = {} if cache_responses else None
+        self.__in_flight = {} if single_flight else None
+        self.__outstanding = {}
+
+    @property
+    def driver(self):
+        return self.__driver
+
+    @property
+    def device(self):
+        """The device name (in the metrics).
+        """
+        return self.__device
+
+    @property
+    def queue_depth(self):
+        """The number of requests waiting to be served.
+        """
+        return len(self.__queue)
+
+    @property
+    def queue(self):
+        """The (bounded) queue of requests.
+
+        :type FairQueue:
+        """
+        return self.__queue
+
+    @property
+    def cache_hits(self):
+        """The number of queries answered from the response cache.
+        """
+        return self.__cache_hits
+
+    @property
+    def shared(self):
+        """The number of queries which shared an in-flight query.
+        """
+        return self.__shared
+
+    def clear_response_cache(self):
+        """Forget the cached responses (e.g. after a firmware update).
+        """
+        with self.__lock:
+            if self.__response_cache is not None:
+                self.__response_cache.clear()
+
+    def submit(self, client, message, function=None, timeout=None):
+        """Queue a message (or function) from a client for the device.
+
+        The request may instead be answered from the response cache, or share
+        an identical in-flight query; either way, it completes as usual.
+
+        :param: timeout
+        :type float:
+        :description: How long to wait for room in the queue, if the client
+        is over its high watermark (or the queue is full).
+
+        :returns: The queued request.
+        :type BridgeRequest:
+        :raises: BridgeOverloadError, BridgeClosedError
+        """
+        request = BridgeRequest(client, message, function=function)
+        key = None
+        if (function is None) and isinstance(message, str) and request.is_query:
+            key = query_key(message)
+        with self.__lock:
+            if key is not None:
+                cache = self.__response_cache
+                if (cache is not None) and (key.upper() in cache):
+                    self.__cache_hits += 1
+                    request.complete(response=cache[key.upper()])
+                    return request
+                leader = (self.__in_flight or {}).get(key)
+                if (leader is not None) and (leader.client != client) and \
+                        not self.__outstanding.get(client):
+                    # the leader is removed from ``in_flight`` BEFORE it
+                    # completes, so it cannot complete in between.
+                    self.__shared += 1
+                    leader.add_done_callback(lambda r: request.complete(
+                        response=r.response, error=r.error))
+                    return request
+            # book-keeping BEFORE queueing, as the request may be served at once:
+            if key is None:
+                # a command (or function) which may change the device state
+                self.__outstanding[client] = self.__outstanding.get(client, 0) + 1
+            elif (self.__in_flight is not None) and is_shareable(key):
+                self.__in_flight[key] = request
+        if self.__deadline is not None:
+            request.deadline = monotonic() + self.__deadline
+        try:
+            # (may block: NOT holding the lock, which the worker needs)
+            self.__queue.put(client, request, timeout=timeout)
+        except BridgeError as e:
+            self.__served(request, None, e)
+            request.complete(error=e)  # and any requests sharing it
+            raise
+        return request
+
+    def __served(self, request, response, error):
+        """Book-keeping for a served request (BEFORE it is completed).
+        """
+        client = request.client
+        with self.__lock:
+            if (request.function is not None) or not isinstance(request.message, str) \
+                    or not request.is_query:
+                count = self.__outstanding.get(client, 0) - 1
+                if count > 0:
+                    self.__outstanding[client] = count
+                else:
+                    self.__outstanding.pop(client, None)
+                return
+            key = query_key(request.message)
+            if (self.__in_flight is not None) and (self.__in_flight.get(key) is request):
+                del self.__in_flight[key]
+            if (self.__response_cache is not None) and (error is None) and \
+                    isinstance(response, str) and (key.upper() in IMMUTABLE_QUERIES):
+                self.__response_cache[key.upper()] = response
+
+    def _serve(self, request):
+        """Pass one request to the device, and return the response.
+        """
+        driver = self.__driver
+        # the driver may also be in use locally; respect its lock.
+        lock = getattr(driver, '_lock', None) or _NULL_LOCK
+        with lock:
+            if request.function is not None:
+                return request.function(driver)
+            message = request.message
+            if isinstance(message, (bytes, bytearray)):
+                send_raw_message(driver, message)  # carries binary blocks
+            else:
+                if request.is_query and not (self.__raw_responses and
+                                             expects_block(message)):
+                    return driver.query(message)
+                driver.send(message)
+            if request.is_query:
+                return recv_response(driver)
+
+    def run(self):
+        while True:
+            try:
+                entry = self.__queue.get()
+            except BridgeClosedError:
+                return
+            if entry is None:
+                continue
+            client, request = entry
+            request.started = monotonic()
+            expired = (request.deadline is not None) and \
+                      (request.started > request.deadline)
+            try:
+                if expired:
+                    raise DeadlineExceededError(
+                        'Rejected {0!r}: waited beyond its deadline.'.format(request))
+                response = self._serve(request)
+            except Exception as e:
+                logging.error('%s: %r failed: %s', self.name, request, e)
+                request.finished = monotonic()
+                self.__served(request, None, e)
+                request.complete(error=e)
+            else:
+                request.finished = monotonic()
+                self.__served(request, response, None)
+                request.complete(response=response)
+            if self.__metrics is not None:
+                self.__metrics.device_served(self.__device, request,
+                    queue_depth=len(self.__queue) + 1, expired=expired)
+
+    def stop(self, timeout=None):
+        """Stop, once the queued requests have been served.
+        """
+        self.__queue.close()
+        if self.is_alive() and (threading.current_thread() is not self):
+            self.join(timeout)
+
+
+class _NullLock(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+_NULL_LOCK = _NullLock()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""sindri.bridges.gateway
+
+    A gateway: many local devices, served to TCP clients behind ONE port.
+
+    Each device has its own ``DeviceWorker`` (and thread), so a slow device
+    (e.g. on a serial link) never stalls the others. A message is routed to
+    a device by name, with an ``@<name>`` prefix::
+
+        @psu1 VOLT 3.3
+        @psu1 MEAS:CURR?
+        @bert DET:BER?
+
+    A line holding only ``@<name>`` selects the device for the following
+    unprefixed messages of that connection; the query ``@?`` lists the
+    device names (comma separated).
+
+    Example (on the rack PC)::
+
+        >>>gateway = Gateway({'psu1': E3631A_Serial('/dev/ttyUSB0'),
+        ...                   'psu2': E3631A_Serial('/dev/ttyUSB1'),
+        ...                   'atten': CLE1000_Serial('/dev/ttyUSB2')}, port=5025)
+        >>>gateway.serve_forever()
+
+    :copyright: 2013 by Sindri Authors, see AUTHORS for more details.
+    :license: LGPL, see LICENSE for more details.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+from .common import BridgeError, BridgeRequest, DeviceWorker, is_query
+from .scpi import TCPHandler, BridgeBase
+
+
+class UnknownDeviceError(BridgeError):
+    pass
+
+
+class GatewayHandler(TCPHandler):
+    """Serves one gateway client connection, routing each message by name.
+    """
+    PREFIX = '@'
+    CATALOG_QUERY = '@?'
+
+    __default = None  # the device selected for unprefixed messages
+
+    def __parse(self, message):
+        """Split a message into its device name (or None) and program message.
+        """
+        if isinstance(message, (bytes, bytearray)):
+            if not message.startswith(bytes(self.PREFIX, self.ENCODING)):
+                return None, message
+            name, _, message = bytes(message[1:]).partition(b' ')
+            return str(name, self.ENCODING), message.lstrip()
+        if not message.startswith(self.PREFIX):
+            return None, message
+        name, _, message = message[1:].partition(' ')
+        return name, message.strip()
+
+    def _device_message(self, message):
+        if message == self.CATALOG_QUERY:
+            return message
+        return self.__parse(message)[1]
+
+    def _submit(self, message):
+        gateway = self.server.bridge
+        client = self.client_address
+        if message == self.CATALOG_QUERY:
+            request = BridgeRequest(client, message)
+            request.complete(response=','.join(gateway.names))
+            return request
+        name, message = self.__parse(message)
+        if name is None:
+            name = self.__default
+            if (name is None) and (len(gateway.names) == 1):
+                name = gateway.names[0]
+        elif not message:
+            # ``@<name>`` alone: select the device for this connection.
+            if name not in gateway.names:
+                logging.warning("%s selected an unknown device '%s'",
+                                client[0], name)
+            self.__default = name
+            return None
+        try:
+            if name is None:
+                raise UnknownDeviceError('No device selected.')
+            return gateway.worker(name).submit(client, message,
+                                               timeout=self.SUBMIT_TIMEOUT)
+        except UnknownDeviceError as e:
+            if not is_query(message):
+                logging.warning('%s: dropped %r: %s', client[0], message, e)
+                return None
+            # the client must not be left waiting for a response:
+            request = BridgeRequest(client, message)
+            request.complete(error=e)
+            return request
+
+
+class Gateway(BridgeBase):
+    """Many local devices, served to TCP clients behind one port.
+
+    Devices may be added and removed while serving.
+    """
+    __workers = None  # name -> DeviceWorker
+    __worker_options = None
+    __lock = None
+
+    def __init__(self, drivers=(), host='', port=5025, handler=GatewayHandler,
+                 **worker_options):
+        """Initialize the gateway.
+
+        :param: drivers
+        :type dict or sequence:
+        :description: The local drivers, keyed by device name (or a sequence
+        of drivers, named by their ``name`` attribute).
+
+        :param: worker_options
+        :description: Passed to each ``DeviceWorker`` (queue bounds, etc.).
+        """
+        self.__workers = OrderedDict()
+        self.__worker_options = worker_options
+        self.__lock = threading.Lock()
+        if not hasattr(drivers, 'items'):
+            drivers = OrderedDict((driver.name, driver) for driver in drivers)
+        super().__init__(host=host, port=port, handler=handler)
+        for name, driver in drivers.items():
+            self.add(name, driver)
+
+    @property
+    def names(self):
+        """The names of the devices served.
+        """
+        return list(self.__workers.keys())
+
+    def worker(self, name):
+        """The device worker of a named device.
+
+        :raises: UnknownDeviceError
+        """
+        try:
+            return self.__workers[name]
+        except KeyError:
+            raise UnknownDeviceError("No device named '{0}'.".format(name))
+
+    def add(self, name, driver):
+        """Serve another local device, under the given name.
+        """
+        if (not name) or (' ' in name):
+            raise ValueError("Invalid device name: '{0}'.".format(name))
+        with self.__lock:
+            if name in self.__workers:
+                raise ValueError("A device named '{0}' is served already.".format(name))
+            worker = DeviceWorker(driver, name='bridge-worker:{0}'.format(name),
+                                  metrics=self.metrics, device=name,
+                                  **self.__worker_options)
+            worker.start()
+            self.__workers[name] = worker
+
+    def remove(self, name, timeout=None):
+        """Stop serving a device (once its queued requests are served).
+
+        :returns: The local driver.
+        """
+        with self.__lock:
+            worker = self.__workers.pop(name)
+        worker.stop(timeout)
+        return worker.driver
+
+    def _stop_workers(self):
+        for name in self.names:
+            self.remove(name)
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""sindri.bridges.metrics
+
+    Counters and latency histograms of a bridge, per client and per device,
+    so that slowness can be put down to the network, to the bridge queueing,
+    or to the instrument itself:
+        - ``queue_wait``: from the request being queued, to the device worker
+          taking it (bridge queueing).
+        - ``service``: the device worker talking to the device (instrument).
+        - ``latency``: from the message being read from the client, to the
+          response being written to the client (end-to-end, in the bridge).
+    The network time is what a client sees, less ``latency``.
+
+    Example::
+
+        >>>bridge = BridgeFactory(inst)(port=5025).start()
+        >>>MetricsServer(bridge.metrics, port=9025).start()
+        >>># curl http://localhost:9025/metrics.json (or /metrics, for text)
+        >>>bridge.metrics.start_dump(60.0)  # or, log a dump every minute
+
+    :copyright: 2013 by Sindri Authors, see AUTHORS for more details.
+    :license: LGPL, see LICENSE for more details.
+"""
+
+import json
+import logging
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+class LatencyHistogram(object):
+    """A histogram of durations, in logarithmic (power of 2) buckets.
+
+    The buckets span 10 us to about 84 s; anything longer is counted in an
+    overflow bucket. Recording is O(log(buckets)), and the memory used is
+    fixed.
+    """
+    #: The upper bound (seconds) of each bucket but the overflow bucket.
+    BOUNDS = tuple(10e-6 * 2**k for k in range(24))
+
+    __counts = None
+    __count = 0
+    __sum = 0.0
+    __min = None
+    __max = None
+
+    def __init__(self):
+        self.__counts = [0] * (len(self.BOUNDS) + 1)
+
+    @property
+    def count(self):
+        return self.__count
+
+    def record(self, duration):
+        """Count one duration (seconds). Not thread safe; see ``BridgeMetrics``.
+        """
+        self.__counts[bisect_left(self.BOUNDS, duration)] += 1
+        self.__count += 1
+        self.__sum += duration
+        if (self.__min is None) or (duration < self.__min):
+            self.__min = duration
+        if (self.__max is None) or (duration > self.__max):
+            self.__max = duration
+
+    def percentile(self, percent):
+        """An estimate (the bucket upper bound) of a percentile, or ``None``.
+        """
+        if not self.__count:
+            return None
+        rank = percent / 100.0 * self.__count
+        seen = 0
+        for bound, count in zip(self.BOUNDS, self.__counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.__max)
+        return self.__max
+
+    def as_dict(self):
+        """The summary statistics, and the (non-empty) buckets.
+
+        :type dict:
+        """
+        return OrderedDict([
+            ('count', self.__count),
+            ('mean', self.__sum / self.__count if self.__count else None),
+            ('min', self.__min),
+            ('max', self.__max),
+            ('p50', self.percentile(50)),
+            ('p90', self.percentile(90)),
+            ('p99', self.percentile(99)),
+            ('buckets', OrderedDict(
+                ('le {0:.6g}'.format(bound) if bound is not None else 'overflow', count)
+                for (bound, count) in zip(self.BOUNDS + (None,), self.__counts)
+                if count)),
+        ])
+
+
+class _Stats(object):
+    """The counters and histograms of one client, or one device.
+    """
+    COUNTERS = ()
+    HISTOGRAMS = ()
+
+    def __init__(self):
+        self.counters = OrderedDict((name, 0) for name in self.COUNTERS)
+        self.histograms = OrderedDict((name, LatencyHistogram())
+                                      for name in self.HISTOGRAMS)
+
+    def as_dict(self):
+        result = OrderedDict(self.counters)
+        for name, histogram in self.histograms.items():
+            result[name] = histogram.as_dict()
+        return result
+
+
+class ClientStats(_Stats):
+    COUNTERS = ('requests', 'replies', 'errors', 'rejected', 'bytes_in', 'bytes_out')
+    HISTOGRAMS = ('latency',)
+
+
+class DeviceStats(_Stats):
+    COUNTERS = ('requests', 'errors', 'expired', 'bytes_in', 'bytes_out',
+                'max_queue_depth')
+    HISTOGRAMS = ('queue_wait', 'service')
+
+    worker = None  # for the gauges (queue depth, etc.)
+
+    def as_dict(self):
+        result = super().as_dict()
+        if self.worker is not None:
+            result['queue_depth'] = self.worker.queue_depth
+            result['cache_hits'] = self.worker.cache_hits
+            result['shared'] = self.worker.shared
+        return result
+
+
+class BridgeMetrics(object):
+    """The metrics of one bridge (thread safe).
+
+    The bridge handlers record the client side (``client_request``,
+    ``client_reply``), and the device workers the device side
+    (``device_served``).
+    """
+    __lock = None
+    __clients = None  # client -> ClientStats
+    __devices = None  # device name -> DeviceStats
+    __dump_thread = None
+    __dump_stop = None
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__clients = OrderedDict()
+        self.__devices = OrderedDict()
+
+    @staticmethod
+    def client_key(client):
+        """The host, for a ``(host, port)`` client address.
+
+        The connections of a host are counted together, so the metrics do not
+        grow with the number of connections made over time.
+        """
+        if isinstance(client, tuple):
+            return str(client[0])
+        return str(client)
+
+    def __client(self, client):
+        key = self.client_key(client)
+        stats = self.__clients.get(key)
+        if stats is None:
+            stats = self.__clients[key] = ClientStats()
+        return stats
+
+    def __device(self, device):
+        stats = self.__devices.get(device)
+        if stats is None:
+            stats = self.__devices[device] = DeviceStats()
+        return stats
+
+    def register_device(self, device, worker):
+        """Report the gauges of a device worker (queue depth, etc.).
+        """
+        with self.__lock:
+            self.__device(device).worker = worker
+
+    def client_request(self, client, size):
+        """A message (of ``size`` bytes) was read from a client.
+        """
+        with self.__lock:
+            counters = self.__client(client).counters
+            counters['requests'] += 1
+            counters['bytes_in'] += size
+
+    def client_reply(self, client, size, latency, error=False):
+        """A response (of ``size`` bytes) was written to a client, ``latency``
+        seconds after the message was read.
+        """
+        with self.__lock:
+            stats = self.__client(client)
+            stats.counters['replies'] += 1
+            stats.counters['bytes_out'] += size
+            if error:
+                stats.counters['errors'] += 1
+            stats.histograms['latency'].record(latency)
+
+    def client_rejected(self, client):
+        """A message from a client was rejected (no room in the queue).
+        """
+        with self.__lock:
+            self.__client(client).counters['rejected'] += 1
+
+    def device_served(self, device, request, queue_depth=0, expired=False):
+        """A device worker has served (or rejected) a request.
+
+        :type request: BridgeRequest
+        """
+        with self.__lock:
+            stats = self.__device(device)
+            counters = stats.counters
+            counters['requests'] += 1
+            if request.function is None:
+                counters['bytes_in'] += len(request.message)
+                if request.response is not None:
+                    counters['bytes_out'] += len(request.response)
+            if expired:
+                counters['expired'] += 1
+            elif request.error is not None:
+                counters['errors'] += 1
+            counters['max_queue_depth'] = max(counters['max_queue_depth'],
+                                              queue_depth)
+            if request.started is not None:
+                stats.histograms['queue_wait'].record(
+                    request.started - request.submitted)
+                if request.finished is not None:
+                    stats.histograms['service'].record(
+                        request.finished - request.started)
+
+    def snapshot(self):
+        """All of the metrics, as plain data (see ``to_json``).
+
+        :type dict:
+        """
+        with self.__lock:
+            return OrderedDict([
+                ('clients', OrderedDict((key, stats.as_dict())
+                                        for (key, stats) in self.__clients.items())),
+                ('devices', OrderedDict((key, stats.as_dict())
+                                        for (key, stats) in self.__devices.items())),
+            ])
+
+    def to_json(self, indent=None):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_text(self):
+        """The metrics, one ``<scope> <name> <metric> <value>`` per line.
+        """
+        lines = []
+        for scope, entries in self.snapshot().items():
+            for name, metrics in entries.items():
+                for metric, value in metrics.items():
+                    if isinstance(value, dict):
+                        for stat, stat_value in value.items():
+                            if stat != 'buckets':
+                                lines.append('{0} {1} {2}.{3} {4}'.format(
+                                    scope, name, metric, stat, stat_value))
+                    else:
+                        lines.append('{0} {1} {2} {3}'.format(
+                            scope, name, metric, value))
+        return '\n'.join(lines) + '\n'
+
+    def start_dump(self, interval, dump=None):
+        """Dump the metrics periodically, from a background thread.
+
+        :param: interval
+        :type float:
+        :description: Seconds between dumps.
+
+        :param: dump
+        :type callable:
+        :description: Called with the JSON text (default: log it, at INFO).
+        """
+        if dump is None:
+            dump = lambda text: logging.info('bridge metrics: %s', text)
+        self.stop_dump()
+        self.__dump_stop = threading.Event()
+
+        def run(stop=self.__dump_stop):
+            while not stop.wait(interval):
+                try:
+                    dump(self.to_json())
+                except Exception as e:
+                    logging.warning('Metrics dump failed: %s', e)
+
+        self.__dump_thread = threading.Thread(target=run, name='bridge-metrics',
+                                              daemon=True)
+        self.__dump_thread.start()
+
+    def stop_dump(self):
+        if self.__dump_thread is not None:
+            self.__dump_stop.set()
+            self.__dump_thread.join()
+            self.__dump_thread = None
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        metrics = self.server.metrics
+        if self.path.rstrip('/') == '/metrics.json':
+            body, content_type = metrics.to_json(indent=1), 'application/json'
+        elif self.path.rstrip('/') in ('', '/metrics'):
+            body, content_type = metrics.to_text(), 'text/plain'
+        else:
+            self.send_error(404)
+            return
+        body = bytes(body, 'utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug('metrics: ' + format, *args)
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    """A lightweight (local) HTTP endpoint for bridge metrics.
+
+    ``GET /metrics`` gives text, and ``GET /metrics.json`` gives JSON.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    metrics = None
+    __thread = None
+
+    def __init__(self, metrics, host='127.0.0.1', port=9025):
+        self.metrics = metrics
+        super().__init__((host, port), _MetricsHandler)
+
+    def start(self):
+        """Serve from a background thread.
+        """
+        self.__thread = threading.Thread(target=self.serve_forever,
+                                         name='bridge-metrics-server', daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
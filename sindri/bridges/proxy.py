@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""sindri.bridges.proxy
+
+    Remote proxy drivers: the Feats, DictFeats and Actions of a driver class,
+    mirrored over a Feat level bridge (see ``sindri.bridges.rpc``), with no
+    hand-written TCP variant of the driver.
+
+    Example (on the remote machine)::
+
+        >>>E3631A_Remote = proxy_class(E3631A_Serial)  # the served class
+        >>>inst = E3631A_Remote('bench-pc', port=5025)
+        >>>inst.idn  # read once, then served from the client-side cache
+        >>>inst.voltage['P6V'] = Q_(3.3, 'V')
+        >>>with inst.batch(prefetch=[('voltage', 'P6V'), ('current', 'P6V')]):
+        ...    inst.output_enabled = True   # (sent once, at the end)
+        ...    inst.voltage['P6V'], inst.current['P6V']  # (one round trip)
+
+    The proxy class may also be built from the description the bridge gives
+    of the served driver, if the driver class is not at hand::
+
+        >>>inst = RemoteDriver.connect('bench-pc', port=5025)
+
+    :copyright: 2013 by Sindri Authors, see AUTHORS for more details.
+    :license: LGPL, see LICENSE for more details.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .rpc import DriverInterface, RPCClient
+
+
+def _spec(name, key=None):
+    return name if key is None else (name, key)
+
+
+class RemoteDictFeat(object):
+    """The item access of a DictFeat of a remote driver.
+    """
+    __proxy = None
+    __name = None
+    __keys = None
+
+    def __init__(self, proxy, name, keys=None):
+        self.__proxy = proxy
+        self.__name = name
+        self.__keys = keys
+
+    @property
+    def keys(self):
+        """The valid keys (if the DictFeat restricts them).
+        """
+        return self.__keys
+
+    def __getitem__(self, key):
+        return self.__proxy._get(self.__name, key)
+
+    def __setitem__(self, key, value):
+        self.__proxy._set(self.__name, key, value)
+
+
+class RemoteDriver(object):
+    """Base class of the remote proxy drivers.
+
+    **Client-side cache:** the value of a ``read_once`` Feat is read from the
+    bridge once, and then served locally.
+
+    **Batches:** within ``batch``, Feat settings are coalesced, and sent in
+    ONE request (before any read or Action call, so the order of operations
+    is kept); Feats named in ``prefetch`` are read in ONE request, and served
+    locally until the end of the batch.
+
+    .. seealso: proxy_class
+    """
+    #: The description of the mirrored driver (see ``DriverInterface.describe``).
+    _description = None
+
+    __client = None
+    __read_once = None  # names of read_once (Dict)Feats
+    __cache = None  # spec -> value, of read_once (Dict)Feats
+    __batch_depth = 0
+    __pending_sets = None  # spec -> value (ordered)
+    __prefetched = None  # spec -> value
+
+    def __init__(self, host=None, port=5025, timeout=None, client=None):
+        """Connect to a Feat level bridge.
+
+        :param: client
+        :type RPCClient:
+        :description: An already connected client (instead of host/port).
+        """
+        if client is None:
+            client = RPCClient(host, port=port, timeout=timeout)
+        self.__client = client
+        description = self._description
+        self.__read_once = frozenset(
+            name for group in ('feats', 'dict_feats')
+            for (name, feat) in description[group].items()
+            if feat.get('read_once'))
+        self.__cache = {}
+        self.__pending_sets = OrderedDict()
+        self.__prefetched = {}
+
+    @classmethod
+    def connect(cls, host, port=5025, timeout=None):
+        """Connect to a bridge, mirroring whatever driver it serves.
+        """
+        client = RPCClient(host, port=port, timeout=timeout)
+        try:
+            proxy = proxy_class_from_description(client.describe())
+        except Exception:
+            client.close()
+            raise
+        return proxy(client=client)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.finalize()
+
+    @property
+    def client(self):
+        """The client of the bridge.
+
+        :type RPCClient:
+        """
+        return self.__client
+
+    def initialize(self):
+        pass  # connected on construction; for symmetry with local drivers.
+
+    def finalize(self):
+        """Send any pending settings, and disconnect.
+        """
+        try:
+            self.flush()
+        finally:
+            self.__client.close()
+
+    def invalidate_cache(self):
+        """Forget the values of the ``read_once`` Feats.
+        """
+        self.__cache.clear()
+
+    def flush(self):
+        """Send the pending (batched) Feat settings, in one request.
+        """
+        if self.__pending_sets:
+            items = list(self.__pending_sets.items())
+            self.__pending_sets.clear()
+            self.__client.set_many(items)
+
+    def _get(self, name, key=None):
+        spec = _spec(name, key)
+        if spec in self.__cache:
+            return self.__cache[spec]
+        if spec in self.__prefetched:
+            return self.__prefetched[spec]
+        self.flush()
+        value = self.__client.get(spec)
+        if name in self.__read_once:
+            self.__cache[spec] = value
+        return value
+
+    def _set(self, name, key, value):
+        spec = _spec(name, key)
+        self.__prefetched.pop(spec, None)
+        if name in self.__read_once:
+            self.__cache[spec] = value
+        if self.__batch_depth:
+            self.__pending_sets.pop(spec, None)  # (the latest goes last)
+            self.__pending_sets[spec] = value
+        else:
+            self.__client.set(spec, value)
+
+    def _call(self, name, *args, **kwargs):
+        self.flush()
+        self.__prefetched.clear()  # an Action may change anything
+        return self.__client.call(name, *args, **kwargs)
+
+    def get_many(self, feats, max_age=None):
+        """Get many (Dict)Feats, in (at most) one round trip.
+
+        :param: feats
+        :type list:
+        :description: Feat names, or ``(name, key)`` pairs for DictFeats.
+
+        :returns: The values, keyed by feat.
+        :type OrderedDict:
+        """
+        specs = [spec if isinstance(spec, str) else tuple(spec) for spec in feats]
+        missing = [spec for spec in specs
+                   if (spec not in self.__cache) and (spec not in self.__prefetched)]
+        if missing:
+            self.flush()
+            for spec, value in self.__client.get_many(missing, max_age=max_age).items():
+                if (spec if isinstance(spec, str) else spec[0]) in self.__read_once:
+                    self.__cache[spec] = value
+                self.__prefetched[spec] = value
+        values = OrderedDict((spec, self.__cache[spec] if spec in self.__cache
+                                    else self.__prefetched[spec])
+                             for spec in specs)
+        if not self.__batch_depth:
+            self.__prefetched.clear()
+        return values
+
+    def set_many(self, values):
+        """Set many (Dict)Feats, in one round trip (in order).
+        """
+        if hasattr(values, 'items'):
+            values = values.items()
+        for spec, value in values:
+            if isinstance(spec, str):
+                self._set(spec, None, value)
+            else:
+                self._set(spec[0], spec[1], value)
+        if not self.__batch_depth:
+            self.flush()
+
+    @contextmanager
+    def batch(self, prefetch=()):
+        """Coalesce the Feat settings (and, optionally, reads) of a block.
+
+        :param: prefetch
+        :type list:
+        :description: (Dict)Feats to read up front, in one round trip; they
+        are then served locally until the end of the batch.
+        """
+        self.__batch_depth += 1
+        try:
+            if prefetch:
+                self.get_many(prefetch)
+            yield self
+            if self.__batch_depth == 1:
+                self.flush()
+        finally:
+            self.__batch_depth -= 1
+            if not self.__batch_depth:
+                self.__pending_sets.clear()  # (unsent, if the block raised)
+                self.__prefetched.clear()
+
+
+def _feat_property(name, description):
+    def fget(self):
+        return self._get(name)
+
+    def fset(self, value):
+        self._set(name, None, value)
+
+    doc = description.get('doc') or "Remote Feat ``{0}``.".format(name)
+    return property(fget, None if description.get('readonly') else fset,
+                    doc=doc)
+
+
+def _dict_feat_property(name, description):
+    def fget(self):
+        return RemoteDictFeat(self, name, description.get('keys'))
+
+    doc = description.get('doc') or "Remote DictFeat ``{0}``.".format(name)
+    return property(fget, doc=doc)
+
+
+def _action_method(name, description):
+    def action(self, *args, **kwargs):
+        return self._call(name, *args, **kwargs)
+
+    action.__name__ = name
+    action.__doc__ = description.get('doc') or "Remote Action ``{0}``.".format(name)
+    return action
+
+
+def proxy_class_from_description(description, name=None):
+    """Build a proxy driver class from a driver description.
+
+    .. seealso: DriverInterface.describe
+    """
+    attributes = {'_description': description}
+    members = [(_feat_property, description['feats']),
+               (_dict_feat_property, description['dict_feats']),
+               (_action_method, description['actions'])]
+    for make, group in members:
+        for member, member_description in group.items():
+            if hasattr(RemoteDriver, member):
+                raise ValueError("'{0}' of {1} clashes with the proxy driver "
+                                 "API.".format(member, description['driver']))
+            attributes[member] = make(member, member_description)
+    name = name or '{0}_Remote'.format(description['driver'])
+    return type(name, (RemoteDriver,), attributes)
+
+
+_proxy_classes = {}
+
+
+def proxy_class(driver_class):
+    """The proxy driver class which mirrors a (local) driver class.
+
+    The proxy class is built once per driver class.
+
+    :type driver_class: a Lantz driver class, e.g. ``E3631A_Serial``. Use the
+    concrete (transport) class: the kernel classes (``E3631A``) lack the
+    Feats of the mixins (``idn``, etc.).
+    """
+    proxy = _proxy_classes.get(driver_class)
+    if proxy is None:
+        proxy = proxy_class_from_description(DriverInterface(driver_class).describe())
+        _proxy_classes[driver_class] = proxy
+    return proxy
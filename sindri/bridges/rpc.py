@@ -0,0 +1,725 @@
+# -*- coding: utf-8 -*-
+"""sindri.bridges.rpc
+
+    Feat level bridges: the server hosts a full Sindri driver instance, and
+    remote clients get and set its Feats (and call its Actions) by name.
+
+    A message level bridge costs a remote client one network round trip per
+    Feat. Here, a client asks for any number of Feats in ONE request
+    (``get_many``), which the server serves locally, in one go, on the device
+    worker; a remote dashboard can read 50 Feats in one round trip.
+
+    Example (on the machine with the local device)::
+
+        >>>inst = E3631A_Serial('/dev/ttyUSB0')
+        >>>inst.initialize()
+        >>>bridge = RPCBridge(inst, port=5025)
+        >>>bridge.serve_forever()  # or ``bridge.start()`` for a background thread
+
+    Example (on the remote machine)::
+
+        >>>client = RPCClient('bench-pc', port=5025)
+        >>>client.get_many(['idn', ('voltage', 'P6V'), ('current', 'P6V')])
+        >>>client.set_many({('voltage', 'P6V'): Q_(3.3, 'V'), 'output_enabled': True})
+        >>>client.call('reset')
+
+    A Feat is named by its attribute name; a DictFeat item by a pair
+    ``(name, key)``.
+
+    The protocol is framed binary: each frame is a header (``FRAME_HEADER``:
+    opcode, request id, payload length, blob length), a JSON payload and a
+    (possibly empty) blob of raw bytes. Quantities are carried as
+    ``{"$q": [magnitude, units]}``; bytes and NumPy arrays are carried in the
+    blob, referenced from the payload by offset and length, so bulk data is
+    never text encoded.
+
+    A client on the same host as the bridge negotiates (``OP_ATTACH``) a
+    shared memory segment (see ``sindri.bridges.shm``): large blobs then go
+    through it, and the frame (flagged ``FLAG_SHM``) only carries their
+    location; NumPy arrays are received as views of the shared memory.
+
+    :copyright: 2013 by Sindri Authors, see AUTHORS for more details.
+    :license: LGPL, see LICENSE for more details.
+"""
+
+import json
+import logging
+import socket, socketserver
+import threading
+import struct
+from collections import OrderedDict
+from time import monotonic
+
+import numpy as np
+from lantz import Feat, DictFeat, Action, Q_
+from lantz.feat import MISSING
+
+from .common import BridgeError, BridgeClosedError, BridgeOverloadError
+from .scpi import Bridge
+from .shm import (SHM_THRESHOLD, SHM_RING_SIZE, RING_LOCATION,
+                  SharedMemoryChannel, shared_memory_available)
+
+
+#: opcode, request id, payload (JSON) length, blob length
+FRAME_HEADER = struct.Struct('!BIII')
+
+OP_REPLY = 0x00
+OP_ERROR = 0x01
+OP_DESCRIBE = 0x10
+OP_GET_MANY = 0x11
+OP_SET_MANY = 0x12
+OP_CALL = 0x13
+OP_ATTACH = 0x20
+
+#: Set in the opcode of a frame whose blob is in shared memory.
+FLAG_SHM = 0x80
+
+#: Refuse frames larger than this (bytes), rather than allocating them.
+MAX_FRAME_LENGTH = 256 * 1024 * 1024
+
+
+class RemoteError(BridgeError):
+    pass
+
+
+def _encode_payload(payload):
+    """Encode a payload as JSON text, moving any bulk data into a blob.
+
+    :returns: ``(text, blobs)``, where ``blobs`` is the list of buffers which
+    make up the blob, in order.
+    """
+    blobs = []
+    offset = [0]
+
+    def reference(buffer):
+        buffer = memoryview(buffer).cast('B')
+        ref = [offset[0], buffer.nbytes]
+        blobs.append(buffer)
+        offset[0] += buffer.nbytes
+        return ref
+
+    def default(obj):
+        if isinstance(obj, Q_):
+            magnitude = obj.magnitude
+            if isinstance(magnitude, np.ndarray):
+                magnitude = default(magnitude)
+            elif isinstance(magnitude, np.generic):
+                magnitude = magnitude.item()
+            return {'$q': [magnitude, str(obj.units)]}
+        if isinstance(obj, np.ndarray):
+            obj = np.ascontiguousarray(obj)
+            return {'$a': [obj.dtype.str, obj.shape, reference(obj)]}
+        if isinstance(obj, np.generic):
+            return obj.item()
+        if isinstance(obj, (bytes, bytearray, memoryview)):
+            return {'$b': reference(obj)}
+        if isinstance(obj, (set, frozenset)):
+            return list(obj)
+        raise TypeError('{0!r} cannot be sent over the bridge.'.format(obj))
+
+    text = json.dumps(payload, default=default, separators=(',', ':'))
+    return bytes(text, 'utf-8'), blobs
+
+
+def _decode_payload(text, blob):
+    """Decode a JSON payload, resolving any references into the blob.
+    """
+    blob = memoryview(blob)
+
+    def hook(obj):
+        if len(obj) != 1:
+            return obj
+        if '$q' in obj:
+            magnitude, units = obj['$q']
+            return Q_(magnitude, units)
+        if '$b' in obj:
+            offset, length = obj['$b']
+            return bytes(blob[offset:offset+length])
+        if '$a' in obj:
+            dtype, shape, (offset, length) = obj['$a']
+            array = np.frombuffer(blob[offset:offset+length], dtype=dtype)
+            return array.reshape(shape)
+        return obj
+
+    return json.loads(str(text, 'utf-8'), object_hook=hook)
+
+
+def encode_frame(opcode, request_id, payload, ring=None):
+    """Encode one frame.
+
+    :param: ring
+    :type SharedRing:
+    :description: Where to put a large blob, if there is room.
+
+    :returns: The buffers of the frame, to be written in order.
+    :type list:
+    :raises: TypeError, ValueError (the payload cannot be encoded); nothing
+    is put into the ring then.
+    """
+    text, blobs = _encode_payload(payload)
+    blob_length = sum(b.nbytes for b in blobs)
+    if (ring is not None) and (blob_length >= SHM_THRESHOLD):
+        position = ring.write(blobs, blob_length)
+        if position is not None:
+            location = RING_LOCATION.pack(position, blob_length)
+            return [FRAME_HEADER.pack(opcode | FLAG_SHM, request_id, len(text),
+                                      len(location)) + text + location]
+    return [FRAME_HEADER.pack(opcode, request_id, len(text), blob_length) + text] + blobs
+
+
+def write_frame(write, opcode, request_id, payload, ring=None):
+    """Encode and write one frame.
+
+    :param: write
+    :type callable:
+    :description: Writes ALL of a buffer (e.g. ``socket.sendall``).
+
+    .. seealso: encode_frame
+    """
+    for buffer in encode_frame(opcode, request_id, payload, ring):
+        write(buffer)
+
+
+def read_frame(read, ring=None):
+    """Read and decode one frame.
+
+    :param: read
+    :type callable:
+    :description: Reads exactly ``n`` bytes, or fewer at end of stream
+    (e.g. ``read`` of a buffered socket file).
+
+    :param: ring
+    :type SharedRing:
+    :description: Where the other end puts large blobs.
+
+    :returns: ``(opcode, request_id, payload)``, or ``None`` at end of stream.
+    :raises: BridgeError
+    """
+    header = read(FRAME_HEADER.size)
+    if not header:
+        return None
+    if len(header) < FRAME_HEADER.size:
+        raise BridgeError('Connection closed within a frame header.')
+    opcode, request_id, text_length, blob_length = FRAME_HEADER.unpack(header)
+    if text_length + blob_length > MAX_FRAME_LENGTH:
+        raise BridgeError('Frame of {0} bytes is too large.'.format(
+                          text_length + blob_length))
+    body = read(text_length + blob_length)
+    if len(body) < text_length + blob_length:
+        raise BridgeError('Connection closed within a frame.')
+    body = memoryview(body)
+    blob = body[text_length:]
+    if opcode & FLAG_SHM:
+        if ring is None:
+            raise BridgeError('Shared memory frame, but no shared memory.')
+        opcode &= ~FLAG_SHM
+        blob = memoryview(ring.lease(*RING_LOCATION.unpack(blob))).cast('B')
+    payload = _decode_payload(body[:text_length], blob)
+    return opcode, request_id, payload
+
+
+def _spec(spec):
+    """Normalize a feat specification to ``(name, key)`` (key may be None).
+    """
+    if isinstance(spec, str):
+        return (spec, None)
+    name, key = spec
+    return (name, key)
+
+
+class DriverInterface(object):
+    """The Feats, DictFeats and Actions of a driver class, by name.
+
+    Only these may be used through a Feat level bridge; any other attribute
+    of the driver (``send``, ``query``, ...) is out of reach of the clients.
+    """
+    __cls = None
+    __feats = None
+    __dict_feats = None
+    __actions = None
+
+    def __init__(self, cls):
+        self.__cls = cls
+        self.__feats = OrderedDict()
+        self.__dict_feats = OrderedDict()
+        self.__actions = OrderedDict()
+        # most derived first, so overridden members are found first:
+        for klass in cls.__mro__:
+            for name, member in vars(klass).items():
+                if name.startswith('_') or self.has_member(name):
+                    continue
+                if isinstance(member, DictFeat):
+                    self.__dict_feats[name] = member
+                elif isinstance(member, Feat):
+                    self.__feats[name] = member
+                elif isinstance(member, Action):
+                    self.__actions[name] = member
+
+    def has_member(self, name):
+        return ((name in self.__feats) or (name in self.__dict_feats) or
+                (name in self.__actions))
+
+    def check_feat(self, name, key):
+        """:raises: AttributeError, if the (Dict)Feat is not known.
+        """
+        if key is None:
+            if name not in self.__feats:
+                raise AttributeError("{0} has no Feat '{1}'".format(
+                                     self.__cls.__name__, name))
+        elif name not in self.__dict_feats:
+            raise AttributeError("{0} has no DictFeat '{1}'".format(
+                                 self.__cls.__name__, name))
+
+    def check_action(self, name):
+        """:raises: AttributeError, if the Action is not known.
+        """
+        if name not in self.__actions:
+            raise AttributeError("{0} has no Action '{1}'".format(
+                                 self.__cls.__name__, name))
+
+    @staticmethod
+    def __modifiers(feat):
+        """The class level modifiers (units, keys, ...) of a (Dict)Feat.
+        """
+        try:
+            return feat.modifiers[MISSING][MISSING]
+        except (AttributeError, KeyError, TypeError):
+            return {}
+
+    @classmethod
+    def __describe_feat(cls, feat):
+        modifiers = cls.__modifiers(feat)
+        units = modifiers.get('units', None)
+        description = {'readonly': getattr(feat, 'fset', None) is None,
+                       'read_once': bool(getattr(feat, 'read_once', False)),
+                       'units': None if units is None else str(units),
+                       'doc': getattr(feat, '__doc__', None) or ''}
+        if isinstance(feat, DictFeat):
+            keys = modifiers.get('keys', None)
+            description['keys'] = list(keys) if keys else None
+        return description
+
+    def describe(self):
+        """A description of the members, which may be sent to a client.
+
+        :type dict:
+        """
+        return {
+            'driver': self.__cls.__name__,
+            'feats': OrderedDict((name, self.__describe_feat(feat))
+                                 for (name, feat) in self.__feats.items()),
+            'dict_feats': OrderedDict((name, self.__describe_feat(feat))
+                                      for (name, feat) in self.__dict_feats.items()),
+            'actions': OrderedDict(
+                (name, {'args': list(getattr(action, 'args', ()))[1:],
+                        'doc': getattr(action, '__doc__', None) or ''})
+                for (name, action) in self.__actions.items()),
+        }
+
+
+class FeatServer(object):
+    """Serves batched Feat requests for one driver.
+
+    The methods are called with the driver lock held, by the device worker
+    (see ``RPCHandler``), so a whole batch is served without interruption.
+
+    Values read are cached (by the server) with their time of reading, so
+    clients which can tolerate a value of a given age (``max_age``) do not
+    touch the device at all. Setting a Feat updates the cache; calling an
+    Action (which may change anything) clears it.
+    """
+    __driver = None
+    __interface = None
+    __cache = None  # (name, key) -> (time read, value)
+
+    def __init__(self, driver):
+        self.__driver = driver
+        self.__interface = DriverInterface(type(driver))
+        self.__cache = {}
+
+    @property
+    def interface(self):
+        return self.__interface
+
+    def invalidate(self):
+        """Forget all of the cached values.
+        """
+        self.__cache.clear()
+
+    def __get(self, name, key):
+        self.__interface.check_feat(name, key)
+        if key is None:
+            return getattr(self.__driver, name)
+        return getattr(self.__driver, name)[key]
+
+    def __set(self, name, key, value):
+        self.__interface.check_feat(name, key)
+        if key is None:
+            setattr(self.__driver, name, value)
+        else:
+            getattr(self.__driver, name)[key] = value
+
+    def get_many(self, specs, max_age=None):
+        """Get a batch of (Dict)Feats.
+
+        Each Feat is read once, even if it appears several times in the batch.
+        A Feat which fails does not fail the batch; its error is reported.
+
+        :returns: ``{'values': [...], 'errors': [[index, description], ...]}``
+        """
+        now = monotonic()
+        values = []
+        errors = []
+        read = {}
+        for index, spec in enumerate(specs):
+            spec = _spec(spec)
+            if spec in read:
+                values.append(read[spec])
+                continue
+            cached = self.__cache.get(spec)
+            if (cached is not None) and (max_age is not None) and \
+                    (now - cached[0] <= max_age):
+                value = cached[1]
+            else:
+                try:
+                    value = self.__get(*spec)
+                except Exception as e:
+                    values.append(None)
+                    errors.append([index, '{0}: {1}'.format(type(e).__name__, e)])
+                    continue
+                self.__cache[spec] = (monotonic(), value)
+            read[spec] = value
+            values.append(value)
+        return {'values': values, 'errors': errors}
+
+    def set_many(self, items):
+        """Set a batch of (Dict)Feats, in order.
+
+        The batch stops at the first failure (later settings may depend on
+        earlier ones); the error tells how many settings were applied.
+
+        :param: items
+        :type list:
+        :description: ``[[spec, value], ...]``
+        """
+        for index, (spec, value) in enumerate(items):
+            spec = _spec(spec)
+            try:
+                self.__set(spec[0], spec[1], value)
+            except Exception as e:
+                self.__cache.pop(spec, None)
+                raise RemoteError('Setting {0} failed ({1} of {2} applied): '
+                                  '{3}: {4}'.format(spec, index, len(items),
+                                                    type(e).__name__, e))
+            self.__cache[spec] = (monotonic(), value)
+        return {'applied': len(items)}
+
+    def call(self, name, args=(), kwargs=None):
+        """Call an Action.
+        """
+        self.__interface.check_action(name)
+        self.invalidate()
+        result = getattr(self.__driver, name)(*args, **(kwargs or {}))
+        return {'result': result}
+
+
+class RPCHandler(socketserver.StreamRequestHandler):
+    """Serves one Feat level bridge client connection.
+
+    Each request frame is served, as one function of the driver, by the
+    device worker, and answered with a reply (or error) frame carrying the
+    same request id. The client metrics are recorded per frame (see
+    ``BridgeMetrics``), as for the SCPI bridges.
+    """
+    def handle(self):
+        bridge = self.server.bridge
+        worker = bridge.worker
+        feats = bridge.feat_server
+        metrics = bridge.metrics
+        client = self.client_address
+        received_bytes = [0]
+
+        def read(size):
+            data = self.rfile.read(size)
+            received_bytes[0] += len(data)
+            return data
+
+        operations = {
+            OP_DESCRIBE: lambda payload: (lambda driver: feats.interface.describe()),
+            OP_GET_MANY: lambda payload: (lambda driver: feats.get_many(
+                payload['feats'], payload.get('max_age', bridge.max_age))),
+            OP_SET_MANY: lambda payload: (lambda driver: feats.set_many(
+                payload['items'])),
+            OP_CALL: lambda payload: (lambda driver: feats.call(
+                payload['name'], payload.get('args', ()), payload.get('kwargs'))),
+        }
+        channel = None
+        incoming = outgoing = None
+        try:
+            while True:
+                received_bytes[0] = 0
+                frame = read_frame(read, incoming)
+                if frame is None:
+                    break  # client disconnected
+                received = monotonic()
+                metrics.client_request(client, received_bytes[0])
+                opcode, request_id, payload = frame
+                logging.debug('%s -> inst: %#x %r', client[0], opcode, payload)
+                if opcode == OP_ATTACH:
+                    try:
+                        if channel is not None:
+                            raise BridgeError('Shared memory attached already.')
+                        channel = SharedMemoryChannel.attach(
+                            payload['name'], bytes.fromhex(payload['token']))
+                    except BridgeError as e:
+                        frame, failed = encode_frame(OP_ERROR, request_id,
+                                                     {'error': str(e)}), True
+                    else:
+                        frame, failed = encode_frame(OP_REPLY, request_id, {}), False
+                        incoming, outgoing = channel.incoming, channel.outgoing
+                    for buffer in frame:
+                        self.wfile.write(buffer)
+                    metrics.client_reply(client, sum(memoryview(b).nbytes for b in frame),
+                                         monotonic() - received, failed)
+                    continue
+                try:
+                    if opcode not in operations:
+                        raise BridgeError('Unknown opcode {0:#x}.'.format(opcode))
+                    try:
+                        request = worker.submit(client, 'rpc:{0:#x}'.format(opcode),
+                                                function=operations[opcode](payload))
+                    except BridgeOverloadError:
+                        metrics.client_rejected(client)
+                        raise
+                    # (encoded here, so a reply which cannot be encoded is
+                    # answered with an error, like any other failure)
+                    frame = encode_frame(OP_REPLY, request_id, request.wait(),
+                                         outgoing)
+                except BridgeClosedError:
+                    raise
+                except Exception as e:
+                    frame = encode_frame(OP_ERROR, request_id,
+                                         {'error': '{0}: {1}'.format(type(e).__name__, e)})
+                    failed = True
+                else:
+                    failed = False
+                for buffer in frame:
+                    self.wfile.write(buffer)
+                metrics.client_reply(client, sum(memoryview(b).nbytes for b in frame),
+                                     monotonic() - received, failed)
+        except BridgeClosedError:
+            logging.info('Bridge closed, dropping client %s', client[0])
+        except BridgeError as e:
+            logging.warning('Dropping client %s: %s', client[0], e)
+        except socket.error as e:
+            if e.errno == 32: # Broken pipe
+                logging.info('Client disconnected')
+            else:
+                raise
+        finally:
+            if channel is not None:
+                channel.close()
+
+
+class RPCBridge(Bridge):
+    """A local driver, served at the Feat level to TCP clients.
+
+    .. seealso: RPCClient
+    """
+    __feat_server = None
+
+    #: The default age (seconds) of a cached value which clients will accept.
+    max_age = None
+
+    def __init__(self, local_driver, host='', port=5025, max_age=None,
+                 handler=RPCHandler, **worker_options):
+        """Initialize the bridge.
+
+        :param: max_age
+        :type float:
+        :description: The default for requests which don't give one; None
+        means ALWAYS read from the device.
+        """
+        self.__feat_server = FeatServer(local_driver)
+        self.max_age = max_age
+        super().__init__(local_driver, host=host, port=port, handler=handler,
+                         **worker_options)
+
+    @property
+    def feat_server(self):
+        return self.__feat_server
+
+
+class RPCClient(object):
+    """A client of a Feat level bridge (``RPCBridge``).
+
+    A client may be shared between threads; requests are serialized.
+
+    A client on the same host as the bridge moves large blobs through shared
+    memory; NumPy arrays it receives are then views of the shared memory,
+    whose space is reused once they are dropped (copy an array to keep it
+    for long).
+    """
+    __socket = None
+    __rfile = None
+    __lock = None
+    __request_id = 0
+    __channel = None
+
+    def __init__(self, host, port=5025, timeout=None, shared_memory=None,
+                 ring_size=SHM_RING_SIZE):
+        """Connect to a Feat level bridge.
+
+        :param: shared_memory
+        :type bool:
+        :description: Use shared memory for large blobs; ``None`` does so if
+        the bridge is on this host (and shared memory is available).
+
+        :param: ring_size
+        :type int:
+        :description: The size (bytes) of each shared memory ring.
+        """
+        self.__socket = socket.create_connection((host, port), timeout)
+        self.__socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.__rfile = self.__socket.makefile('rb')
+        self.__lock = threading.Lock()
+        if shared_memory is None:
+            shared_memory = shared_memory_available() and self.__same_host()
+        if shared_memory:
+            self.__attach(ring_size)
+
+    def __same_host(self):
+        peer = self.__socket.getpeername()[0]
+        return peer.startswith('127.') or peer in ('::1', self.__socket.getsockname()[0])
+
+    def __attach(self, ring_size):
+        """Negotiate a shared memory segment with the bridge.
+
+        If the bridge cannot attach it, the client carries on over the socket.
+        """
+        channel = SharedMemoryChannel.create(ring_size)
+        try:
+            self._request(OP_ATTACH, {'name': channel.name,
+                                      'token': channel.token.hex()})
+        except RemoteError as e:
+            logging.info('Not using shared memory: %s', e)
+            channel.close()
+            return
+        channel.unlink()  # both ends have mapped it
+        self.__channel = channel
+
+    @property
+    def shared_memory(self):
+        """True if large blobs go through shared memory.
+        """
+        return self.__channel is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.__rfile.close()
+        self.__socket.close()
+        if self.__channel is not None:
+            self.__channel.close()
+            self.__channel = None
+
+    def _request(self, opcode, payload):
+        """Send one request, and wait for its reply.
+
+        :raises: RemoteError
+        """
+        with self.__lock:
+            self.__request_id = (self.__request_id + 1) % (1 << 32)
+            request_id = self.__request_id
+            channel = self.__channel
+            write_frame(self.__socket.sendall, opcode, request_id, payload,
+                        channel and channel.outgoing)
+            frame = read_frame(self.__rfile.read, channel and channel.incoming)
+        if frame is None:
+            raise BridgeClosedError('The bridge closed the connection.')
+        reply_opcode, reply_id, reply = frame
+        if reply_id != request_id:
+            raise BridgeError('Reply {0} to request {1}.'.format(reply_id,
+                                                                 request_id))
+        if reply_opcode == OP_ERROR:
+            raise RemoteError(reply['error'])
+        return reply
+
+    def describe(self):
+        """The Feats, DictFeats and Actions of the remote driver.
+
+        .. seealso: DriverInterface.describe
+        """
+        return self._request(OP_DESCRIBE, {})
+
+    def get_many(self, feats, max_age=None, strict=True):
+        """Get many (Dict)Feats in one round trip.
+
+        :param: feats
+        :type list:
+        :description: Feat names, or ``(name, key)`` pairs for DictFeats.
+
+        :param: max_age
+        :type float:
+        :description: Accept values cached by the server up to this old
+        (seconds); ``None`` uses the bridge default.
+
+        :param: strict
+        :type bool:
+        :description: If False, a Feat which fails has a ``RemoteError`` as
+        its value, rather than failing the whole call.
+
+        :returns: The values, keyed by feat (in request order).
+        :type OrderedDict:
+        :raises: RemoteError
+        """
+        specs = [spec if isinstance(spec, str) else tuple(spec) for spec in feats]
+        payload = {'feats': specs}
+        if max_age is not None:
+            payload['max_age'] = max_age
+        reply = self._request(OP_GET_MANY, payload)
+        values = reply['values']
+        if reply['errors']:
+            if strict:
+                raise RemoteError('; '.join('{0}: {1}'.format(specs[i], e)
+                                            for (i, e) in reply['errors']))
+            for index, error in reply['errors']:
+                values[index] = RemoteError(error)
+        return OrderedDict(zip(specs, values))
+
+    def get(self, feat, max_age=None):
+        """Get one (Dict)Feat.
+        """
+        return self.get_many([feat], max_age=max_age)[
+            feat if isinstance(feat, str) else tuple(feat)]
+
+    def set_many(self, values):
+        """Set many (Dict)Feats in one round trip (in order).
+
+        :param: values
+        :type dict, or sequence of pairs:
+        :description: Values keyed by feat name, or by ``(name, key)``.
+
+        :raises: RemoteError
+        """
+        if hasattr(values, 'items'):
+            values = values.items()
+        self._request(OP_SET_MANY, {'items': [[spec, value]
+                                              for (spec, value) in values]})
+
+    def set(self, feat, value):
+        """Set one (Dict)Feat.
+        """
+        self.set_many([(feat, value)])
+
+    def call(self, name, *args, **kwargs):
+        """Call an Action of the remote driver, and return its result.
+
+        :raises: RemoteError
+        """
+        return self._request(OP_CALL, {'name': name, 'args': args,
+                                       'kwargs': kwargs})['result']
@@ -0,0 +1,565 @@
+# -*- coding: utf-8 -*-
+"""sindri.bridges.scpi
+
+    Message level bridges: program messages (SCPI text) from TCP clients are
+    passed, as is, to a local device.
+
+    Example (on the machine with the local device)::
+
+        >>>inst = E3631A_Serial('/dev/ttyUSB0')
+        >>>inst.initialize()
+        >>>bridge = BridgeFactory(inst)(port=5025)
+        >>>bridge.serve_forever()  # or ``bridge.start()`` for a background thread
+
+    Many clients may be connected at once. Every message from every client
+    is handed to ONE ``DeviceWorker``, which owns the local driver and serves
+    the clients' messages one at a time, round-robin between clients (and in
+    order for each client). A query and its response are never interleaved
+    with another client's messages.
+
+    :copyright: 2013 by Sindri Authors, see AUTHORS for more details.
+    :license: LGPL, see LICENSE for more details.
+"""
+
+import asyncio
+import logging
+import socket, socketserver
+import threading
+from time import monotonic, sleep
+
+from sindri.ieee4882.arbitrary_block import (MessageReader, scan_message,
+                                             MESSAGE_END, MESSAGE_BLOCK)
+from .common import (BridgeError, BridgeClosedError, BridgeOverloadError,
+                     BlockResponse, DeviceWorker, is_query)
+from .metrics import BridgeMetrics
+
+
+class TCPHandler(socketserver.StreamRequestHandler):
+    """Serves one bridge client connection (one thread per connection).
+
+    Each line received is one program message for the device. Queries are
+    answered with one line; other messages are queued and NOT answered, so
+    a client can stream commands without waiting on the device. If a query
+    fails, the client is sent ``ERROR_FORMAT`` instead of a response.
+
+    IEEE 488.2 definite length blocks (``#<n><length><payload>``), in either
+    direction, are relayed as raw bytes: the payload is never decoded, nor
+    searched for the termination.
+
+    A client which is too far ahead of the device is not read from until the
+    device catches up (see ``DeviceWorker``). If ``SUBMIT_TIMEOUT`` is set,
+    a message which finds no room in that time is rejected instead: a query
+    is answered with ``ERROR_FORMAT``; a command is dropped (and logged),
+    and the client learns of it on its next query, which is NOT served but
+    answered with ``ERROR_FORMAT`` (the client's commands are incomplete).
+    """
+    ENCODING = 'ascii'
+    TERMINATION = '\n'
+    ERROR_FORMAT = '!ERROR: {0}'
+    SUBMIT_TIMEOUT = None  # wait for room for ever
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def _device_message(self, message):
+        """The program message a client message is for the device (used to
+        tell queries from commands before the message is submitted).
+        """
+        return message
+
+    def _submit(self, message):
+        """Submit a message from the client to a device worker.
+
+        :returns: The request, or ``None`` if the message needs no device.
+        :type BridgeRequest:
+        """
+        return self.server.bridge.worker.submit(self.client_address, message,
+                                                timeout=self.SUBMIT_TIMEOUT)
+
+    def handle(self):
+        client = self.client_address
+        reader = MessageReader(self.connection.recv,
+                               termination=self.TERMINATION,
+                               recv_into=self.connection.recv_into)
+        termination = bytes(self.TERMINATION, self.ENCODING)
+        metrics = self.server.bridge.metrics
+        dropped = []  # commands rejected (overload) since the last query
+        try:
+            while True:
+                data, has_blocks = reader.read()
+                if data is None:
+                    break  # client disconnected
+                received = monotonic()
+                metrics.client_request(client, len(data) + len(termination))
+                logging.debug('%s -> inst: %d bytes', client[0], len(data))
+                if has_blocks:
+                    message = bytes(data)  # passed through as is
+                else:
+                    message = str(data, self.ENCODING).strip()
+                    if not message:
+                        continue
+                query = is_query(self._device_message(message))
+                if dropped and query:
+                    out, failed = self.ERROR_FORMAT.format(
+                        '{0} command(s) dropped (overload), from {1!r}; query '
+                        'not served.'.format(len(dropped), dropped[0])), True
+                    del dropped[:]
+                else:
+                    try:
+                        request = self._submit(message)
+                    except BridgeOverloadError as e:
+                        metrics.client_rejected(client)
+                        if not query:
+                            logging.warning('%s: dropped %r: %s', client[0], message, e)
+                            dropped.append(message if isinstance(message, str)
+                                           else '<{0} byte message>'.format(len(message)))
+                            continue
+                        out, failed = self.ERROR_FORMAT.format(e), True
+                    else:
+                        if (request is None) or not request.is_query:
+                            continue
+                        try:
+                            out, failed = request.wait(), False
+                        except Exception as e:
+                            out, failed = self.ERROR_FORMAT.format(e), True
+                if isinstance(out, BlockResponse):
+                    self.wfile.write(out.raw)  # no copy, no decode
+                    self.wfile.write(termination)
+                    sent = len(out) + len(termination)
+                else:
+                    out = bytes(out + self.TERMINATION, self.ENCODING)
+                    self.wfile.write(out)
+                    sent = len(out)
+                metrics.client_reply(client, sent, monotonic() - received, failed)
+                logging.debug('%s <- inst: %d bytes', client[0], sent)
+        except BridgeClosedError:
+            logging.info('Bridge closed, dropping client %s', client[0])
+        except EOFError as e:
+            logging.info('Client disconnected: %s', e)
+        except socket.error as e:
+            if e.errno == 32: # Broken pipe
+                logging.info('Client disconnected')
+            else:
+                raise
+
+
+class BridgeServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """A TCP server with one handler thread per client.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    bridge = None
+
+    def __init__(self, address, handler, bridge):
+        self.bridge = bridge
+        super().__init__(address, handler)
+
+
+class BridgeBase(object):
+    """The serving machinery of the (threaded) TCP bridges.
+
+    A subclass provides the device workers, and stops them in
+    ``_stop_workers``.
+    """
+    __server = None
+    __thread = None
+    __serving = False
+    __metrics = None
+
+    def __init__(self, host='', port=5025, handler=TCPHandler):
+        self.__metrics = BridgeMetrics()
+        self.__server = BridgeServer((host, port), handler, bridge=self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    @property
+    def address(self):
+        """The ``(host, port)`` the bridge is listening on.
+        """
+        return self.__server.server_address
+
+    @property
+    def metrics(self):
+        """The client and device metrics.
+
+        :type BridgeMetrics:
+        """
+        return self.__metrics
+
+    def serve_forever(self):
+        """Serve clients until ``shutdown`` (blocks the calling thread).
+        """
+        self.__serving = True
+        try:
+            self.__server.serve_forever()
+        finally:
+            self.__serving = False
+
+    def start(self):
+        """Serve clients from a background thread.
+        """
+        self.__serving = True
+        self.__thread = threading.Thread(target=self.serve_forever,
+                                         name='bridge-server', daemon=True)
+        self.__thread.start()
+        return self
+
+    def _stop_workers(self):
+        """Stop the device worker(s), once their queued requests are served.
+
+        **Abstract**
+        """
+        raise NotImplementedError("``_stop_workers`` has not been implemented!")
+
+    def shutdown(self):
+        """Stop accepting clients, and stop the workers (after queued requests).
+        """
+        if self.__serving:
+            self.__server.shutdown()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        self.__server.server_close()
+        self._stop_workers()
+
+
+class Bridge(BridgeBase):
+    """A local device, served to TCP clients.
+
+    .. seealso: BridgeFactory
+    """
+    __worker = None
+
+    def __init__(self, local_driver, host='', port=5025, handler=TCPHandler,
+                 **worker_options):
+        """Initialize the bridge.
+
+        :param: worker_options
+        :description: Passed to the ``DeviceWorker`` (queue bounds, etc.).
+        """
+        super().__init__(host=host, port=port, handler=handler)
+        self.__worker = DeviceWorker(local_driver,
+            name='bridge-worker:{0}'.format(getattr(local_driver, 'name', '')),
+            metrics=self.metrics, **worker_options)
+        self.__worker.start()
+
+    @property
+    def worker(self):
+        return self.__worker
+
+    def _stop_workers(self):
+        self.__worker.stop()
+
+
+class AsyncBridge(object):
+    """A local device, served to TCP clients which pipeline their requests.
+
+    Each request line from a client carries a correlation id:
+    ``<id> <message>``. Clients may send any number of requests without
+    waiting; every request is answered (when it completes) with a line
+    ``<id> <response>``. The response is empty for a message which is not
+    a query, so the client knows it was carried out; a failed request is
+    answered with ``<id> !ERROR: <description>``.
+
+    The requests of a client are passed to the device in the order they were
+    sent (see ``DeviceWorker``), so a remote client over a slow (WAN) link
+    pays the network round trip once per batch of requests, rather than once
+    per SCPI message.
+
+    All of the client connections are served by one ``asyncio`` event loop.
+
+    Flow control: a client with ``high_watermark`` requests outstanding (see
+    ``DeviceWorker``) is not read from until it is down to ``low_watermark``.
+    A request which finds the device queue full is answered with an error.
+
+    As for ``TCPHandler``, binary blocks are relayed as raw bytes.
+    """
+    ENCODING = 'ascii'
+    TERMINATION = '\n'
+    ERROR_FORMAT = '!ERROR: {0}'
+    READ_CHUNK = 65536
+
+    __worker = None
+    __host = None
+    __port = None
+    __loop = None
+    __server = None
+    __thread = None
+    __writers = None  # the open client connections
+    __metrics = None
+
+    def __init__(self, local_driver, host='', port=5025, worker=None,
+                 **worker_options):
+        """Initialize the bridge (it is served by ``serve_forever`` or ``start``).
+
+        :param: host
+        :type str:
+        :description: The address to listen on; ``''`` (the default) is every
+        IPv4 interface, as for ``Bridge``.
+
+        :param: worker
+        :type DeviceWorker:
+        :description: Share the device worker of another bridge (optional).
+
+        :param: worker_options
+        :description: Passed to the ``DeviceWorker`` (if not shared).
+        """
+        self.__metrics = BridgeMetrics()
+        if worker is None:
+            worker = DeviceWorker(local_driver,
+                name='bridge-worker:{0}'.format(getattr(local_driver, 'name', '')),
+                metrics=self.__metrics, **worker_options)
+            worker.start()
+        self.__worker = worker
+        self.__host = host
+        self.__port = port
+        self.__writers = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    @property
+    def worker(self):
+        return self.__worker
+
+    @property
+    def metrics(self):
+        """The client (and device, unless the worker is shared) metrics.
+
+        :type BridgeMetrics:
+        """
+        return self.__metrics
+
+    @property
+    def addresses(self):
+        """Every ``(host, port)`` the bridge is listening on (once serving).
+
+        A host name may resolve to several addresses (e.g. IPv4 and IPv6),
+        each with its own port if the bridge was given port 0.
+        """
+        if self.__server is None:
+            return [(self.__host, self.__port)]
+        return [sock.getsockname()[:2] for sock in self.__server.sockets]
+
+    @property
+    def address(self):
+        """The ``(host, port)`` the bridge is listening on (once serving); the
+        first IPv4 one, if there are several.
+
+        .. seealso: addresses
+        """
+        if self.__server is None:
+            return (self.__host, self.__port)
+        sockets = self.__server.sockets
+        ipv4 = [sock for sock in sockets if sock.family == socket.AF_INET]
+        return (ipv4 or sockets)[0].getsockname()[:2]
+
+    def _encode(self, request_id, text):
+        return bytes("{0} {1}{2}".format(request_id, text, self.TERMINATION),
+                     self.ENCODING)
+
+    def __reply(self, writer, flow, request_id, request, received):
+        """Write the response to a request (runs on the event loop).
+        """
+        flow.answered()
+        if writer.is_closing():
+            return
+        if request.error is not None:
+            out = self._encode(request_id, self.ERROR_FORMAT.format(request.error))
+            writer.write(out)
+            sent = len(out)
+        elif isinstance(request.response, BlockResponse):
+            prefix = bytes("{0} ".format(request_id), self.ENCODING)
+            writer.write(prefix)
+            writer.write(request.response.raw)
+            writer.write(bytes(self.TERMINATION, self.ENCODING))
+            sent = len(prefix) + len(request.response) + len(self.TERMINATION)
+        else:
+            text = request.response if request.response is not None else ''
+            out = self._encode(request_id, text)
+            writer.write(out)
+            sent = len(out)
+        self.__metrics.client_reply(request.client, sent,
+                                    monotonic() - received,
+                                    request.error is not None)
+
+    async def _read_line(self, reader, pending):
+        """Read one request line, passing over any binary blocks verbatim.
+
+        :param: pending
+        :type bytearray:
+        :description: The bytes received (for this client) beyond the last
+        line; updated in place.
+
+        :returns: ``(line, has_blocks)``, or ``(None, False)`` at end of stream.
+        """
+        termination = bytes(self.TERMINATION, self.ENCODING)
+        scan = 0
+        has_blocks = False
+        while True:
+            outcome, index = scan_message(pending, scan, termination)
+            if outcome == MESSAGE_BLOCK:
+                if len(pending) < index:
+                    pending += await reader.readexactly(index - len(pending))
+                scan = index
+                has_blocks = True
+                continue
+            if outcome == MESSAGE_END:
+                line = pending[:index]
+                del pending[:index+len(termination)]
+                return line, has_blocks
+            scan = index
+            data = await reader.read(self.READ_CHUNK)
+            if not data:
+                if pending:
+                    raise ConnectionError('Stream ended within a request.')
+                return None, False
+            pending += data
+
+    async def _handle_client(self, reader, writer):
+        loop = asyncio.get_event_loop()
+        client = writer.get_extra_info('peername')
+        pending = bytearray()
+        queue = self.__worker.queue
+        flow = _ClientFlow(queue.high_watermark, queue.low_watermark)
+        self.__writers.add(writer)
+        try:
+            while True:
+                await flow.resume.wait()  # (paused while too far ahead)
+                data, has_blocks = await self._read_line(reader, pending)
+                if data is None:
+                    break  # client disconnected
+                received = monotonic()
+                self.__metrics.client_request(client, len(data) + len(self.TERMINATION))
+                if has_blocks:
+                    request_id, _, message = bytes(data).partition(b' ')
+                    request_id = str(request_id, self.ENCODING).strip()
+                else:
+                    line = str(data, self.ENCODING).strip()
+                    if not line:
+                        continue
+                    request_id, _, message = line.partition(' ')
+                    message = message.strip()
+                if not message:
+                    writer.write(self._encode(request_id,
+                        self.ERROR_FORMAT.format('Empty message.')))
+                    continue
+                try:
+                    # never block the event loop waiting for room:
+                    request = self.__worker.submit(client, message, timeout=0)
+                except BridgeOverloadError as e:
+                    self.__metrics.client_rejected(client)
+                    writer.write(self._encode(request_id,
+                        self.ERROR_FORMAT.format(e)))
+                    continue
+                flow.submitted()
+                request.add_done_callback(
+                    lambda r, i=request_id, t=received: loop.call_soon_threadsafe(
+                        self.__reply, writer, flow, i, r, t))
+                await writer.drain()
+        except BridgeClosedError:
+            logging.info('Bridge closed, dropping client %s', client[0])
+        except (ConnectionError, asyncio.IncompleteReadError):
+            logging.info('Client disconnected')
+        finally:
+            self.__writers.discard(writer)
+            writer.close()
+
+    async def serve(self):
+        """Serve clients until cancelled (a coroutine).
+        """
+        self.__loop = asyncio.get_event_loop()
+        self.__server = await asyncio.start_server(
+            self._handle_client, self.__host or '0.0.0.0', self.__port)
+        async with self.__server:
+            await self.__server.serve_forever()
+
+    def serve_forever(self):
+        """Serve clients until ``shutdown`` (blocks the calling thread).
+        """
+        try:
+            asyncio.run(self.serve())
+        except asyncio.CancelledError:
+            pass
+
+    def start(self, timeout=5.0):
+        """Serve clients from a background thread (returns once listening).
+        """
+        self.__thread = threading.Thread(target=self.serve_forever,
+                                         name='async-bridge-server', daemon=True)
+        self.__thread.start()
+        deadline = monotonic() + timeout
+        while (self.__server is None) and self.__thread.is_alive():
+            if monotonic() > deadline:
+                raise BridgeError('Bridge did not start listening.')
+            sleep(0.01)
+        return self
+
+    def __close(self):
+        """Close the server, and every client connection (on the event loop).
+        """
+        self.__server.close()
+        for writer in list(self.__writers):
+            writer.close()
+
+    def shutdown(self):
+        """Stop accepting clients, and stop the worker (after queued requests).
+        """
+        if (self.__loop is not None) and (self.__server is not None):
+            self.__loop.call_soon_threadsafe(self.__close)
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        self.__worker.stop()
+
+
+class _ClientFlow(object):
+    """The flow control state of one pipelining client (event loop only).
+    """
+    def __init__(self, high_watermark, low_watermark):
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.outstanding = 0
+        self.resume = asyncio.Event()
+        self.resume.set()
+
+    def submitted(self):
+        self.outstanding += 1
+        if (self.high_watermark is not None) and \
+                (self.outstanding >= self.high_watermark):
+            self.resume.clear()
+
+    def answered(self):
+        self.outstanding -= 1
+        if (not self.resume.is_set()) and (self.outstanding <= self.low_watermark):
+            self.resume.set()
+
+
+class BridgeFactory(object):
+    """Creates a Bridge object when called.
+    """
+    def __init__(self, local_driver=None):
+        super().__init__()
+        if local_driver is None:
+            raise ValueError("The local device driver cannot be ``None``.")
+        self.local_driver = local_driver
+
+    def __call__(self, *args, pipelined=False, **kwargs):
+        """Create a Bridge object using the arguments provided.
+
+        When ``pipelined`` is True, an ``AsyncBridge`` is created, which lets
+        clients pipeline requests with correlation ids.
+
+        .. seealso: Bridge, AsyncBridge
+        """
+        if pipelined:
+            return AsyncBridge(self.local_driver, *args, **kwargs)
+        return Bridge(self.local_driver, *args, **kwargs)
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""sindri.bridges.shm
+
+    A shared memory transport for bridge clients on the same host as the
+    bridge: bulk data (the blobs of the Feat level protocol) goes through a
+    pair of rings in a ``multiprocessing.shared_memory`` segment, and the
+    socket only carries the (small) control frames.
+
+    The writer copies a blob into its ring once; the reader decodes NumPy
+    arrays as views of the ring, so no further copy is made. The space of a
+    blob is given back to the writer once the reader has dropped every
+    array decoded from it. If a ring is full (e.g. arrays are kept a long
+    time), blobs simply go through the socket again.
+
+    The segment is created by the client, and attached by the bridge (see
+    ``RPCClient``); it is unlinked as soon as both ends have mapped it.
+
+    :copyright: 2013 by Sindri Authors, see AUTHORS for more details.
+    :license: LGPL, see LICENSE for more details.
+"""
+
+import ctypes
+import os
+import struct
+import threading
+import weakref
+from collections import deque
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+from .common import BridgeError
+
+
+#: Blobs smaller than this (bytes) go through the socket.
+SHM_THRESHOLD = 64 * 1024
+
+#: The default size (bytes) of each ring (one per direction).
+SHM_RING_SIZE = 32 * 1024 * 1024
+
+#: token (16 bytes), client -> bridge ring tail, bridge -> client ring tail
+_SEGMENT_HEADER = struct.Struct('16sQQ')
+_HEADER_SIZE = 64
+_TAIL = struct.Struct('Q')
+
+#: The location of a blob in a ring: position, length.
+RING_LOCATION = struct.Struct('!QQ')
+
+
+def shared_memory_available():
+    return shared_memory is not None
+
+
+class SharedRing(object):
+    """A ring of bytes in shared memory, with ONE writer and ONE reader
+    (in different processes).
+
+    Positions are byte counters (they never wrap); a blob never straddles
+    the end of the ring. The writer keeps the head, and the reader
+    publishes the tail (up to which the space is free again) in the
+    segment header.
+    """
+    __buffer = None  # the ring (writable memoryview)
+    __size = 0
+    __header = None  # the segment header (memoryview)
+    __tail_offset = 0
+    __head = 0  # writer side
+    __leases = None  # reader side: deque of [end, released]
+    __lock = None
+    __closed = False
+
+    def __init__(self, buffer, header, tail_offset):
+        self.__buffer = buffer
+        self.__size = len(buffer)
+        self.__header = header
+        self.__tail_offset = tail_offset
+        self.__leases = deque()
+        self.__lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self.__size
+
+    def __tail(self):
+        return _TAIL.unpack_from(self.__header, self.__tail_offset)[0]
+
+    def write(self, buffers, length):
+        """Copy a blob (made of buffers) into the ring.
+
+        :returns: The position of the blob, or ``None`` if there is no room.
+        """
+        size = self.__size
+        start = self.__head % size
+        padding = size - start if start + length > size else 0
+        if padding + length > size - (self.__head - self.__tail()):
+            return None
+        position = self.__head + padding
+        offset = position % size
+        for buffer in buffers:
+            self.__buffer[offset:offset+buffer.nbytes] = buffer
+            offset += buffer.nbytes
+        self.__head = position + length
+        return position
+
+    def lease(self, position, length):
+        """The memory of a blob written by the other end.
+
+        The space is given back once the returned buffer, and anything made
+        from it (e.g. ``np.frombuffer``), has been dropped.
+        """
+        offset = position % self.__size
+        if offset + length > self.__size:
+            raise BridgeError('Blob at {0} ({1} bytes) is outside the '
+                              'ring.'.format(position, length))
+        memory = (ctypes.c_char * length).from_buffer(self.__buffer, offset)
+        entry = [position + length, False]
+        with self.__lock:
+            self.__leases.append(entry)
+        weakref.finalize(memory, self.__release, entry)
+        return memory
+
+    def __release(self, entry):
+        with self.__lock:
+            entry[1] = True
+            tail = None
+            while self.__leases and self.__leases[0][1]:
+                tail = self.__leases.popleft()[0]
+            if (tail is not None) and not self.__closed:
+                try:
+                    _TAIL.pack_into(self.__header, self.__tail_offset, tail)
+                except (ValueError, TypeError):
+                    pass  # the header is released (the channel is closed).
+
+    def close(self):
+        """Release the ring memory (unless blobs are still leased).
+
+        Blobs released after this no longer publish the tail.
+        """
+        with self.__lock:
+            self.__closed = True
+        try:
+            self.__buffer.release()
+        except BufferError:
+            pass
+
+
+class SharedMemoryChannel(object):
+    """A shared memory segment holding two rings: client -> bridge, and
+    bridge -> client.
+    """
+    __memory = None
+    __token = None
+    __owner = False
+    __header = None
+    outgoing = None  # the ring written by this end
+    incoming = None  # the ring read by this end
+
+    def __init__(self, memory, token, owner):
+        self.__memory = memory
+        self.__token = token
+        self.__owner = owner
+        header = self.__header = memory.buf[:_HEADER_SIZE]
+        size = (memory.size - _HEADER_SIZE) // 2
+        to_bridge = SharedRing(memory.buf[_HEADER_SIZE:_HEADER_SIZE+size],
+                               header, 16)
+        to_client = SharedRing(memory.buf[_HEADER_SIZE+size:_HEADER_SIZE+2*size],
+                               header, 24)
+        if owner:
+            self.outgoing, self.incoming = to_bridge, to_client
+        else:
+            self.outgoing, self.incoming = to_client, to_bridge
+
+    @classmethod
+    def create(cls, ring_size=SHM_RING_SIZE):
+        """Create a segment (client side).
+        """
+        if shared_memory is None:
+            raise BridgeError('Shared memory is not available.')
+        token = os.urandom(16)
+        memory = shared_memory.SharedMemory(create=True,
+                                            size=_HEADER_SIZE + 2 * ring_size)
+        _SEGMENT_HEADER.pack_into(memory.buf, 0, token, 0, 0)
+        return cls(memory, token, owner=True)
+
+    @classmethod
+    def attach(cls, name, token):
+        """Attach to a segment created by a client (bridge side).
+
+        :raises: BridgeError, if the segment cannot be found (e.g. the client
+        is on another host) or is not the one the client created.
+        """
+        if shared_memory is None:
+            raise BridgeError('Shared memory is not available.')
+        try:
+            try:
+                memory = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:  # Python < 3.13: the creator unlinks it, not us.
+                memory = shared_memory.SharedMemory(name=name)
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(memory._name, 'shared_memory')
+        except (OSError, ValueError) as e:
+            raise BridgeError('Cannot attach shared memory {0}: {1}'.format(name, e))
+        if _SEGMENT_HEADER.unpack_from(memory.buf, 0)[0] != token:
+            memory.close()
+            raise BridgeError('Shared memory {0} is not the client\'s.'.format(name))
+        return cls(memory, token, owner=False)
+
+    @property
+    def name(self):
+        return self.__memory.name
+
+    @property
+    def token(self):
+        return self.__token
+
+    @property
+    def ring_size(self):
+        return self.outgoing.size
+
+    def unlink(self):
+        """Remove the name of the segment (the mappings stay valid).
+        """
+        if self.__owner:
+            try:
+                self.__memory.unlink()
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        self.unlink()
+        for ring in (self.outgoing, self.incoming):
+            if ring is not None:
+                ring.close()
+        self.outgoing = self.incoming = None
+        try:
+            self.__header.release()
+            self.__memory.close()
+        except BufferError:
+            pass  # arrays still view the rings; unmapped when they are dropped.
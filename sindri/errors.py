@@ -60,3 +60,11 @@ class CommunicationError(InstrumentError):
 class UnexpectedResponseFormatError(CommunicationError):
     pass
 
+
+
+class MeasurementError(SindriError):
+    pass
+
+
+class MeasurementTimeoutError(MeasurementError):
+    pass
@@ -108,6 +108,16 @@ class ArbitraryBlock(Verifiable):
         """The raw binary block.
         """
         return self.__block
+
+    @property
+    def utc_stamp(self):
+        return self.__utc_stamp
+
+    @property
+    def checksum(self):
+        """The checksum of the payload data (``compute_checksum``).
+        """
+        return self.__checksum
     
     @property
     def identifier(self):
@@ -247,15 +257,21 @@ def read_definite_length_block(raw_recv, block_id=None,
     
     data = b''
     if block_length:
-        bytes_remaining = int(block_length)
+        data = bytearray(int(block_length))
         if not receive_chunk:
-            receive_chunk = bytes_remaining
-        
-        while bytes_remaining > 0:
-            reach = min(bytes_remaining, receive_chunk)
-            received_data = raw_recv(reach)
-            bytes_remaining -= len(received_data)
-            data += received_data
+            receive_chunk = len(data)
+        # fill the (preallocated) data in place, chunk by chunk:
+        with memoryview(data) as view:
+            received = 0
+            while received < len(data):
+                reach = min(len(data) - received, receive_chunk)
+                received_data = raw_recv(reach)
+                if not received_data:
+                    raise UnexpectedResponseFormatError(
+                        "Binary block ended after {0} of {1} bytes.".format(
+                            received, len(data)))
+                view[received:received+len(received_data)] = received_data
+                received += len(received_data)
     
     if receive_termination:
         # clear trailing term chars
@@ -265,3 +281,322 @@ def read_definite_length_block(raw_recv, block_id=None,
     
     return DefiniteLengthBlock(block=block, block_id=block_id)
 
+
+
+#: Bytes after which a program/response data unit (and so a block) may start.
+_UNIT_SEPARATORS = b' \t,;'
+
+
+def find_definite_length_block(data, start=0, stop=None):
+    """Find the first definite length block header within a message.
+
+    A ``#`` only starts a block at the start of a data unit (the start of the
+    message, or after whitespace, ``,`` or ``;``), and when followed by a
+    non-zero digit count. Quoted strings are NOT taken into account.
+
+    :param: data
+    :type bytes or bytearray:
+
+    :returns: The index of the ``#``, or ``None`` (no header begins before
+    ``stop``). The header may be incomplete (run past the end of the data).
+    """
+    stop = len(data) if stop is None else stop
+    index = data.find(b'#', start, stop)
+    while index >= 0:
+        if (index == 0) or (data[index-1] in _UNIT_SEPARATORS):
+            if (index + 1 >= len(data)) or (49 <= data[index+1] <= 57):
+                return index  # '#' then '1'...'9' (or not yet received)
+        index = data.find(b'#', index + 1, stop)
+    return None
+
+
+#: The outcomes of ``scan_message``.
+MESSAGE_END, MESSAGE_BLOCK, MESSAGE_MORE = range(3)
+
+
+def scan_message(buffer, scan, termination):
+    """Scan a (partly received) message for its end, passing over blocks.
+
+    :param: scan
+    :type int:
+    :description: Where to resume the scan (as returned by a previous scan).
+
+    :returns: One of:
+        - ``(MESSAGE_END, index)``: the termination is at ``index``.
+        - ``(MESSAGE_BLOCK, index)``: a block header was found, and its payload
+          ends at ``index`` (possibly beyond the data received so far). Once
+          the payload is received, resume the scan at ``index``.
+        - ``(MESSAGE_MORE, index)``: more data is needed; then resume the scan
+          at ``index``.
+    """
+    while True:
+        end = buffer.find(termination, scan)
+        header = find_definite_length_block(
+            buffer, scan, len(buffer) if end < 0 else end)
+        if header is None:
+            if end >= 0:
+                return MESSAGE_END, end
+            # the termination may straddle two receives:
+            return MESSAGE_MORE, max(scan, len(buffer) - len(termination) + 1)
+        digits_end = header + 2
+        if len(buffer) >= digits_end:
+            digits_end += buffer[header+1] - 48
+        if len(buffer) < digits_end:
+            return MESSAGE_MORE, scan  # incomplete header
+        try:
+            return MESSAGE_BLOCK, digits_end + int(buffer[header+2:digits_end])
+        except ValueError:
+            scan = header + 1  # not a block after all
+
+
+class MessageReader(object):
+    """Reads whole (terminated) messages from a byte stream, in which any
+    definite length blocks are passed over verbatim.
+
+    A line reader corrupts a message which carries a binary block, because
+    the block payload may contain the termination character. Here, the
+    payload of each block is read as raw bytes (and never searched for the
+    termination), directly into the message buffer.
+
+    The stream is read with ``recv(size)``, which returns between 1 and
+    ``size`` bytes (or no bytes, at end of stream), e.g. ``socket.recv``.
+    If ``recv_into(buffer)`` is also given (e.g. ``socket.recv_into``), block
+    payloads are received in place, without any intermediate copy.
+
+    Any bytes received beyond the end of a message are kept for the next
+    (see ``pending``).
+    """
+    __recv = None
+    __recv_into = None
+    __termination = None
+    __chunk = None
+    __pending = None
+
+    #: The largest single receive of block payload (bytes).
+    BLOCK_CHUNK = 1024 * 1024
+
+    def __init__(self, recv, termination=b'\n', chunk=65536, recv_into=None):
+        if isinstance(termination, str):
+            termination = termination.encode('ascii')
+        self.__recv = recv
+        self.__recv_into = recv_into
+        self.__termination = termination
+        self.__chunk = chunk
+        self.__pending = bytearray()
+
+    def __fill(self, buffer, start, end):
+        """Receive ``buffer[start:end]`` (the buffer is at least ``end`` long).
+        """
+        with memoryview(buffer) as view:
+            while start < end:
+                if self.__recv_into is not None:
+                    count = self.__recv_into(view[start:end])
+                else:
+                    received = self.__recv(min(end - start, self.BLOCK_CHUNK))
+                    count = len(received)
+                    view[start:start+count] = received
+                if not count:
+                    raise EOFError('Stream ended within a binary block.')
+                start += count
+
+    def read(self):
+        """Read the next message.
+
+        :returns: ``(message, has_blocks)``, where ``message`` is the raw
+        message (without the termination), or ``(None, False)`` if the stream
+        ended (between messages).
+        :type (bytearray, bool):
+        :raises: EOFError, if the stream ended within a message.
+        """
+        termination = self.__termination
+        buffer = self.__pending
+        scan = 0
+        has_blocks = False
+        while True:
+            outcome, index = scan_message(buffer, scan, termination)
+            if outcome == MESSAGE_BLOCK:
+                if len(buffer) < index:
+                    received = len(buffer)
+                    buffer.extend(bytes(index - received))
+                    self.__fill(buffer, received, index)
+                scan = index
+                has_blocks = True
+                continue
+            if outcome == MESSAGE_END:
+                self.__pending = buffer[index+len(termination):]
+                del buffer[index:]
+                return buffer, has_blocks
+            scan = index
+            received = self.__recv(self.__chunk)
+            if not received:
+                self.__pending = bytearray()
+                if buffer:
+                    raise EOFError('Stream ended within a message.')
+                return None, False
+            buffer += received
+
+    @property
+    def pending(self):
+        """The bytes received beyond the end of the last message.
+        """
+        return bytes(self.__pending)
+
+    @pending.setter
+    def pending(self, value):
+        self.__pending = bytearray(value)
+
+
+class DriverMessageReader(MessageReader):
+    """A ``MessageReader`` over the raw receive of a (textual) Lantz driver.
+
+    The bytes received beyond the end of a message are kept in the receive
+    buffer of the driver (``_received``), NOT in the reader: so the driver's
+    own ``recv`` sees them, and the reader sees what ``recv`` left behind.
+
+    .. seealso: driver_message_reader
+    """
+    __driver = None
+    __encoding = None
+
+    def __init__(self, driver):
+        sock = getattr(driver, 'socket', None)
+        super().__init__(driver.raw_recv,
+                         termination=driver.RECV_TERMINATION,
+                         chunk=getattr(driver, 'RECV_CHUNK', 1) or 1,
+                         recv_into=getattr(sock, 'recv_into', None))
+        self.__driver = driver
+        self.__encoding = getattr(driver, 'ENCODING', 'ascii') or 'ascii'
+
+    def read(self):
+        driver = self.__driver
+        # (surrogateescape: the bytes may be binary, and must round trip)
+        received = getattr(driver, '_received', '')
+        if received:
+            self.pending = received.encode(self.__encoding, 'surrogateescape')
+        try:
+            return super().read()
+        finally:
+            pending = self.pending
+            self.pending = b''
+            driver._received = str(pending, self.__encoding, 'surrogateescape')
+
+
+def driver_message_reader(driver):
+    """The ``MessageReader`` over the raw receive of a (textual) Lantz driver.
+
+    There is one reader per driver. For a socket driver, block payloads are
+    received in place (``recv_into``).
+
+    :type DriverMessageReader:
+    """
+    reader = getattr(driver, '_message_reader', None)
+    if reader is None:
+        reader = driver._message_reader = DriverMessageReader(driver)
+    return reader
+
+
+def split_response_units(message):
+    """Split a response message into its (``;`` separated) response units.
+
+    A unit which is a definite length block is given as its payload; the
+    payload is NOT searched for ``;``. Quoted strings are NOT taken into
+    account.
+
+    :param: message
+    :type bytes or bytearray:
+    :description: A whole response message (e.g. from ``MessageReader``).
+
+    :returns: ``(is_block, data)`` per unit, where ``data`` is a memoryview
+    of the message (no copy is made).
+    :type list:
+    """
+    view = memoryview(message)
+    units = []
+    position = 0
+    while position <= len(message):
+        if (message[position:position+1] == b'#' and
+                position + 1 < len(message) and
+                49 <= message[position+1] <= 57):  # '#' then '1'...'9'
+            digits_end = position + 2 + message[position+1] - 48
+            try:
+                start, end = digits_end, digits_end + int(message[position+2:digits_end])
+            except ValueError:
+                raise UnexpectedResponseFormatError(
+                    'Invalid block header at {0}.'.format(position))
+            if end > len(message):
+                raise UnexpectedResponseFormatError(
+                    'Block at {0} runs past the end of the message.'.format(position))
+            units.append((True, view[start:end]))
+            position = end + 1  # (the ``;``)
+        else:
+            end = message.find(b';', position)
+            if end < 0:
+                end = len(message)
+            units.append((False, view[position:end]))
+            position = end + 1
+    return units
+
+
+def _recv_exactly(raw_recv, size):
+    data = b''
+    while len(data) < size:
+        received = raw_recv(size - len(data))
+        if not received:
+            raise UnexpectedResponseFormatError(
+                'Stream ended after {0} of {1} bytes.'.format(len(data), size))
+        data += received
+    return data
+
+
+def read_definite_length_block_into(raw_recv, buffer, recv_into=None,
+                                    recv_chunk=None):
+    """Read an IEEE 488.2 definite length block, straight into a buffer.
+
+    Only the block is read (not any following separator or termination).
+    The payload is streamed, chunk by chunk, into the given buffer (e.g. a
+    NumPy array, or a ``numpy.memmap``), so no copy of it is ever held.
+
+    :param: buffer
+    :type writable buffer:
+    :description: Where to put the payload (it must be at least as long).
+
+    :param: recv_into
+    :type function:
+    :description: ``nbytes = recv_into(view)`` (e.g. ``socket.recv_into``), to
+    receive in place; otherwise, ``raw_recv`` is used.
+
+    :returns: The length (bytes) of the payload.
+    :raises: UnexpectedResponseFormatError, if the data is not a block, or
+    the block does not fit in the buffer (it is then read, and discarded).
+    """
+    header = _recv_exactly(raw_recv, 2)
+    if (header[0:1] != b'#') or not (49 <= header[1] <= 57):
+        raise UnexpectedResponseFormatError(
+            "Expected ``IEEE 488.2 Binary Block``! Read: ``{0}``.".format(header))
+    length = int(_recv_exactly(raw_recv, header[1] - 48))
+    recv_chunk = recv_chunk or 1024 * 1024
+    with memoryview(buffer) as view:
+        view = view.cast('B')
+        fits = length <= len(view)
+        if not fits:
+            view = memoryview(bytearray(min(length, recv_chunk)))
+        received = 0
+        while received < length:
+            start = received % len(view) if not fits else received
+            stop = min(start + (length - received), len(view), start + recv_chunk)
+            if recv_into is not None:
+                count = recv_into(view[start:stop])
+            else:
+                data = raw_recv(stop - start)
+                count = len(data)
+                view[start:start+count] = data
+            if not count:
+                raise UnexpectedResponseFormatError(
+                    "Binary block ended after {0} of {1} bytes.".format(
+                        received, length))
+            received += count
+    if not fits:
+        raise UnexpectedResponseFormatError(
+            'A block of {0} bytes does not fit in a buffer of {1} bytes.'.format(
+                length, memoryview(buffer).nbytes))
+    return length
@@ -234,6 +234,8 @@ class Verifiable(object):
     The subclass(es) of this class are responsible for storing the result of 
     ``compute_checksum`` in the ``private`` instance field: ``self.__checksum``
     """
+    __slots__ = ()  # so that subclasses may be slotted.
+
     __utc_stamp = None
     __checksum = None
     
@@ -0,0 +1,616 @@
+# -*- coding: utf-8 -*-
+"""sindri.recorders
+
+    Fixed-size sample storage and background samplers for long-running
+    instrument monitoring.
+
+    A recorder samples an instrument on its own thread, at a target rate, and
+    stores each sample in a ``RingBuffer``. Consumers (dashboards, loggers,
+    etc.) read a snapshot of the buffer from memory, and never have to wait
+    on the (possibly very slow) instrument link.
+
+    :dependencies:
+        - ``NumPy``
+    :copyright: 2013 by Sindri Authors, see AUTHORS for more details.
+    :license: LGPL, see LICENSE for more details.
+"""
+import logging
+import threading
+from time import monotonic
+
+import numpy as np
+
+
+class RingBuffer(object):
+    """A fixed-size, columnar, timestamped ring buffer of samples.
+
+    Each sample is a monotonic timestamp plus one value per column. Storage
+    is allocated once, at construction, so memory use does not grow with the
+    number of samples written.
+
+    The buffer is written by a single writer, and may be read by any number
+    of readers. Readers NEVER block the writer: a snapshot is copied out, and
+    copied again if the writer touched the buffer in the meantime.
+
+    Example:
+        >>> buf = RingBuffer(4, ['P6V_voltage', 'P6V_current'])
+        >>> buf.append(monotonic(), (3.31, 0.12))
+        >>> buf.snapshot()['P6V_voltage']
+        array([ 3.31])
+    """
+    #: The name of the column which holds the sample timestamps.
+    TIMESTAMP = 'timestamp'
+
+    __capacity = None
+    __names = None
+    __timestamps = None
+    __columns = None
+    __written = 0  # total number of samples written, ever.
+    __sequence = 0  # odd while a write is in progress.
+
+    def __init__(self, capacity, columns, dtype='f8'):
+        """Initialize the ring buffer.
+
+        :param: capacity
+        :type int:
+        :description: The maximum number of samples held by the buffer.
+
+        :param: columns
+        :type list or dict:
+        :description: The column names, or a mapping of column name to dtype.
+
+        :param: dtype
+        :description: The dtype for columns given without one.
+        """
+        capacity = int(capacity)
+        if capacity < 1:
+            raise ValueError('Ring buffer capacity must be at least 1.')
+        if not isinstance(columns, dict):
+            columns = {name: dtype for name in columns}
+        if self.TIMESTAMP in columns:
+            raise ValueError(
+                "'{0}' is a reserved column name.".format(self.TIMESTAMP))
+
+        self.__capacity = capacity
+        self.__names = tuple(columns.keys())
+        self.__timestamps = np.zeros(capacity, dtype='f8')
+        self.__columns = tuple(np.zeros(capacity, dtype=columns[name])
+                               for name in self.__names)
+
+    def __len__(self):
+        return min(self.__written, self.__capacity)
+
+    @property
+    def capacity(self):
+        """The maximum number of samples held by the buffer.
+        """
+        return self.__capacity
+
+    @property
+    def columns(self):
+        """The column names, in sample order.
+        """
+        return self.__names
+
+    @property
+    def written(self):
+        """The total number of samples ever written to the buffer.
+        """
+        return self.__written
+
+    def append(self, timestamp, values):
+        """Write one sample into the buffer, overwriting the oldest if full.
+
+        :param: timestamp
+        :type float:
+        :description: A monotonic timestamp (seconds), see ``time.monotonic``.
+
+        :param: values
+        :type sequence:
+        :description: One value per column, in ``columns`` order.
+        """
+        index = self.__written % self.__capacity
+        self.__sequence += 1  # odd: write in progress
+        self.__timestamps[index] = timestamp
+        for column, value in zip(self.__columns, values):
+            column[index] = value
+        self.__written += 1
+        self.__sequence += 1  # even: write complete
+
+    def clear(self):
+        """Forget all of the samples held by the buffer.
+        """
+        self.__sequence += 1
+        self.__written = 0
+        self.__sequence += 1
+
+    def __copy_out(self, count, decimation):
+        """Copy the latest ``count`` samples, oldest first (not thread safe).
+        """
+        written = self.__written
+        held = min(written, self.__capacity)
+        count = held if count is None else min(int(count), held)
+        # chronological indices of the requested samples:
+        first = written - count
+        order = np.arange(first, written)[::-1][::decimation][::-1]
+        order %= self.__capacity
+        snapshot = {self.TIMESTAMP: self.__timestamps.take(order)}
+        for name, column in zip(self.__names, self.__columns):
+            snapshot[name] = column.take(order)
+        return snapshot
+
+    def snapshot(self, count=None, decimation=1):
+        """Copy the buffered samples out of the buffer, oldest first.
+
+        This never blocks the writer. If a write occurs during the copy, the
+        copy is simply repeated.
+
+        :param: count
+        :type int:
+        :description: Only the latest ``count`` samples (default: all).
+
+        :param: decimation
+        :type int:
+        :description: Keep every ``decimation``-th sample, counted back from
+        the latest sample (which is always kept).
+
+        :returns: The timestamps (key ``timestamp``), and one array per column.
+        :type dict:
+        """
+        decimation = int(decimation)
+        if decimation < 1:
+            raise ValueError('Decimation must be at least 1.')
+        while True:
+            sequence = self.__sequence
+            if sequence % 2:
+                continue  # writer is mid-sample
+            snapshot = self.__copy_out(count, decimation)
+            if sequence == self.__sequence:
+                return snapshot
+
+    def latest(self):
+        """The latest sample, as a dict (or ``None`` if the buffer is empty).
+        """
+        snapshot = self.snapshot(count=1)
+        if not len(snapshot[self.TIMESTAMP]):
+            return None
+        return {name: values[0] for (name, values) in snapshot.items()}
+
+
+class BinnedRingBuffer(object):
+    """A downsampled view of a stream of samples: fixed-width time bins,
+    held in a ``RingBuffer``.
+
+    Each bin is stamped with its start time, and holds the number of samples
+    (column ``count``) and, per sample column, the ``mean``, ``min``,
+    ``max`` and ``last`` value (columns ``<column>_<aggregate>``).
+
+    A bin is written to the ring buffer once a sample of a later bin is
+    added (or on ``flush``), so readers only ever see complete bins, and
+    (as for ``RingBuffer``) never block the writer.
+
+    Example:
+        >>> minutes = BinnedRingBuffer(60.0, 10080, ['voltage'])
+        >>> minutes.add(monotonic(), (3.31,))
+        >>> minutes.snapshot()['voltage_mean']
+    """
+    #: The aggregates of each column, per bin.
+    AGGREGATES = ('mean', 'min', 'max', 'last')
+
+    __bin_width = None
+    __names = None
+    __buffer = None
+    __bin = None  # index of the open bin
+    __count = 0  # samples in the open bin
+    __sum = None
+    __min = None
+    __max = None
+    __last = None
+
+    def __init__(self, bin_width, capacity, columns):
+        """Initialize the (empty) binned buffer.
+
+        :param: bin_width
+        :type float:
+        :description: The width of the bins (seconds, in timestamp units).
+
+        :param: capacity
+        :type int:
+        :description: The number of (complete) bins held.
+
+        :param: columns
+        :type list:
+        :description: The names of the sample columns.
+        """
+        bin_width = float(bin_width)
+        if not bin_width > 0:
+            raise ValueError('The bin width must be greater than zero.')
+        self.__bin_width = bin_width
+        self.__names = tuple(columns)
+        self.__buffer = RingBuffer(capacity, ['{0}_{1}'.format(name, aggregate)
+                                              for name in self.__names
+                                              for aggregate in self.AGGREGATES]
+                                             + ['count'])
+        size = len(self.__names)
+        self.__sum = np.zeros(size)
+        self.__min = np.zeros(size)
+        self.__max = np.zeros(size)
+        self.__last = np.zeros(size)
+
+    def __len__(self):
+        return len(self.__buffer)
+
+    @property
+    def bin_width(self):
+        return self.__bin_width
+
+    @property
+    def columns(self):
+        """The names of the sample columns.
+        """
+        return self.__names
+
+    @property
+    def buffer(self):
+        """The ring buffer of the complete bins.
+        """
+        return self.__buffer
+
+    def add(self, timestamp, values):
+        """Add one sample (one value per column) to its bin.
+        """
+        index = int(timestamp // self.__bin_width)
+        if index != self.__bin:
+            self.flush()
+            self.__bin = index
+        values = np.asarray(values, dtype='f8')
+        if self.__count:
+            self.__sum += values
+            np.minimum(self.__min, values, out=self.__min)
+            np.maximum(self.__max, values, out=self.__max)
+        else:
+            self.__sum[:] = values
+            self.__min[:] = values
+            self.__max[:] = values
+        self.__last[:] = values
+        self.__count += 1
+
+    def flush(self):
+        """Write the open bin (if any samples) to the ring buffer.
+        """
+        if self.__count:
+            row = np.column_stack((self.__sum / self.__count, self.__min,
+                                   self.__max, self.__last))
+            self.__buffer.append(self.__bin * self.__bin_width,
+                                 row.ravel().tolist() + [self.__count])
+            self.__count = 0
+
+    def clear(self):
+        self.__count = 0
+        self.__bin = None
+        self.__buffer.clear()
+
+    def snapshot(self, count=None, decimation=1):
+        """Non-blocking copy of the complete bins, oldest first.
+
+        .. seealso: RingBuffer.snapshot
+        """
+        return self.__buffer.snapshot(count=count, decimation=decimation)
+
+
+class PeriodicRecorder(threading.Thread):
+    """Base class for background samplers which fill a ``RingBuffer``.
+
+    A subclass MUST implement ``_sample``, which takes one sample from the
+    instrument and returns it as one value per buffer column. The recorder
+    calls it at a target rate, on a daemon thread, and timestamps each
+    sample with ``time.monotonic``.
+
+    Sampling is scheduled against absolute deadlines, so the rate does not
+    drift with the sampling time. If a sample takes longer than the period,
+    the schedule is reset rather than ``catching up`` with a burst.
+
+    Example:
+        >>> recorder.start()
+        >>> recorder.buffer.snapshot()
+        >>> recorder.stop()
+    """
+    __buffer = None
+    __period = None
+    __stop_requested = None
+    __error_count = 0
+
+    def __init__(self, buffer, rate, name=None):
+        """Initialize the recorder (it must then be started with ``start``).
+
+        :param: buffer
+        :type RingBuffer:
+
+        :param: rate
+        :type float:
+        :description: The target sampling rate (Hz).
+        """
+        super().__init__(name=name, daemon=True)
+        if not rate > 0:
+            raise ValueError('Sampling rate must be greater than zero.')
+        self.__buffer = buffer
+        self.__period = 1.0 / float(rate)
+        self.__stop_requested = threading.Event()
+
+    @property
+    def buffer(self):
+        """The ring buffer into which the samples are recorded.
+        """
+        return self.__buffer
+
+    @property
+    def period(self):
+        """The target sampling period (seconds).
+        """
+        return self.__period
+
+    @property
+    def error_count(self):
+        """The number of samples which have failed (and were not recorded).
+        """
+        return self.__error_count
+
+    def snapshot(self, count=None, decimation=1):
+        """Non-blocking snapshot of the recorded samples.
+
+        .. seealso: RingBuffer.snapshot
+        """
+        return self.__buffer.snapshot(count=count, decimation=decimation)
+
+    def _sample(self):
+        """Take a single sample from the instrument.
+
+        **Abstract**
+
+        :returns: One value per buffer column, in column order.
+        :type sequence:
+        """
+        raise NotImplementedError("``_sample`` has not been implemented!")
+
+    def _record(self, timestamp, values):
+        """Store a sample (subclasses may override to aggregate, etc.).
+        """
+        self.__buffer.append(timestamp, values)
+
+    def run(self):
+        deadline = monotonic()
+        while not self.__stop_requested.is_set():
+            started = monotonic()
+            try:
+                values = self._sample()
+            except Exception as e:
+                self.__error_count += 1
+                logging.warning('%s: sample failed: %s', self.name, e)
+            else:
+                # stamp the sample at the middle of the acquisition:
+                self._record((started + monotonic()) / 2.0, values)
+            deadline += self.__period
+            remaining = deadline - monotonic()
+            if remaining < 0:
+                deadline = monotonic()  # overrun, don't burst to catch up.
+                remaining = 0
+            self.__stop_requested.wait(remaining)
+
+    def stop(self, timeout=None):
+        """Stop sampling, and wait for the current sample to complete.
+        """
+        self.__stop_requested.set()
+        if self.is_alive() and (threading.current_thread() is not self):
+            self.join(timeout)
+
+
+class RecorderHostMixin(object):
+    """Give a driver background recorders (``PeriodicRecorder``), by name.
+
+    A driver runs at most one recorder per name; starting one stops any
+    running recorder of the same name, and ``finalize`` stops them all.
+    Drivers expose these through their own ``start_x``/``stop_x`` methods
+    and ``x`` property (e.g. ``E3631A.start_measurement_logger``).
+
+    **NOTE:**
+    Neither ``_start_recorder``/``_stop_recorder``, nor the driver methods
+    built on them, should be an ``Action``; an ``Action`` holds the driver
+    lock, which the recorder thread needs in order to stop.
+    """
+    __recorders = None  # name -> running recorder
+
+    def _recorder(self, name):
+        """The running recorder of a name (or ``None``).
+        """
+        return (self.__recorders or {}).get(name)
+
+    def _start_recorder(self, name, recorder):
+        """Start a recorder under a name, stopping the one it replaces first.
+
+        :returns: The started recorder.
+        """
+        self._stop_recorder(name)
+        if self.__recorders is None:
+            self.__recorders = {}
+        self.__recorders[name] = recorder
+        recorder.start()
+        return recorder
+
+    def _stop_recorder(self, name, timeout=None):
+        """Stop the recorder of a name, if running.
+
+        :returns: The stopped recorder (and its samples), or ``None``.
+        """
+        recorder = (self.__recorders or {}).pop(name, None)
+        if recorder is not None:
+            recorder.stop(timeout)
+        return recorder
+
+    def stop_recorders(self, timeout=None):
+        """Stop all of the running recorders.
+        """
+        for name in list(self.__recorders or ()):
+            self._stop_recorder(name, timeout)
+
+    def finalize(self, *args, **kwargs):
+        try:
+            self.stop_recorders()
+        finally:
+            super().finalize(*args, **kwargs)
+
+
+class RunningStatistics(object):
+    """Running statistics of a stream of values, in constant memory.
+
+    Since the last ``reset``: the count, mean and variance (Welford's
+    algorithm, numerically stable), minimum and maximum, and optionally a
+    histogram over fixed bins. Optionally also the same statistics over a
+    window of the latest values, which are kept in a fixed-size array.
+
+    Not thread safe; the owner serializes ``add`` and the reads.
+
+    Example:
+        >>> stats = RunningStatistics(window=100, bins=50, range=(0.0, 1.0))
+        >>> for value in values: stats.add(value)
+        >>> stats.mean, stats.standard_deviation, stats.window_summary()
+    """
+    __count = 0
+    __mean = 0.0
+    __m2 = 0.0  # sum of squared differences from the mean
+    __min = None
+    __max = None
+    __edges = None
+    __histogram = None  # counts: underflow, bins..., overflow
+    __window = None
+    __window_written = 0
+
+    def __init__(self, window=None, bins=None, range=None):
+        """Initialize the (empty) statistics.
+
+        :param: window
+        :type int:
+        :description: The number of latest values to keep, for the windowed
+        statistics (default: no window).
+
+        :param: bins
+        :type int:
+        :description: The number of histogram bins (default: no histogram).
+
+        :param: range
+        :type tuple:
+        :description: The ``(low, high)`` span of the histogram bins; values
+        outside of it are counted as under/overflow.
+        """
+        if window is not None:
+            window = int(window)
+            if window < 1:
+                raise ValueError('The window must hold at least 1 value.')
+            self.__window = np.empty(window, dtype='f8')
+        if bins is not None:
+            if range is None:
+                raise ValueError('A histogram needs a range.')
+            self.__edges = np.linspace(range[0], range[1], int(bins) + 1)
+            self.__histogram = np.zeros(int(bins) + 2, dtype='i8')
+
+    def add(self, value):
+        """Add one value (O(1)).
+        """
+        value = float(value)
+        self.__count += 1
+        delta = value - self.__mean
+        self.__mean += delta / self.__count
+        self.__m2 += delta * (value - self.__mean)
+        if (self.__min is None) or (value < self.__min):
+            self.__min = value
+        if (self.__max is None) or (value > self.__max):
+            self.__max = value
+        if self.__histogram is not None:
+            self.__histogram[np.searchsorted(self.__edges, value, 'right')] += 1
+        if self.__window is not None:
+            self.__window[self.__window_written % len(self.__window)] = value
+            self.__window_written += 1
+
+    def reset(self):
+        """Forget all of the values.
+        """
+        self.__count = 0
+        self.__mean = self.__m2 = 0.0
+        self.__min = self.__max = None
+        if self.__histogram is not None:
+            self.__histogram[:] = 0
+        self.__window_written = 0
+
+    @property
+    def count(self):
+        return self.__count
+
+    @property
+    def mean(self):
+        return self.__mean if self.__count else None
+
+    @property
+    def variance(self):
+        """The (sample) variance, or None for less than two values.
+        """
+        return self.__m2 / (self.__count - 1) if self.__count > 1 else None
+
+    @property
+    def standard_deviation(self):
+        variance = self.variance
+        return None if variance is None else variance ** 0.5
+
+    @property
+    def min(self):
+        return self.__min
+
+    @property
+    def max(self):
+        return self.__max
+
+    @property
+    def histogram(self):
+        """The histogram counts and bin edges, or None.
+
+        :returns: ``(counts, edges, underflow, overflow)``
+        """
+        if self.__histogram is None:
+            return None
+        counts = self.__histogram.copy()
+        return counts[1:-1], self.__edges, int(counts[0]), int(counts[-1])
+
+    def window_values(self):
+        """The latest values (a copy, oldest first), or None (no window).
+        """
+        if self.__window is None:
+            return None
+        size = len(self.__window)
+        written = self.__window_written
+        if written <= size:
+            return self.__window[:written].copy()
+        split = written % size
+        return np.concatenate((self.__window[split:], self.__window[:split]))
+
+    def summary(self):
+        """The statistics since the last reset.
+
+        :type dict:
+        """
+        return {'count': self.count, 'mean': self.mean,
+                'standard_deviation': self.standard_deviation,
+                'min': self.min, 'max': self.max}
+
+    def window_summary(self):
+        """The statistics over the window of the latest values (or None).
+
+        :type dict:
+        """
+        values = self.window_values()
+        if values is None:
+            return None
+        if not len(values):
+            return {'count': 0, 'mean': None, 'standard_deviation': None,
+                    'min': None, 'max': None}
+        return {'count': len(values), 'mean': float(values.mean()),
+                'standard_deviation': (float(values.std(ddof=1))
+                                       if len(values) > 1 else None),
+                'min': float(values.min()), 'max': float(values.max())}
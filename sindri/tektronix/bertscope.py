@@ -30,13 +30,21 @@
     
 """
 
+import math
+from collections import namedtuple, OrderedDict
+from time import time, sleep
+
+import numpy as np
 from lantz import Feat, DictFeat, Q_, Action
 from sindri.mixins import IORateLimiterMixin, ErrorQueueInstrument
+from sindri.recorders import (RingBuffer, BinnedRingBuffer, PeriodicRecorder,
+                              RecorderHostMixin)
 from lantz.network import TCPDriver
 from lantz.serial import SerialDriver
 from lantz.visa import SerialVisaDriver
 from lantz.visa import GPIBVisaDriver
 from lantz.errors import InstrumentError
+from sindri.errors import UnexpectedResponseFormatError
 from .common import ErrorQueueImplementation
 
 
@@ -312,9 +320,121 @@ class Mainframe(object):
         return int(self.query("DELAY:GENR?"))
 
 
-class Detector(object):
+#: The detector results, read at once (see ``Detector.detector_snapshot``).
+#: Counts are in bits, times in seconds; ``timestamp`` is the host (epoch)
+#: time of the query.
+DetectorSnapshot = namedtuple('DetectorSnapshot', ('timestamp', 'bit_count',
+    'error_count', 'bit_error_rate', 'elapsed_time', 'resyncs',
+    'error_free_bits', 'error_free_time'))
+
+
+class DetectorRecorder(PeriodicRecorder):
+    """Background BER strip-chart recorder for the BERTScope error detector.
+
+    Takes a ``detector_snapshot`` every sampling interval (by default, the
+    detector update interval), into a fixed-size ``RingBuffer`` with one
+    column per ``DetectorSnapshot`` field (plain floats). A snapshot with the
+    same elapsed time as the previous one (no new results) is not recorded.
+
+    Each sample is also added to downsampled views (``BinnedRingBuffer``),
+    by default of 1 s, 1 min and 1 h bins; all of them have a fixed size, so
+    memory use does not grow over a long soak run. Readers of the buffers
+    never block the recorder.
+
+    .. seealso: Detector.start_detector_recorder
+    """
+    #: The default downsampled views, as ``(bin width (s), bins)``: an hour
+    #: of seconds, a week of minutes, and a year of hours.
+    RESOLUTIONS = ((1.0, 3600), (60.0, 10080), (3600.0, 8760))
+
+    #: The recorded columns.
+    COLUMNS = DetectorSnapshot._fields[1:]
+
+    __driver = None
+    __views = None  # bin width -> BinnedRingBuffer
+    __last_elapsed_time = None
+
+    def __init__(self, driver, interval, capacity=86400, resolutions=RESOLUTIONS):
+        """Initialize the recorder (it must then be started with ``start``).
+
+        :param: interval
+        :type float:
+        :description: The sampling interval (seconds).
+
+        :param: capacity
+        :type int:
+        :description: The number of snapshots held in the ring buffer.
+
+        :param: resolutions
+        :type list:
+        :description: The downsampled views, as ``(bin width (s), bins)``.
+        """
+        super().__init__(RingBuffer(capacity, self.COLUMNS), 1.0 / float(interval),
+                         name='{0}.detector_recorder'.format(driver.name))
+        self.__driver = driver
+        self.__views = OrderedDict(
+            (float(width), BinnedRingBuffer(width, bins, self.COLUMNS))
+            for (width, bins) in resolutions)
+
+    def _sample(self):
+        return self.__driver.detector_snapshot()
+
+    def _record(self, timestamp, snapshot):
+        if snapshot.elapsed_time == self.__last_elapsed_time:
+            return  # the detector has not updated its results.
+        self.__last_elapsed_time = snapshot.elapsed_time
+        values = snapshot[1:]
+        super()._record(timestamp, values)
+        for view in self.__views.values():
+            view.add(timestamp, values)
+
+    @property
+    def resolutions(self):
+        """The bin widths (seconds) of the downsampled views.
+        """
+        return list(self.__views.keys())
+
+    def view(self, resolution=None, count=None, decimation=1):
+        """Non-blocking snapshot of the snapshots, or of a downsampled view.
+
+        :param: resolution
+        :type float:
+        :description: The bin width (seconds) of the view (default: the
+        snapshots themselves).
+
+        .. seealso: RingBuffer.snapshot, BinnedRingBuffer
+        """
+        if resolution is None:
+            return self.snapshot(count=count, decimation=decimation)
+        return self.__views[float(resolution)].snapshot(count=count,
+                                                        decimation=decimation)
+
+    def stop(self, timeout=None):
+        """Stop recording; the open bins of the views are then written.
+        """
+        super().stop(timeout)
+        if not self.is_alive():
+            for view in self.__views.values():
+                view.flush()
+
+
+class Detector(RecorderHostMixin):
     """Tektronix BERTScope Detector Level Features
+
+    The detector results may be recorded in the background (a BER strip
+    chart), with downsampled views for long runs:
+    ::
+        ...
+        >>>recorder = inst.start_detector_recorder()  # every update interval
+        >>>recorder.view(60)['bit_error_rate_max']  # worst BER per minute
+        >>>inst.stop_detector_recorder()
     """
+    # the queries of ``detector_snapshot``, in ``DetectorSnapshot`` order
+    # (each rooted, ``;:``, so it is not taken relative to ``DET:``):
+    __SNAPSHOT_QUERY = ';:'.join(('DET:BITS?', 'DET:ERR?', 'DET:BER?',
+                                 'DET:ETIM?', 'DET:RESY?', 'DET:EFB?',
+                                 'DET:EFT?'))
+
     @Feat(units='picoseconds')
     def detector_data_delay(self):
         """The data delay for the error detector.
@@ -388,6 +508,33 @@ class Detector(object):
         """Retrieve the latest error free time.
         """
         return Q_(float(self.query("DET:EFT?")), 'seconds')
+
+    @Action()
+    def detector_snapshot(self):
+        """All the detector results, from ONE query (so they are consistent).
+
+        The values are plain numbers (no ``Q_``): counts in bits, and times in
+        seconds.
+
+        :returns: The detector results.
+        :type DetectorSnapshot:
+
+        .. seealso: get_detector_bit_count, get_detector_error_count, etc.
+        """
+        started = time()
+        response = self.query(self.__SNAPSHOT_QUERY)
+        timestamp = (started + time()) / 2.0
+        values = response.split(';')
+        if len(values) != 7:
+            raise UnexpectedResponseFormatError(
+                "Expected 7 detector results! Read: ``{0}``.".format(response))
+        try:
+            bits, errors, ber, elapsed, resyncs, ef_bits, ef_time = map(float, values)
+        except ValueError:
+            raise UnexpectedResponseFormatError(
+                "Expected numeric detector results! Read: ``{0}``.".format(response))
+        return DetectorSnapshot(timestamp, bits, errors, ber, elapsed,
+                                int(resyncs), ef_bits, ef_time)
     
     __BER_DISPLAY_MODES = {'accumulation': 'TACC',
                            'interval': 'INT'}
@@ -424,6 +571,309 @@ class Detector(object):
     def detector_update_interval(self, value):
         self.send("DET:RUIN {0}".format(value))
 
+    @property
+    def detector_recorder(self):
+        """The running background detector recorder (or ``None``).
+
+        .. seealso: start_detector_recorder
+        """
+        return self._recorder('detector_recorder')
+
+    def start_detector_recorder(self, interval=None, capacity=86400,
+                                resolutions=DetectorRecorder.RESOLUTIONS):
+        """Start recording detector snapshots in the background.
+
+        Any running recorder is stopped first.
+
+        :param: interval
+        :type float:
+        :description: The sampling interval (seconds); by default the
+        ``detector_update_interval``.
+
+        :returns: The started recorder.
+        :type DetectorRecorder:
+
+        .. seealso: DetectorRecorder, RecorderHostMixin
+        """
+        if interval is None:
+            interval = float(self.detector_update_interval.magnitude)
+        recorder = DetectorRecorder(self, interval, capacity=capacity,
+                                    resolutions=resolutions)
+        return self._start_recorder('detector_recorder', recorder)
+
+    def stop_detector_recorder(self, timeout=None):
+        """Stop the background detector recorder, if running.
+
+        The stopped recorder (and its buffers) is returned, or ``None``.
+        """
+        return self._stop_recorder('detector_recorder', timeout)
+
+
+#: The result of a BER sweep (see ``AdaptiveBERSweep``): one array per
+#: field, one value per measured point, sorted by ``position``. ``crossings``
+#: holds the positions where the BER crosses the target.
+BERSweepResult = namedtuple('BERSweepResult', ('position', 'bits', 'errors',
+    'ber', 'ber_lower', 'ber_upper', 'dwell_time', 'settled', 'crossings'))
+
+
+class AdaptiveBERSweep(object):
+    """An adaptive-dwell BER bathtub (and contour) sweep engine.
+
+    At each point, the detector results are reset, then polled until the BER
+    is known well enough with respect to a ``target_ber``, at a given
+    ``confidence`` level (Poisson statistics):
+
+        - below the target, once the upper confidence bound is; with zero
+          errors, after ``N = -ln(1 - confidence) / target_ber`` bits,
+        - above the target, once the lower confidence bound is,
+        - or once ``max_errors`` errors are counted (the BER is then known to
+          about ``1/sqrt(max_errors)``), or after ``max_dwell`` seconds (the
+          point is then NOT ``settled``).
+
+    A bathtub is measured on a coarse grid, then refined by bisection only
+    where the BER crosses the target, down to a given resolution:
+    ::
+        ...
+        >>>sweep = AdaptiveBERSweep(inst, target_ber=1e-12, confidence=0.95)
+        >>>result = sweep.bathtub(-50, 50, step=10, resolution=0.5)  # ps
+        >>>result.crossings  # the eye opening, at 1e-12
+        array([-31.25,  29.5 ])
+
+    The swept position is the ``detector_data_delay`` (picoseconds), unless
+    another setter is given. A contour is a bathtub per decision threshold,
+    set with a given setter (the threshold is not a driver feature here).
+    """
+    __driver = None
+    __target_ber = None
+    __confidence = None
+    __max_errors = None
+    __max_dwell = None
+    __poll_interval = None
+    __settle_time = None
+    __limits = None  # errors -> (lower, upper) Poisson limits on the mean
+    __z = None  # the standard normal quantile of the confidence level
+
+    #: Above this many errors, the Poisson limits are approximated
+    #: (Wilson-Hilferty), rather than solved for.
+    EXACT_LIMIT_ERRORS = 100
+
+    def __init__(self, driver, target_ber=1e-12, confidence=0.95,
+                 max_errors=100, max_dwell=60.0, poll_interval=None,
+                 settle_time=0.0):
+        """Initialize the sweep engine.
+
+        :param: driver
+        :type Detector:
+
+        :param: target_ber
+        :type float:
+        :description: The BER threshold (e.g. of the bathtub crossings).
+
+        :param: confidence
+        :type float:
+        :description: The confidence level of the BER comparisons (0 to 1).
+
+        :param: max_errors
+        :type int:
+        :description: Stop dwelling at a point after this many errors.
+
+        :param: max_dwell
+        :type float:
+        :description: The maximum dwell time at a point (seconds).
+
+        :param: poll_interval
+        :type float:
+        :description: The interval (seconds) between detector polls; by
+        default the ``detector_update_interval``.
+
+        :param: settle_time
+        :type float:
+        :description: A wait (seconds) after setting a position, before the
+        results are reset.
+        """
+        if not 0 < confidence < 1:
+            raise ValueError('The confidence level must be between 0 and 1.')
+        if not target_ber > 0:
+            raise ValueError('The target BER must be greater than zero.')
+        self.__driver = driver
+        self.__target_ber = float(target_ber)
+        self.__confidence = float(confidence)
+        self.__max_errors = int(max_errors)
+        self.__max_dwell = float(max_dwell)
+        if poll_interval is None:
+            poll_interval = float(driver.detector_update_interval.magnitude)
+        self.__poll_interval = float(poll_interval)
+        self.__settle_time = float(settle_time)
+        self.__limits = {}
+        low, high = 0.0, 40.0
+        for _ in range(100):
+            middle = (low + high) / 2.0
+            if 0.5 * math.erfc(middle / math.sqrt(2.0)) > 1.0 - confidence:
+                low = middle
+            else:
+                high = middle
+        self.__z = (low + high) / 2.0
+
+    @property
+    def target_ber(self):
+        return self.__target_ber
+
+    @property
+    def confidence(self):
+        return self.__confidence
+
+    def required_bits(self, ber=None):
+        """The number of error free bits which show, at the confidence level,
+        that the BER is below ``ber`` (default: the target BER).
+        """
+        return -math.log(1.0 - self.__confidence) / (ber or self.__target_ber)
+
+    @staticmethod
+    def __poisson_cdf(errors, mean):
+        if mean <= 0:
+            return 1.0
+        return math.fsum(math.exp(k * math.log(mean) - mean - math.lgamma(k + 1))
+                         for k in range(errors + 1))
+
+    def __poisson_limits(self, errors):
+        """The (lower, upper) confidence limits on the mean number of errors.
+        """
+        if errors > self.EXACT_LIMIT_ERRORS:
+            z = self.__z
+            lower = errors * (1.0 - 1.0 / (9.0 * errors)
+                              - z / (3.0 * math.sqrt(errors))) ** 3
+            upper = (errors + 1) * (1.0 - 1.0 / (9.0 * (errors + 1))
+                                    + z / (3.0 * math.sqrt(errors + 1))) ** 3
+            return lower, upper
+        limits = self.__limits.get(errors)
+        if limits is None:
+            alpha = 1.0 - self.__confidence
+
+            def solve(k, probability):  # mean such that P(X <= k) = probability
+                low, high = 0.0, errors + 10.0 * (errors + 1.0) ** 0.5 + 10.0
+                for _ in range(100):
+                    middle = (low + high) / 2.0
+                    if self.__poisson_cdf(k, middle) > probability:
+                        low = middle
+                    else:
+                        high = middle
+                return (low + high) / 2.0
+
+            lower = solve(errors - 1, 1.0 - alpha) if errors else 0.0
+            limits = self.__limits[errors] = (lower, solve(errors, alpha))
+        return limits
+
+    def ber_limits(self, bits, errors):
+        """The (lower, upper) confidence bounds on the BER.
+        """
+        if not bits:
+            return 0.0, 1.0
+        lower, upper = self.__poisson_limits(int(errors))
+        return lower / bits, min(upper / bits, 1.0)
+
+    def measure(self):
+        """Dwell at the current position until the BER is settled.
+
+        :returns: ``(bits, errors, ber_lower, ber_upper, dwell_time, settled)``
+        """
+        driver = self.__driver
+        target = self.__target_ber
+        driver.detector_reset_results()
+        started = time()
+        while True:
+            sleep(self.__poll_interval)
+            snapshot = driver.detector_snapshot()
+            bits, errors = snapshot.bit_count, snapshot.error_count
+            lower, upper = self.ber_limits(bits, errors)
+            dwell_time = time() - started
+            settled = ((upper < target) or (lower > target)
+                       or (errors >= self.__max_errors))
+            if settled or (dwell_time >= self.__max_dwell):
+                return bits, errors, lower, upper, dwell_time, settled
+
+    def __set_data_delay(self, value):
+        self.__driver.detector_data_delay = value
+
+    def bathtub(self, start, stop, step, resolution=None, set_position=None):
+        """Measure a bathtub: the BER against the position (data delay).
+
+        :param: start, stop, step
+        :type float:
+        :description: The coarse grid of positions (``stop`` included).
+
+        :param: resolution
+        :type float:
+        :description: Refine the target crossings down to this spacing
+        (default: no refinement).
+
+        :param: set_position
+        :type callable:
+        :description: Sets the swept position (default: the
+        ``detector_data_delay``, in picoseconds).
+
+        :type: BERSweepResult
+        """
+        set_position = set_position or self.__set_data_delay
+        points = {}  # position -> measure()
+
+        def measure_at(position):
+            set_position(position)
+            if self.__settle_time:
+                sleep(self.__settle_time)
+            points[position] = self.measure()
+            return self.__is_above(points[position])
+
+        grid = np.arange(start, stop + step / 2.0, step).tolist()
+        above = [measure_at(position) for position in grid]
+        crossings = []
+        for index in range(len(grid) - 1):
+            if above[index] == above[index + 1]:
+                continue
+            (low, low_above), high = (grid[index], above[index]), grid[index + 1]
+            while (resolution is not None) and (high - low > resolution):
+                middle = (low + high) / 2.0
+                if measure_at(middle) == low_above:
+                    low = middle
+                else:
+                    high = middle
+            crossings.append((low + high) / 2.0)
+
+        position = np.array(sorted(points))
+        bits, errors, lower, upper, dwell_time, settled = (
+            np.array(column) for column in zip(*(points[p] for p in position)))
+        return BERSweepResult(position, bits, errors,
+                              np.where(bits > 0, errors / np.maximum(bits, 1), np.nan),
+                              lower, upper, dwell_time, settled.astype(bool),
+                              np.array(crossings))
+
+    def contour(self, thresholds, set_threshold, start, stop, step,
+                resolution=None, set_position=None):
+        """Measure a BER contour: a bathtub per decision threshold.
+
+        :param: set_threshold
+        :type callable:
+        :description: Sets the decision threshold (e.g. a ``send`` of the
+        threshold command of the instrument).
+
+        :returns: The thresholds, and the bathtub at each one.
+        :type list: of ``(threshold, BERSweepResult)``
+        """
+        contour = []
+        for threshold in thresholds:
+            set_threshold(threshold)
+            contour.append((threshold, self.bathtub(start, stop, step,
+                                                    resolution, set_position)))
+        return contour
+
+    def __is_above(self, point):
+        bits, errors, lower, upper, dwell_time, settled = point
+        if lower > self.__target_ber:
+            return True
+        if upper < self.__target_ber:
+            return False
+        # unsettled (or stopped at max_errors): the best estimate decides.
+        return bool(bits) and (errors / bits > self.__target_ber)
+
 
 class BERTScope(object):
     """Tektronix BERTScope Bit Error Rate Analyzer Core Features